@@ -0,0 +1,66 @@
+"""
+Measure the time spent in `emit` by the logging thread of a background handler, with the
+logs formatted in `emit` or by the writer thread (`defer_format`).
+
+The queue is large enough to hold every record so that `emit` never waits for the
+writer, and the batches are discarded: only the work left on the critical path of the
+application is measured.
+
+Usage: python benchmarks/bench_defer.py [--records N] [--runs N]
+"""
+
+import argparse
+import logging
+import statistics
+import time
+
+from rlh import RedisStreamLogHandler
+
+FORMATS = {
+    "fields": {},
+    "json": {"as_json": True},
+    "bin": {"as_bin": True},
+    "pkl": {"as_pkl": True},
+}
+
+
+class NullStreamLogHandler(RedisStreamLogHandler):
+    """Handler delivering the logs to its writer, but discarding the batches."""
+
+    def _send_logs(self, logs):
+        pass
+
+
+def run(options, defer_format, records):
+    """Return the mean time in microseconds of a call to `emit`."""
+    handler = NullStreamLogHandler(check_conn=False, batch_size=500, background=True,
+                                   queue_size=records + 1, defer_format=defer_format,
+                                   **options)
+    record = logging.LogRecord("bench", logging.INFO, __file__, 0,
+                               "user %s logged in from %s after %d attempts",
+                               ("alice", "10.0.0.1", 3), None)
+    start = time.perf_counter()
+    for _ in range(records):
+        handler.emit(record)
+    elapsed = time.perf_counter() - start
+    handler.close()
+    return elapsed / records * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=50000)
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'format':<10}{'eager (us)':>12}{'deferred (us)':>15}")
+    for name, options in FORMATS.items():
+        eager, deferred = (
+            statistics.median(run(options, defer_format, args.records)
+                              for _ in range(args.runs))
+            for defer_format in (False, True))
+        print(f"{name:<10}{eager:>12.2f}{deferred:>15.2f}")
+
+
+if __name__ == "__main__":
+    main()
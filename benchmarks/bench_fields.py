@@ -0,0 +1,56 @@
+"""
+Compare the per record field extraction of `_make_fields` (hasattr/getattr lookups)
+with the extractor compiled by `_compile_fields`.
+
+No Redis instance is needed.
+
+Usage: python benchmarks/bench_fields.py [--records N]
+"""
+
+import argparse
+import functools
+import logging
+import time
+
+from rlh.handlers import DEFAULT_FIELDS, _compile_fields, _make_fields
+
+FIELD_SETS = {
+    "default": DEFAULT_FIELDS,
+    "wide": ["msg", "levelname", "levelno", "created", "name", "pathname", "filename",
+             "module", "funcName", "lineno", "msecs", "relativeCreated", "thread",
+             "threadName", "process", "processName"],
+}
+
+RECORDS = {
+    "no args": logging.LogRecord("bench", logging.INFO, __file__, 0,
+                                 "benchmark log", None, None),
+    "args": logging.LogRecord("bench", logging.INFO, __file__, 0,
+                              "benchmark log %s", (42,), None),
+}
+
+
+def rate(func, record, records):
+    """Return the number of records per second processed by func."""
+    start = time.perf_counter()
+    for _ in range(records):
+        func(record)
+    return records / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=200000)
+    args = parser.parse_args()
+
+    print(f"{'fields':<10}{'record':<10}{'before':>12}{'after':>12}{'speedup':>10}")
+    for fields_name, fields in FIELD_SETS.items():
+        extract_fields = _compile_fields(fields)
+        for record_name, record in RECORDS.items():
+            before = rate(functools.partial(_make_fields, fields=fields), record, args.records)
+            after = rate(extract_fields, record, args.records)
+            print(f"{fields_name:<10}{record_name:<10}{before:>12.0f}{after:>12.0f}"
+                  f"{after / before:>9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""
+Measure the overhead of the handler metrics on the emit throughput.
+
+Each configuration is run with and without metrics, against Redis and against a handler
+whose batches are discarded instead of being sent (the worst case, where formatting the
+logs is the only other cost). The best of several runs is kept to reduce the noise.
+
+Usage: python benchmarks/bench_metrics.py [--records N] [--runs N] [--batch-size N]
+                                          [--targets null redis]
+"""
+
+import argparse
+import logging
+import os
+import time
+
+from redis import Redis
+
+from rlh import RedisStreamLogHandler
+
+REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
+REDIS_PORT = os.environ.get("REDIS_PORT", 6379)
+
+
+class NullStreamLogHandler(RedisStreamLogHandler):
+    """Handler formatting and batching the logs, but discarding the batches."""
+
+    def _send_logs(self, logs):
+        pass
+
+
+TARGETS = {"null": NullStreamLogHandler, "redis": RedisStreamLogHandler}
+
+
+def run(handler_class, client, batch_size, records, metrics):
+    """Return the number of records per second emitted by the handler."""
+    handler = handler_class(redis_client=client, batch_size=batch_size, check_conn=False,
+                            stream_name="bench_logs", metrics=metrics)
+    record = logging.LogRecord("bench", logging.INFO, __file__, 0,
+                               "benchmark log %s", (42,), None)
+
+    start = time.perf_counter()
+    for _ in range(records):
+        handler.emit(record)
+    handler.close()
+    elapsed = time.perf_counter() - start
+
+    client.delete("bench_logs")
+    return records / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=50000)
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--targets", nargs="+", choices=list(TARGETS), default=list(TARGETS))
+    args = parser.parse_args()
+
+    client = Redis(host=REDIS_HOST, port=REDIS_PORT)
+    print(f"{'target':<10}{'no metrics':>14}{'metrics':>14}{'overhead':>10}")
+    for name in args.targets:
+        handler_class = TARGETS[name]
+        rates = {}
+        # interleaved so that both configurations see the same conditions
+        for _ in range(args.runs):
+            for metrics in (False, True):
+                rate = run(handler_class, client, args.batch_size, args.records, metrics)
+                rates[metrics] = max(rates.get(metrics, 0), rate)
+        overhead = (rates[False] - rates[True]) / rates[False] * 100
+        print(f"{name:<10}{rates[False]:>14.0f}{rates[True]:>14.0f}{overhead:>9.1f}%")
+
+
+if __name__ == "__main__":
+    main()
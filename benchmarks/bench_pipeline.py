@@ -0,0 +1,72 @@
+"""
+Compare the batch delivery modes of RedisStreamLogHandler and RedisPubSubLogHandler.
+
+The transactional pipeline (MULTI/EXEC, the behaviour of rlh <= 1.2.0), the
+non-transactional pipeline and, for streams, the Lua batch script are measured for
+batch sizes from 1 to 10k logs.
+
+Usage: python benchmarks/bench_pipeline.py [--records N] [--batch-sizes 1 10 ...]
+"""
+
+import argparse
+import logging
+import os
+import time
+
+from redis import Redis
+
+from rlh import RedisStreamLogHandler, RedisPubSubLogHandler
+
+REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
+REDIS_PORT = os.environ.get("REDIS_PORT", 6379)
+
+MODES = {
+    "stream/transaction": (RedisStreamLogHandler, {"transaction": True}),
+    "stream/pipeline": (RedisStreamLogHandler, {}),
+    "stream/script": (RedisStreamLogHandler, {"use_script": True}),
+    "pubsub/transaction": (RedisPubSubLogHandler, {"transaction": True}),
+    "pubsub/pipeline": (RedisPubSubLogHandler, {}),
+}
+
+
+def run(client, handler_class, options, batch_size, records):
+    """Return the number of records per second sent by the handler."""
+    handler = _make_handler(client, handler_class, options, batch_size)
+    record = logging.LogRecord("bench", logging.INFO, __file__, 0,
+                               "benchmark log %s", (42,), None)
+
+    start = time.perf_counter()
+    for _ in range(records):
+        handler.emit(record)
+    handler.close()
+    elapsed = time.perf_counter() - start
+
+    client.delete("bench_logs")
+    return records / elapsed
+
+
+def _make_handler(client, handler_class, options, batch_size):
+    if handler_class is RedisStreamLogHandler:
+        return handler_class(redis_client=client, batch_size=batch_size,
+                             stream_name="bench_logs", **options)
+    return handler_class(redis_client=client, batch_size=batch_size,
+                         channel_name="bench_logs", **options)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=20000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+",
+                        default=[1, 10, 100, 1000, 10000])
+    args = parser.parse_args()
+
+    client = Redis(host=REDIS_HOST, port=REDIS_PORT)
+    print(f"{'mode':<20}" + "".join(f"{size:>12}" for size in args.batch_sizes))
+    for name, (handler_class, options) in MODES.items():
+        rates = [run(client, handler_class, options, size, args.records)
+                 for size in args.batch_sizes]
+        print(f"{name:<20}" + "".join(f"{rate:>12.0f}" for rate in rates))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""
+Compare the size and the encoding speed of the compact binary record format of
+`rlh.records` with the pickle format used by `as_pkl`.
+
+No Redis instance is needed.
+
+Usage: python benchmarks/bench_record_format.py [--records N]
+"""
+
+import argparse
+import logging
+import pickle
+import sys
+import time
+
+from rlh.records import decode_record, encode_record
+
+
+def make_records():
+    """Return the records to encode, by name."""
+    try:
+        raise ValueError("benchmark error")
+    except ValueError:
+        exc_info = sys.exc_info()
+    return {
+        "simple": logging.LogRecord("bench", logging.INFO, __file__, 10,
+                                    "benchmark log", None, None),
+        "args": logging.LogRecord("bench", logging.INFO, __file__, 10,
+                                  "benchmark log %s %d", ("arg", 42), None),
+        # pickle cannot encode tracebacks, the formatted exception is pickled instead
+        "exception": logging.LogRecord("bench", logging.ERROR, __file__, 10,
+                                       "benchmark log", None, exc_info),
+    }
+
+
+def rate(func, record, records):
+    """Return the number of records per second processed by func."""
+    start = time.perf_counter()
+    for _ in range(records):
+        func(record)
+    return records / (time.perf_counter() - start)
+
+
+def pickle_record(record):
+    """Pickle the record as the handlers do, formatting its exception beforehand."""
+    if record.exc_info and not record.exc_text:
+        record.exc_text = logging.Formatter().formatException(record.exc_info)
+        record.exc_info = None
+    return pickle.dumps(record)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=100000)
+    args = parser.parse_args()
+
+    print(f"{'record':<10}{'pkl size':>10}{'bin size':>10}{'pkl rec/s':>12}"
+          f"{'bin rec/s':>12}{'decode rec/s':>14}")
+    for name, record in make_records().items():
+        pkl, binary = pickle_record(record), encode_record(record)
+        pkl_rate = rate(pickle_record, record, args.records)
+        bin_rate = rate(encode_record, record, args.records)
+        decode_rate = rate(decode_record, binary, args.records)
+        print(f"{name:<10}{len(pkl):>10}{len(binary):>10}{pkl_rate:>12.0f}"
+              f"{bin_rate:>12.0f}{decode_rate:>14.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""
+Compare the queue and the ring buffer feeding the writer thread of a background handler.
+
+Each producer thread handles its share of the records, the throughput is measured until
+the handler is closed, that is until the writer has handled every record. The `null`
+target discards the batches instead of sending them so that only the hand-off between
+the threads is measured, the `redis` target sends them to Redis.
+
+Usage: python benchmarks/bench_ring.py [--records N] [--producers 1 8 32]
+                                       [--batch-size N] [--targets null redis]
+"""
+
+import argparse
+import logging
+import os
+import threading
+import time
+
+from redis import Redis
+
+from rlh import RedisStreamLogHandler
+
+REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
+REDIS_PORT = os.environ.get("REDIS_PORT", 6379)
+
+TRANSPORTS = {
+    "queue": {},
+    "ring": {"ring_slots": 8192},
+}
+
+
+class NullStreamLogHandler(RedisStreamLogHandler):
+    """Handler delivering the logs to its writer, but discarding the batches."""
+
+    def _send_logs(self, logs):
+        pass
+
+
+TARGETS = {"null": NullStreamLogHandler, "redis": RedisStreamLogHandler}
+
+
+def run(handler_class, client, options, producers, batch_size, records):
+    """Return the number of records per second handled by the handler."""
+    handler = handler_class(redis_client=client, batch_size=batch_size, check_conn=False,
+                            stream_name="bench_logs", as_bin=True, background=True,
+                            queue_size=8192, **options)
+    record = logging.LogRecord("bench", logging.INFO, __file__, 0,
+                               "benchmark log %s", (42,), None)
+
+    def produce():
+        for _ in range(records // producers):
+            handler.handle(record)
+
+    threads = [threading.Thread(target=produce) for _ in range(producers)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    handler.close()
+    elapsed = time.perf_counter() - start
+
+    client.delete("bench_logs")
+    return records // producers * producers / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=200000)
+    parser.add_argument("--producers", type=int, nargs="+", default=[1, 8, 32])
+    parser.add_argument("--batch-size", type=int, default=500)
+    parser.add_argument("--targets", nargs="+", choices=list(TARGETS), default=list(TARGETS))
+    args = parser.parse_args()
+
+    client = Redis(host=REDIS_HOST, port=REDIS_PORT)
+    print(f"{'target/transport':<20}" + "".join(f"{n:>10} thr" for n in args.producers))
+    for target in args.targets:
+        for name, options in TRANSPORTS.items():
+            rates = [run(TARGETS[target], client, options, producers, args.batch_size,
+                         args.records)
+                     for producers in args.producers]
+            print(f"{target + '/' + name:<20}" + "".join(f"{rate:>14.0f}" for rate in rates))
+
+
+if __name__ == "__main__":
+    main()
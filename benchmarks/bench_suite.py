@@ -0,0 +1,331 @@
+"""
+Benchmark suite of RedisStreamLogHandler and RedisPubSubLogHandler, with JSON results and
+a regression comparison mode.
+
+Each case of the matrix (handler, format, field set, batch size, number of threads) is
+run `--runs` times, keeping the median of the timings, against a Redis instance at
+REDIS_HOST:REDIS_PORT or against an in-process fakeredis server (`--target fakeredis`,
+which measures the client side only). For each case the suite reports:
+
+- records_per_s: the records emitted per second by all the threads, including the time
+  taken to close the handler and send the last batch;
+- emit_p50_us / emit_p99_us: the latency of a call to `handle` (which the logger calls,
+  taking the handler lock and calling `emit`), the calls that send a batch included;
+- alloc_blocks / alloc_bytes: the memory blocks and bytes allocated by rlh per record and
+  held until the batch is sent, measured with tracemalloc on a handler whose batch is
+  never sent (tracemalloc only sees the live blocks, not the transient ones);
+- wire_bytes: the bytes of the commands written on the connections per record.
+
+The results are printed as a table, and written as JSON with `--json`. `--compare`
+compares them with the results of a previous run, and exits with status 1 if a case
+regressed by more than `--threshold`.
+
+Usage: python benchmarks/bench_suite.py [--target redis|fakeredis] [--records N] [--runs N]
+                                        [--handlers stream pubsub] [--formats ...]
+                                        [--field-sets ...] [--batch-sizes ...]
+                                        [--threads ...] [--json PATH]
+                                        [--compare BASELINE [RESULTS]] [--threshold F]
+"""
+
+import argparse
+import gc
+import itertools
+import json
+import logging
+import os
+import platform
+import statistics
+import sys
+import threading
+import time
+import tracemalloc
+
+from redis import Redis
+
+import rlh
+from rlh import RedisPubSubLogHandler, RedisStreamLogHandler
+
+REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
+REDIS_PORT = os.environ.get("REDIS_PORT", 6379)
+
+# the allocations made with a frame of rlh in their traceback are measured
+RLH_FILTER = tracemalloc.Filter(True, os.path.join(os.path.dirname(rlh.__file__), "*"),
+                                all_frames=True)
+
+HANDLERS = {
+    "stream": RedisStreamLogHandler,
+    "pubsub": RedisPubSubLogHandler,
+}
+
+# handler arguments of each format, by handler, the pub/sub messages are always serialized
+FORMATS = {
+    "fields": {"stream": {}},
+    "json": {"stream": {"as_json": True}, "pubsub": {}},
+    "pkl": {"stream": {"as_pkl": True}, "pubsub": {"as_pkl": True}},
+}
+
+FIELD_SETS = {
+    "default": None,
+    "wide": ["msg", "levelname", "levelno", "created", "name", "pathname", "filename",
+             "module", "funcName", "lineno", "thread", "threadName", "process"],
+}
+
+# metrics compared by `--compare`, and wether a higher value is better
+COMPARED_METRICS = {
+    "records_per_s": True,
+    "emit_p99_us": False,
+    "alloc_bytes": False,
+    "wire_bytes": False,
+}
+
+
+class WireCounter:
+    """Count the bytes of the commands written on the connections of a client."""
+
+    def __init__(self, client):
+        self.bytes = 0
+        pool = client.connection_pool
+        # the connections created from now on are counted
+        pool.reset()
+        make_connection = pool.make_connection
+
+        def make_counted_connection():
+            connection = make_connection()
+            send_packed_command = connection.send_packed_command
+
+            def send_counted(command, check_health=True):
+                if isinstance(command, (bytes, str)):
+                    self.bytes += len(command)
+                else:
+                    self.bytes += sum(map(len, command))
+                return send_packed_command(command, check_health)
+
+            connection.send_packed_command = send_counted
+            return connection
+
+        pool.make_connection = make_counted_connection
+
+
+def make_client(target):
+    """Return a function creating the clients of the target."""
+    if target == "redis":
+        return lambda: Redis(host=REDIS_HOST, port=REDIS_PORT)
+    try:
+        import fakeredis  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        sys.exit("The fakeredis target requires fakeredis: pip install fakeredis")
+    server = fakeredis.FakeServer()
+    return lambda: fakeredis.FakeRedis(server=server)
+
+
+def make_cases(args):
+    """Return the cases of the matrix, as dicts of their parameters."""
+    cases = []
+    for handler in args.handlers:
+        for fmt in args.formats:
+            if handler not in FORMATS[fmt]:
+                continue
+            # the pickled records hold all their attributes
+            field_sets = ["default"] if fmt == "pkl" else args.field_sets
+            for field_set in field_sets:
+                for batch_size in args.batch_sizes:
+                    for threads in args.threads:
+                        cases.append({"handler": handler, "format": fmt,
+                                      "fields": field_set, "batch_size": batch_size,
+                                      "threads": threads})
+    return cases
+
+
+def case_name(case):
+    return "{handler}/{format}/{fields}/batch={batch_size}/threads={threads}".format(**case)
+
+
+def make_handler(case, client, **options):
+    handler_class = HANDLERS[case["handler"]]
+    name_option = "stream_name" if case["handler"] == "stream" else "channel_name"
+    options.setdefault("batch_size", case["batch_size"])
+    options[name_option] = "bench_suite"
+    return handler_class(redis_client=client, check_conn=False,
+                         fields=FIELD_SETS[case["fields"]],
+                         **FORMATS[case["format"]][case["handler"]], **options)
+
+
+def make_record(index):
+    return logging.LogRecord("bench", logging.INFO, __file__, 42,
+                             "user %s logged in from %s after %d attempts",
+                             (f"user{index % 100}", "10.0.0.1", index % 5), None,
+                             func="login")
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(int(len(sorted_values) * fraction), len(sorted_values) - 1)]
+
+
+def measure_throughput(case, new_client, records):
+    """Return the records per second, the emit latencies in ns and the bytes on the wire."""
+    client = new_client()
+    client.delete("bench_suite")
+    wire = WireCounter(client)
+    handler = make_handler(case, client)
+    threads = case["threads"]
+    per_thread = records // threads
+    latencies = [[] for _ in range(threads)]
+    start_barrier = threading.Barrier(threads + 1)
+
+    def produce(samples):
+        handle = handler.handle
+        clock = time.perf_counter_ns
+        logs = [make_record(index) for index in range(per_thread)]
+        start_barrier.wait()
+        for record in logs:
+            before = clock()
+            handle(record)
+            samples.append(clock() - before)
+
+    workers = [threading.Thread(target=produce, args=(samples,)) for samples in latencies]
+    for worker in workers:
+        worker.start()
+    start_barrier.wait()
+    start = time.perf_counter()
+    for worker in workers:
+        worker.join()
+    handler.close()
+    elapsed = time.perf_counter() - start
+
+    client.delete("bench_suite")
+    total = per_thread * threads
+    return total / elapsed, sorted(itertools.chain(*latencies)), wire.bytes / total
+
+
+def measure_allocations(case, new_client, records):
+    """Return the memory blocks and bytes allocated per record and held until the batch
+    is sent."""
+    handler = make_handler(case, new_client(), batch_size=records + 1)
+    logs = [make_record(index) for index in range(records)]
+    # the first record compiles and caches what the next ones reuse
+    handler.emit(make_record(0))
+    gc.collect()
+    tracemalloc.start(32)
+    before = tracemalloc.take_snapshot().filter_traces([RLH_FILTER])
+    for record in logs:
+        handler.emit(record)
+    after = tracemalloc.take_snapshot().filter_traces([RLH_FILTER])
+    tracemalloc.stop()
+    handler.log_buffer = []
+    stats = after.compare_to(before, "filename")
+    blocks = sum(stat.count_diff for stat in stats)
+    size = sum(stat.size_diff for stat in stats)
+    return blocks / records, size / records
+
+
+def run_case(case, new_client, records, alloc_records, runs):
+    rates, p50s, p99s = [], [], []
+    for _ in range(runs):
+        records_per_s, latencies, wire_bytes = measure_throughput(case, new_client, records)
+        rates.append(records_per_s)
+        p50s.append(percentile(latencies, 0.50))
+        p99s.append(percentile(latencies, 0.99))
+    alloc_blocks, alloc_bytes = measure_allocations(case, new_client, alloc_records)
+    return {
+        "name": case_name(case),
+        **case,
+        "records": records,
+        "records_per_s": round(statistics.median(rates), 1),
+        "emit_p50_us": round(statistics.median(p50s) / 1000, 3),
+        "emit_p99_us": round(statistics.median(p99s) / 1000, 3),
+        "alloc_blocks": round(alloc_blocks, 2),
+        "alloc_bytes": round(alloc_bytes, 1),
+        "wire_bytes": round(wire_bytes, 1),
+    }
+
+
+def print_results(results):
+    print(f"{'case':<44}{'records/s':>11}{'p50 (us)':>10}{'p99 (us)':>10}"
+          f"{'blocks':>8}{'alloc B':>9}{'wire B':>8}")
+    for result in results:
+        print(f"{result['name']:<44}{result['records_per_s']:>11.0f}"
+              f"{result['emit_p50_us']:>10.2f}{result['emit_p99_us']:>10.2f}"
+              f"{result['alloc_blocks']:>8.1f}{result['alloc_bytes']:>9.0f}"
+              f"{result['wire_bytes']:>8.0f}")
+
+
+def compare(baseline, results, threshold):
+    """Print the change of the compared metrics of each case, and return the names of
+    the regressed cases."""
+    base_cases = {result["name"]: result for result in baseline["results"]}
+    regressed = []
+    print(f"{'case':<44}" + "".join(f"{metric:>16}" for metric in COMPARED_METRICS))
+    for result in results["results"]:
+        base = base_cases.get(result["name"])
+        if base is None:
+            continue
+        changes = []
+        for metric, higher_is_better in COMPARED_METRICS.items():
+            if not base[metric]:
+                changes.append("")
+                continue
+            change = result[metric] / base[metric] - 1
+            worse = -change if higher_is_better else change
+            flag = "!" if worse > threshold else ""
+            if flag:
+                regressed.append(result["name"])
+            changes.append(f"{change:+.1%}{flag}")
+        print(f"{result['name']:<44}" + "".join(f"{change:>16}" for change in changes))
+    return sorted(set(regressed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--target", choices=["redis", "fakeredis"], default="redis")
+    parser.add_argument("--records", type=int, default=5000)
+    parser.add_argument("--alloc-records", type=int, default=1000)
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--handlers", nargs="+", choices=list(HANDLERS),
+                        default=list(HANDLERS))
+    parser.add_argument("--formats", nargs="+", choices=list(FORMATS), default=list(FORMATS))
+    parser.add_argument("--field-sets", nargs="+", choices=list(FIELD_SETS),
+                        default=list(FIELD_SETS))
+    parser.add_argument("--batch-sizes", nargs="+", type=int, default=[1, 10, 100])
+    parser.add_argument("--threads", nargs="+", type=int, default=[1, 4])
+    parser.add_argument("--json", help="write the results to this file")
+    parser.add_argument("--compare", nargs="+", metavar="PATH",
+                        help="the results of a previous run, and optionally the results "
+                             "to compare with them instead of running the suite")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="the relative change beyond which a case regressed")
+    args = parser.parse_args()
+
+    if args.compare and len(args.compare) == 2:
+        with open(args.compare[1], encoding="utf-8") as file:
+            results = json.load(file)
+    else:
+        new_client = make_client(args.target)
+        results = {
+            "meta": {
+                "target": args.target,
+                "python": platform.python_version(),
+                "rlh": rlh.__version__,
+                "platform": platform.platform(),
+                "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            },
+            "results": [run_case(case, new_client, args.records, args.alloc_records,
+                                 args.runs)
+                        for case in make_cases(args)],
+        }
+        print_results(results["results"])
+        if args.json:
+            with open(args.json, "w", encoding="utf-8") as file:
+                json.dump(results, file, indent=2)
+
+    if args.compare:
+        with open(args.compare[0], encoding="utf-8") as file:
+            baseline = json.load(file)
+        print()
+        regressed = compare(baseline, results, args.threshold)
+        if regressed:
+            print(f"\n{len(regressed)} case(s) regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Compare the stream trimming policies: trimming on each XADD (MAXLEN or MINID) and
+trimming once per batch or every N batches with XTRIM.
+
+For each policy the stream is first filled beyond its cap so that every run trims, then
+the records are emitted by batches. The client throughput is measured, along with the
+CPU time used by the Redis server (from INFO CPU, not available with every Redis
+stand-in).
+
+Usage: python benchmarks/bench_trim.py [--records N] [--batch-size N] [--maxlen N]
+"""
+
+import argparse
+import logging
+import os
+import time
+
+import redis
+from redis import Redis
+
+from rlh import RedisStreamLogHandler
+
+REDIS_HOST = os.environ.get("REDIS_HOST", "localhost")
+REDIS_PORT = os.environ.get("REDIS_PORT", 6379)
+
+
+def policies(maxlen):
+    """Return the handler arguments of each trimming policy."""
+    return {
+        "none": {},
+        "xadd maxlen~": {"maxlen": maxlen},
+        "xadd minid~": {"retention": 60},
+        "xtrim each batch": {"maxlen": maxlen, "trim_every": 1},
+        "xtrim every 10": {"maxlen": maxlen, "trim_every": 10},
+        "xtrim every 10 limit": {"maxlen": maxlen, "trim_every": 10, "trim_limit": 1000},
+    }
+
+
+def server_cpu(client):
+    """Return the CPU time in seconds used by the Redis server, None if unknown."""
+    try:
+        info = client.info("cpu")
+    except redis.exceptions.ResponseError:
+        return None
+    return info["used_cpu_user"] + info["used_cpu_sys"]
+
+
+def run(client, options, batch_size, records, maxlen):
+    """Return the number of records per second and the server CPU time used."""
+    client.delete("bench_logs")
+    pipe = client.pipeline(transaction=False)
+    for _ in range(2 * maxlen):
+        pipe.xadd("bench_logs", {"msg": "filler"})
+    pipe.execute()
+
+    handler = RedisStreamLogHandler(redis_client=client, batch_size=batch_size,
+                                    check_conn=False, stream_name="bench_logs", **options)
+    record = logging.LogRecord("bench", logging.INFO, __file__, 0,
+                               "benchmark log %s", (42,), None)
+
+    cpu = server_cpu(client)
+    start = time.perf_counter()
+    for _ in range(records):
+        handler.emit(record)
+    handler.close()
+    elapsed = time.perf_counter() - start
+    if cpu is not None:
+        cpu = server_cpu(client) - cpu
+
+    client.delete("bench_logs")
+    return records / elapsed, cpu
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--records", type=int, default=50000)
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--maxlen", type=int, default=10000)
+    args = parser.parse_args()
+
+    client = Redis(host=REDIS_HOST, port=REDIS_PORT)
+    print(f"{'policy':<24}{'records/s':>12}{'server cpu (s)':>16}")
+    for name, options in policies(args.maxlen).items():
+        rate, cpu = run(client, options, args.batch_size, args.records, args.maxlen)
+        print(f"{name:<24}{rate:>12.0f}{'n/a' if cpu is None else f'{cpu:.3f}':>16}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,27 @@ from rlh.handlers import (
     RedisLogHandler,
     RedisStreamLogHandler,
     RedisPubSubLogHandler,
+    RedisListLogHandler,
+)
+from rlh.reader import RedisStreamLogReader, RedisListLogReader
+from rlh.asyncio import (
+    AsyncRedisLogHandler,
+    AsyncRedisStreamLogHandler,
+    AsyncRedisPubSubLogHandler,
+    AsyncRedisListLogHandler,
 )
 
 __all__ = [
     "RedisLogHandler",
     "RedisStreamLogHandler",
     "RedisPubSubLogHandler",
+    "RedisListLogHandler",
+    "AsyncRedisLogHandler",
+    "AsyncRedisStreamLogHandler",
+    "AsyncRedisPubSubLogHandler",
+    "AsyncRedisListLogHandler",
+    "RedisStreamLogReader",
+    "RedisListLogReader",
 ]
 
 __version__ = "1.2.0"
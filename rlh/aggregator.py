@@ -0,0 +1,206 @@
+"""
+This module contains the per-host aggregation used when many worker processes (gunicorn,
+multiprocessing...) log to Redis: the handlers of the workers, created with
+`aggregator=<socket path>`, format their logs and send each batch as a datagram over a
+local Unix socket to a single aggregator process, which forwards all of them to Redis in
+large pipelines with its own handler.
+
+The batches are pickled, the socket is only accessible to the user running the
+aggregator, and the workers must be configured like the aggregator handler (same
+format options), which sends their logs as they are.
+"""
+
+import errno
+import multiprocessing
+import os
+import pickle
+import signal
+import socket
+import threading
+
+# size of the socket buffers, the largest datagram a worker can send is bounded by it
+SOCKET_BUFFER_SIZE = 4 * 2 ** 20
+
+
+class AggregatorClient:
+    """Send batches of formatted logs to an aggregator.
+
+    Attributes
+    ----------
+    socket_path : str
+        The path of the Unix socket of the aggregator.
+    dropped : int
+        The number of logs dropped because the aggregator could not keep up.
+    """
+
+    def __init__(self, socket_path: str) -> None:
+        self.socket_path = socket_path
+        self.dropped = 0
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        self._sock.setblocking(False)
+        try:
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+        except OSError:  # pragma: no cover
+            pass
+
+    def send(self, logs: list) -> None:
+        """Send a batch of logs, without waiting for the aggregator.
+
+        A batch too large for a datagram is split, and the logs are dropped if the
+        aggregator socket buffer is full.
+
+        Raises
+        ------
+        OSError
+            Raised if the aggregator is not running.
+        """
+        try:
+            self._sock.sendto(pickle.dumps(logs, protocol=pickle.HIGHEST_PROTOCOL),
+                              self.socket_path)
+        except BlockingIOError:
+            self.dropped += len(logs)
+        except OSError as err:
+            if err.errno != errno.EMSGSIZE or len(logs) < 2:
+                raise
+            half = len(logs) // 2
+            self.send(logs[:half])
+            self.send(logs[half:])
+
+    def close(self) -> None:
+        self._sock.close()
+
+
+class LogAggregator:
+    """Receive the batches of the workers of a host and forward them with a handler.
+
+    Attributes
+    ----------
+    handler : rlh.handlers.RedisLogHandler
+        The handler sending the logs to Redis, configured with a large `batch_size` and a
+        `flush_interval` so that the logs of all the workers are sent in large
+        pipelines.
+    socket_path : str
+        The path of the Unix socket.
+
+    Methods
+    -------
+    serve_forever()
+        Forward the received logs until the aggregator is stopped.
+    start()
+        Forward the received logs from a thread.
+    stop()
+        Stop forwarding the logs.
+    close()
+        Stop the aggregator, send the remaining logs and remove the socket.
+    """
+
+    def __init__(self, handler, socket_path: str) -> None:
+        self.handler = handler
+        self.socket_path = socket_path
+        self._sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        # the socket is only accessible to the user running the aggregator
+        umask = os.umask(0o077)
+        try:
+            self._sock.bind(socket_path)
+        finally:
+            os.umask(umask)
+        try:
+            self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+        except OSError:  # pragma: no cover
+            pass
+        self._sock.settimeout(0.1)
+        self._running = threading.Event()
+        self._thread = None
+
+    def serve_forever(self) -> None:
+        """Forward the received logs to the handler until `stop` is called."""
+        self._running.set()
+        while self._running.is_set():
+            try:
+                data = self._sock.recv(SOCKET_BUFFER_SIZE)
+            except socket.timeout:
+                continue
+            except OSError:
+                # the socket was closed
+                break
+            try:
+                for entry in pickle.loads(data):
+                    # the level of the logs is unknown, they are not shed by level
+                    self.handler._push(entry, None)
+            except Exception:  # pylint: disable=broad-except
+                # the aggregator must survive invalid datagrams and Redis errors
+                self.handler._handle_writer_error()
+
+    def start(self) -> threading.Thread:
+        """Forward the received logs from a daemon thread."""
+        self._thread = threading.Thread(target=self.serve_forever,
+                                        name=f"{type(self).__name__}-{self.socket_path}",
+                                        daemon=True)
+        self._running.set()
+        self._thread.start()
+        return self._thread
+
+    def stop(self) -> None:
+        """Stop forwarding the logs, once the current datagram is handled."""
+        self._running.clear()
+        if self._thread is not None:
+            self._thread.join()
+
+    def close(self) -> None:
+        """Stop the aggregator, send the remaining logs and remove the socket."""
+        self.stop()
+        self._sock.close()
+        self.handler.close()
+        if os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+
+def _run_aggregator(socket_path, handler_class, handler_args, ready):
+    aggregator = LogAggregator(handler_class(**handler_args), socket_path)
+    signal.signal(signal.SIGTERM, lambda signum, frame: aggregator.stop())
+    ready.set()
+    try:
+        aggregator.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        aggregator.close()
+
+
+def start_aggregator_process(socket_path: str, handler_class, **handler_args):
+    """Start an aggregator in a new process, and wait for it to be ready.
+
+    Call it once per host, for example in the gunicorn `on_starting` hook, before the
+    workers are forked.
+
+    Parameters
+    ----------
+    socket_path : str
+        The path of the Unix socket.
+    handler_class : type
+        The handler class, e.g. `RedisStreamLogHandler`.
+
+    The other keyword arguments are passed to the handler, which is created in the
+    aggregator process.
+
+    Returns
+    -------
+    multiprocessing.Process
+        The daemon aggregator process, terminating it sends the remaining logs.
+
+    Raises
+    ------
+    RuntimeError
+        Raised if the aggregator process exited before being ready.
+    """
+    ready = multiprocessing.Event()
+    process = multiprocessing.Process(target=_run_aggregator,
+                                      args=(socket_path, handler_class, handler_args, ready),
+                                      name="rlh-aggregator", daemon=True)
+    process.start()
+    while not ready.wait(0.1):
+        if not process.is_alive():
+            raise RuntimeError("The aggregator process failed to start")
+    return process
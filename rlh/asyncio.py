@@ -0,0 +1,306 @@
+"""
+This module contains asyncio handlers that forward logs to a Redis database with a
+`redis.asyncio.Redis` client, without blocking the event loop.
+"""
+
+import asyncio
+import collections
+import logging
+import time
+
+import redis.asyncio
+
+from rlh.handlers import (RedisLogHandler, RedisStreamLogHandler, RedisPubSubLogHandler,
+                          RedisListLogHandler, _entry_size)
+
+
+class AsyncRedisLogHandler(RedisLogHandler):
+    """Default class for asyncio Redis log handlers.
+
+    `emit` only formats the log, or captures it with `defer_format`, and appends it to a
+    bounded queue, the logs are sent
+    to Redis by batches from a task running on the event loop of the first thread that
+    emitted a log from a coroutine.
+
+    Attributes
+    ----------
+    redis : redis.asyncio.Redis
+        The asyncio Redis client.
+    batch_size : int
+        The batch size, if this value is > 1, logs will be processed by batches.
+    queue_size : int
+        The capacity of the queue of logs waiting to be sent.
+    overflow : str
+        The policy applied when the queue is full, "drop_newest" or "drop_oldest".
+    flush_interval : float
+        The maximum time in seconds an incomplete batch waits before being sent.
+    close_timeout : float
+        The maximum time in seconds spent draining the queue in `aclose`.
+    dropped : int
+        The number of logs discarded because the queue was full or Redis failed.
+
+    Methods
+    -------
+    aclose()
+        Send the remaining logs and close the handler.
+    """
+
+    client_class = redis.asyncio.Redis
+    blocking_pool_class = redis.asyncio.BlockingConnectionPool
+
+    def __init__(self, redis_client: redis.asyncio.Redis = None, batch_size: int = 1,
+                 overflow: str = "drop_oldest", **kwargs) -> None:
+        """Init AsyncRedisLogHandler
+
+        Parameters
+        ----------
+        redis_client : redis.asyncio.Redis, optional
+            The asyncio Redis client to forward logs to, by default None.
+        batch_size : int, optional
+            The batch size, if > 1 logs will be processed by batches, by default 1.
+        overflow : str, optional
+            What to do when the queue is full: "drop_newest" or "drop_oldest", by default
+            "drop_oldest". Blocking is not supported as it would stall the event loop.
+
+        The other keyword arguments are the ones of `RedisLogHandler`, except
+        `check_conn`, `background` and `spill_dir`, or are passed to Redis. The clients
+        are not shared by default (`share_client`), as their connections are bound to
+        the event loop they were opened on.
+
+        Raises
+        ------
+        ValueError
+            Raised if the overflow policy is "block" or if `spill_dir` is set.
+        """
+        if overflow == "block":
+            raise ValueError("The 'block' overflow policy would stall the event loop")
+        if kwargs.get("spill_dir") is not None:
+            raise ValueError("Spilling to disk is not supported by the asyncio handlers")
+        kwargs.setdefault("share_client", False)
+        super().__init__(redis_client, batch_size, False, overflow=overflow, **kwargs)
+
+        self._queue = collections.deque()
+        self._loop = None
+        self._task = None
+        self._wakeup = None
+        self._flush_requested = False
+        # the logs are always sent by the task, which can format them
+        self._defer = self.defer_format or self.dedup is not None
+
+    def _after_fork(self):
+        super()._after_fork()
+        # the event loop of the parent is not running in the child
+        self._queue = collections.deque()
+        self._loop = None
+        self._task = None
+        self._wakeup = None
+        self._flush_requested = False
+
+    async def _abuffer_emit(self, logs):
+        raise NotImplementedError(
+            "_abuffer_emit must be implemented by AsyncRedisLogHandler subclasses")
+
+    def _start_writer(self):
+        # the logs are sent from a task started on the event loop
+        pass
+
+    def _start_flusher(self):
+        # the flush interval is enforced by the task
+        pass
+
+    def _push(self, entry, levelno=logging.NOTSET):
+        """Add a formatted log to the queue, this can be called from any thread."""
+        if self.queue_size and len(self._queue) >= self.queue_size:
+            self.dropped += 1
+            if self.overflow == "drop_newest":
+                return
+            try:
+                self._queue.popleft()
+            except IndexError:
+                pass
+        self._queue.append(entry)
+        if self._task is None or len(self._queue) >= self.batch_size:
+            self._notify()
+
+    def _notify(self):
+        """Wake the task up, starting it if a loop is running in the current thread."""
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        if self._loop is None:
+            if running is None:
+                # the logs wait in the queue for a loop to be running
+                return
+            self._start(running)
+        if running is self._loop:
+            self._wakeup.set()
+        elif not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def _start(self, loop):
+        self._loop = loop
+        self._wakeup = asyncio.Event()
+        self._task = loop.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        """Send the queued logs by batches, until the handler is closed."""
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+                timed_out = False
+            except asyncio.TimeoutError:
+                timed_out = True
+            self._wakeup.clear()
+            closing = self._closing.is_set()
+            send_all = timed_out or closing or self._flush_requested
+            self._flush_requested = False
+            while self._queue and (send_all or len(self._queue) >= self.batch_size):
+                await self._send_batch()
+            if closing:
+                break
+
+    async def _send_batch(self):
+        logs = []
+        while self._queue and len(logs) < max(self.batch_size, 1):
+            logs.append(self._queue.popleft())
+        if self.dedup is not None:
+            logs = self._collapse(logs)
+        elif self._defer:
+            logs = [log for log in map(self._format_captured, logs) if log is not None]
+        if not logs:
+            return
+        start = time.perf_counter()
+        try:
+            if self._aggregator is not None:
+                # the datagram is sent without blocking
+                self._aggregator.send(logs)
+            else:
+                await self._abuffer_emit(logs)
+        except Exception:  # pylint: disable=broad-except
+            # the task must survive Redis errors
+            self.dropped += len(logs)
+            self._record_batch(logs, start, True)
+            self._handle_writer_error()
+        else:
+            self._record_batch(logs, start)
+
+    def _record_batch(self, logs, start, error=False):
+        if self.metrics is not None:
+            self._record_metrics(len(logs), sum(map(_entry_size, logs)),
+                                 time.perf_counter() - start, error)
+
+    def _queue_depth(self):
+        return len(self._queue)
+
+    def flush(self):
+        """Ask the task to send the queued logs without waiting for the batch to be complete."""
+        if self._queue:
+            self._flush_requested = True
+            self._notify()
+
+    async def aclose(self):
+        """Send the remaining logs, waiting at most `close_timeout` seconds, and close the
+        handler."""
+        if self._suppressors:
+            self._emit_summary()
+        if self._loop is None:
+            self._start(asyncio.get_running_loop())
+        self._closing.set()
+        self._wakeup.set()
+        try:
+            await asyncio.wait_for(asyncio.shield(self._task), self.close_timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+        logging.Handler.close(self)
+
+    def close(self):
+        """Ask the task to send the remaining logs and stop, `aclose` waits for it."""
+        if self._suppressors and not self._closing.is_set():
+            self._emit_summary()
+        self._closing.set()
+        if self._loop is not None and not self._loop.is_closed():
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+        logging.Handler.close(self)
+
+
+class AsyncRedisStreamLogHandler(AsyncRedisLogHandler, RedisStreamLogHandler):
+    """asyncio handler used to forward logs to a Redis stream.
+
+    It takes the same arguments as `RedisStreamLogHandler`, with a `redis.asyncio.Redis`
+    client, and formats the logs the same way.
+
+    Methods
+    -------
+    emit(record: logging.LogRecord)
+        Queue the log to be added to the Redis stream.
+    aclose()
+        Send the remaining logs and close the handler.
+    """
+
+    async def _abuffer_emit(self, logs):
+        """Add the logs to the stream."""
+        attempted = self._begin_attempt(logs) if self.client_ids else None
+        if self._xadd_batch is not None:
+            # the script calls of an asyncio pipeline would not be awaited, a call is
+            # awaited per stream instead
+            due = self._trim_due()
+            for stream_name, stream_logs in self._stream_batches(logs):
+                trim = self._batch_trim(stream_name, due)
+                self._count_rejected([None], [await self._xadd_batch(
+                    keys=[stream_name], args=self._script_args(stream_logs, attempted, trim))],
+                    attempted)
+            return
+        pipe = self.redis.pipeline(transaction=self.transaction)
+        queued = self._pipe_logs(pipe, logs, attempted)
+        if attempted is None:
+            await pipe.execute()
+            return
+        conflicts = self._count_rejected(queued, await pipe.execute(raise_on_error=False),
+                                         attempted)
+        if conflicts:
+            pipe = self.redis.pipeline(transaction=self.transaction)
+            self._pipe_conflicts(pipe, conflicts)
+            await pipe.execute()
+
+
+class AsyncRedisPubSubLogHandler(AsyncRedisLogHandler, RedisPubSubLogHandler):
+    """asyncio handler used to publish logs to a Redis pub/sub channel.
+
+    It takes the same arguments as `RedisPubSubLogHandler`, with a `redis.asyncio.Redis`
+    client, and formats the logs the same way.
+
+    Methods
+    -------
+    emit(record: logging.LogRecord)
+        Queue the log to be published on the Redis pub/sub channel.
+    aclose()
+        Send the remaining logs and close the handler.
+    """
+
+    async def _abuffer_emit(self, logs):
+        """Publish the logs on the channel."""
+        pipe = self.redis.pipeline(transaction=self.transaction)
+        self._pipe_logs(pipe, logs)
+        await pipe.execute()
+
+
+class AsyncRedisListLogHandler(AsyncRedisLogHandler, RedisListLogHandler):
+    """asyncio handler used to push logs to a Redis list.
+
+    It takes the same arguments as `RedisListLogHandler`, with a `redis.asyncio.Redis`
+    client, and formats the logs the same way.
+
+    Methods
+    -------
+    emit(record: logging.LogRecord)
+        Queue the log to be pushed to the Redis list.
+    aclose()
+        Send the remaining logs and close the handler.
+    """
+
+    async def _abuffer_emit(self, logs):
+        """Push the logs to the list."""
+        pipe = self.redis.pipeline(transaction=self.transaction)
+        self._pipe_logs(pipe, logs)
+        await pipe.execute()
@@ -0,0 +1,105 @@
+"""
+This module contains the process-wide registry of the Redis clients created by the
+handlers from their connection arguments.
+
+The handlers created without `redis_client` and with the same connection arguments
+share a client, and so its connection pool, instead of opening a pool each: an
+application configuring dozens of handlers with `logging.config.dictConfig` keeps a
+single pool per Redis server. The clients whose arguments cannot be hashed are not
+shared.
+
+A handler created with `dedicated_connection` sends its commands over a connection of
+its own instead, so that its batches never wait for a connection used by the
+application.
+"""
+
+import threading
+import weakref
+
+# shared clients by (client class, connection arguments)
+_clients = {}
+_lock = threading.Lock()
+
+# clients that answered a ping, they are not checked again
+_checked = weakref.WeakSet()
+
+
+def _client_key(client_class, redis_args):
+    try:
+        key = (client_class, frozenset(redis_args.items()))
+        hash(key)
+    except TypeError:
+        return None
+    return key
+
+
+def get_client(client_class, **redis_args):
+    """Return the shared client created with these arguments, creating it on first use.
+
+    Parameters
+    ----------
+    client_class : type
+        The class of the client, e.g. `redis.Redis`.
+
+    The keyword arguments are passed to the client class.
+
+    Returns
+    -------
+    redis.Redis
+        The client, shared with the other callers using the same class and arguments.
+
+    Raises
+    ------
+    TypeError
+        Raised if one of the arguments is invalid.
+    """
+    key = _client_key(client_class, redis_args)
+    if key is None:
+        return client_class(**redis_args)
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            client = _clients[key] = client_class(**redis_args)
+    return client
+
+
+def dedicated_client(client, pool_class):
+    """Return a client connecting like `client`, over a single connection of its own.
+
+    Parameters
+    ----------
+    client : redis.Redis
+        The client whose connection parameters are used.
+    pool_class : type
+        The blocking connection pool class, e.g. `redis.BlockingConnectionPool`, the
+        commands sent at the same time waiting for the connection.
+
+    Returns
+    -------
+    redis.Redis
+        The client, of the same class as `client`.
+    """
+    pool = client.connection_pool
+    return type(client)(connection_pool=pool_class(connection_class=pool.connection_class,
+                                                   max_connections=1,
+                                                   **pool.connection_kwargs))
+
+
+def ping_once(client) -> None:
+    """Ping the client, unless it already answered a ping.
+
+    Raises
+    ------
+    redis.exceptions.ConnectionError
+        Raised if Redis is unreachable.
+    """
+    if client in _checked:
+        return
+    client.ping()
+    _checked.add(client)
+
+
+def clear() -> None:
+    """Forget the shared clients, the handlers using them keep them."""
+    with _lock:
+        _clients.clear()
@@ -0,0 +1,234 @@
+"""
+This module contains the batch compression used by the handlers when `compression` is
+set: a whole batch of logs is framed and compressed into a single stream entry or
+pub/sub message, and the helpers unpacking them back into individual logs.
+
+A packed batch is made of a header::
+
+    magic     3 bytes   b"RLB"
+    version   uint8     BATCH_FORMAT_VERSION
+    codec     uint8     the index of the codec in `CODECS`
+
+followed by the compressed frames. The frames start with the number of logs (uint32),
+then each log is its number of items (uint32) followed by the items, each being its
+length (uint32) followed by its bytes. The items of a stream entry are its fields and
+values, and a pub/sub message has a single item.
+
+zlib is always available, lz4 and zstd are used when the `lz4` and `zstandard` packages
+are installed.
+"""
+
+import struct
+import time
+import zlib
+
+try:
+    import lz4.frame
+except ImportError:  # pragma: no cover
+    lz4 = None
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+MAGIC = b"RLB"
+
+BATCH_FORMAT_VERSION = 1
+
+# codecs, by their index in the batch header
+CODECS = ("zlib", "lz4", "zstd")
+
+HEADER = struct.Struct("<3sBB")
+
+_UINT32 = struct.Struct("<I")
+
+
+def _compressors():
+    compressors = {"zlib": (zlib.compress, zlib.decompress)}
+    if lz4 is not None:
+        compressors["lz4"] = (lz4.frame.compress, lz4.frame.decompress)
+    if zstandard is not None:
+        compressors["zstd"] = (zstandard.ZstdCompressor().compress,
+                               zstandard.ZstdDecompressor().decompress)
+    return compressors
+
+
+COMPRESSORS = _compressors()
+
+
+class CompressionStats:
+    """Compression ratio and CPU cost of the batches packed by a handler.
+
+    Attributes
+    ----------
+    batches : int
+        The number of packed batches.
+    raw_bytes : int
+        The size of the framed batches before compression.
+    compressed_bytes : int
+        The size of the compressed batches.
+    cpu_time : float
+        The CPU time in seconds spent framing and compressing the batches.
+    """
+
+    def __init__(self) -> None:
+        self.batches = 0
+        self.raw_bytes = 0
+        self.compressed_bytes = 0
+        self.cpu_time = 0.0
+
+    @property
+    def ratio(self) -> float:
+        """The compression ratio (raw size / compressed size), 1.0 before any batch."""
+        if not self.compressed_bytes:
+            return 1.0
+        return self.raw_bytes / self.compressed_bytes
+
+    def __repr__(self) -> str:
+        return (f"CompressionStats(batches={self.batches}, ratio={self.ratio:.2f}, "
+                f"cpu_time={self.cpu_time:.6f})")
+
+
+def check_codec(codec: str) -> None:
+    """Raise a ValueError if the codec is unknown or not installed."""
+    if codec not in CODECS:
+        raise ValueError(f"Unknown compression {codec!r}, expected one of {CODECS}")
+    if codec not in COMPRESSORS:
+        package = "lz4" if codec == "lz4" else "zstandard"
+        raise ValueError(f"The {codec!r} compression requires the {package} package")
+
+
+def _to_bytes(value):
+    # same conversion as the Redis client encoder
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, memoryview):
+        return value.tobytes()
+    if isinstance(value, str):
+        return value.encode()
+    if isinstance(value, float):
+        return repr(value).encode()
+    return str(value).encode()
+
+
+def pack_batch(logs, codec: str = "zlib", stats: CompressionStats = None) -> bytes:
+    """Frame and compress a batch of logs.
+
+    Parameters
+    ----------
+    logs : list
+        The logs, either stream entries (dicts) or pub/sub messages (str or bytes).
+    codec : str, optional
+        The compression codec, "zlib", "lz4" or "zstd", by default "zlib".
+    stats : CompressionStats, optional
+        If set, updated with the sizes and the CPU time of the batch.
+
+    Returns
+    -------
+    bytes
+        The packed batch.
+    """
+    start = time.thread_time()
+    frames = [_UINT32.pack(len(logs))]
+    for log in logs:
+        items = [_to_bytes(item) for field in log.items() for item in field] \
+            if isinstance(log, dict) else [_to_bytes(log)]
+        frames.append(_UINT32.pack(len(items)))
+        for item in items:
+            frames.append(_UINT32.pack(len(item)))
+            frames.append(item)
+    raw = b"".join(frames)
+    packed = HEADER.pack(MAGIC, BATCH_FORMAT_VERSION, CODECS.index(codec)) + \
+        COMPRESSORS[codec][0](raw)
+    if stats is not None:
+        stats.batches += 1
+        stats.raw_bytes += len(raw)
+        stats.compressed_bytes += len(packed)
+        stats.cpu_time += time.thread_time() - start
+    return packed
+
+
+def is_batch(data) -> bool:
+    """Return True if the data is a batch packed by `pack_batch`."""
+    return isinstance(data, bytes) and data[:3] == MAGIC
+
+
+def unpack_batch(data: bytes) -> list:
+    """Decompress a batch packed by `pack_batch`.
+
+    Parameters
+    ----------
+    data : bytes
+        The packed batch.
+
+    Returns
+    -------
+    list(list(bytes))
+        The items of each log of the batch.
+
+    Raises
+    ------
+    ValueError
+        Raised if the data is not a packed batch or if its codec is not installed.
+    """
+    if not is_batch(data) or len(data) < HEADER.size:
+        raise ValueError("The data is not a packed batch")
+    _, version, codec_index = HEADER.unpack_from(data)
+    if version != BATCH_FORMAT_VERSION or codec_index >= len(CODECS):
+        raise ValueError(f"Unsupported batch format version {version}")
+    codec = CODECS[codec_index]
+    check_codec(codec)
+    raw = COMPRESSORS[codec][1](data[HEADER.size:])
+
+    logs = []
+    (count,), offset = _UINT32.unpack_from(raw), _UINT32.size
+    for _ in range(count):
+        (nitems,), offset = _UINT32.unpack_from(raw, offset), offset + _UINT32.size
+        items = []
+        for _ in range(nitems):
+            (length,), offset = _UINT32.unpack_from(raw, offset), offset + _UINT32.size
+            items.append(raw[offset:offset + length])
+            offset += length
+        logs.append(items)
+    return logs
+
+
+def unpack_stream_entry(fields: dict) -> list:
+    """Return the logs of a stream entry, unpacking it if it is a packed batch.
+
+    Parameters
+    ----------
+    fields : dict
+        The fields of the stream entry, as returned by a Redis client created with
+        `decode_responses=False`.
+
+    Returns
+    -------
+    list(dict)
+        The entries of the batch with bytes keys and values, or `[fields]` if the entry
+        is not a packed batch.
+    """
+    data = fields.get(b"batch")
+    if data is None or not is_batch(data):
+        return [fields]
+    return [dict(zip(items[::2], items[1::2])) for items in unpack_batch(data)]
+
+
+def unpack_message(data) -> list:
+    """Return the logs of a pub/sub message, unpacking it if it is a packed batch.
+
+    Parameters
+    ----------
+    data : bytes
+        The message data, as returned by a Redis client created with
+        `decode_responses=False`.
+
+    Returns
+    -------
+    list(bytes)
+        The messages of the batch, or `[data]` if the message is not a packed batch.
+    """
+    if not is_batch(data):
+        return [data]
+    return [items[0] for items in unpack_batch(data)]
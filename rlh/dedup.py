@@ -0,0 +1,110 @@
+"""
+This module contains the collapsing of the repeated records of a batch, used by the
+handlers created with `dedup`.
+
+The handler captures the records instead of formatting them, and when a batch is sent
+its records are grouped by logger, level and message ("exact"), or by logger, level and
+message template whatever the arguments ("template"). Each group is formatted once, as
+the first record of the group with the `count`, `first_created` and `last_created`
+attributes, which are also added to the fields of the logs saved as fields or JSON. A
+record that is not repeated is sent as it is. The records with an exception are never
+collapsed.
+"""
+
+import logging
+
+DEDUP_MODES = (
+    "exact",    # same logger, level and formatted message
+    "template"  # same logger, level and message template, the arguments may differ
+)
+
+# attributes set on the record standing for a group of repeated records
+REPEATED_FIELDS = ("count", "first_created", "last_created")
+
+
+class RepeatedRecord:
+    """A captured record standing for the `count` repeated records of a batch.
+
+    Attributes
+    ----------
+    captured : rlh.handlers.CapturedRecord
+        The first record of the group.
+    count : int
+        The number of records of the group.
+    first_created : float
+        The creation time of the oldest record of the group.
+    last_created : float
+        The creation time of the most recent record of the group.
+    """
+
+    __slots__ = ("captured", "count", "first_created", "last_created")
+
+    def __init__(self, captured) -> None:
+        self.captured = captured
+        self.count = 1
+        self.first_created = self.last_created = captured.attrs["created"]
+
+    def add(self, created: float) -> None:
+        """Count another record of the group, created at `created`."""
+        self.count += 1
+        if created < self.first_created:
+            self.first_created = created
+        elif created > self.last_created:
+            self.last_created = created
+
+    def restore(self) -> logging.LogRecord:
+        """Return the first record of the group, copied with the count and the creation
+        times of the group if it was repeated."""
+        record = self.captured.restore()
+        if self.count == 1:
+            return record
+        record = logging.makeLogRecord(record.__dict__)
+        record.count = self.count
+        record.first_created = self.first_created
+        record.last_created = self.last_created
+        return record
+
+
+def _record_key(captured, mode):
+    """Return the key grouping a captured record, None if it must not be collapsed."""
+    record = captured.record
+    if record.exc_info or record.stack_info:
+        return None
+    msg = str(captured.msg)
+    if mode == "exact" and captured.args:
+        try:
+            msg = msg % captured.args
+        except Exception:  # pylint: disable=broad-except
+            # the formatting error is reported when the record is formatted
+            return None
+    return (captured.attrs["name"], captured.attrs["levelno"], msg)
+
+
+def collapse_records(captured_records: list, mode: str) -> list:
+    """Group the repeated records of a batch.
+
+    Parameters
+    ----------
+    captured_records : list(rlh.handlers.CapturedRecord)
+        The captured records of the batch, oldest first.
+    mode : str
+        How the records are compared, one of `DEDUP_MODES`.
+
+    Returns
+    -------
+    list(RepeatedRecord)
+        A record per group, in the order of the first record of each group.
+    """
+    groups = {}
+    repeated_records = []
+    for captured in captured_records:
+        key = _record_key(captured, mode)
+        repeated = groups.get(key) if key is not None else None
+        if repeated is None:
+            repeated = RepeatedRecord(captured)
+            repeated_records.append(repeated)
+            if key is not None:
+                groups[key] = repeated
+        else:
+            repeated.add(captured.attrs["created"])
+    return repeated_records
@@ -0,0 +1,183 @@
+"""
+This module contains the rate limiting and sampling filters of the handlers, created
+with `rate_limit` and `sample`. They are standard `logging.Filter` objects, called by
+`Handler.handle` before the record is formatted, so that a suppressed record costs
+little more than a dict lookup.
+
+The filters count the records they suppress, the handler periodically logs these counts
+as a summary entry so that the volume of the suppressed logs stays visible. The filters
+take no lock, relying on the GIL: with many threads, a few more records than the rate
+may be let through and a few suppressed records may be missed by the counts.
+"""
+
+import collections
+import logging
+import random
+import time
+
+
+def _record_key(record, key):
+    """Return the key of a record, a (logger name, level name) pair for "name_level"."""
+    if key == "name_level":
+        return (record.name, record.levelname)
+    return getattr(record, key, None)
+
+
+class TokenBucket:
+    """Token bucket allowing `rate` events per second, with bursts of `burst` events.
+
+    Attributes
+    ----------
+    rate : float
+        The number of tokens added per second.
+    burst : float
+        The maximum number of tokens.
+    tokens : float
+        The number of tokens left.
+    """
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self, now: float) -> bool:
+        """Take a token, return False if there is none left."""
+        self.tokens = min(self.tokens + (now - self.updated) * self.rate, self.burst)
+        self.updated = now
+        if self.tokens < 1:
+            return False
+        self.tokens -= 1
+        return True
+
+
+class RateLimitFilter(logging.Filter):
+    """Suppress the records beyond `rate` records per second, for each logger and level.
+
+    Attributes
+    ----------
+    rate : float
+        The number of records per second let through for each key.
+    burst : float
+        The number of records let through at once after a quiet period.
+    key : str
+        The record attribute the buckets are keyed by, or "name_level" for a bucket per
+        logger and level.
+    suppressed : dict
+        The number of records suppressed by key since the last summary.
+    dropped : int
+        The number of records suppressed since the filter was created.
+    """
+
+    def __init__(self, rate: float, burst: float = None, key: str = "name_level") -> None:
+        super().__init__()
+        self.rate = rate
+        self.burst = burst if burst is not None else max(rate, 1)
+        self.key = key
+        self.suppressed = {}
+        self.dropped = 0
+        self._buckets = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = _record_key(record, self.key)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+        if bucket.take(time.monotonic()):
+            return True
+        suppressed = self.suppressed
+        suppressed[key] = suppressed.get(key, 0) + 1
+        self.dropped += 1
+        return False
+
+    def pop_suppressed(self) -> collections.Counter:
+        """Return the records suppressed since the last call, and reset them."""
+        suppressed, self.suppressed = self.suppressed, {}
+        return collections.Counter(suppressed)
+
+    def reset(self) -> None:
+        """Forget the suppressed records, in a child process after a fork."""
+        self.suppressed = {}
+
+
+class SamplingFilter(logging.Filter):
+    """Let through a random fraction of the records of each level.
+
+    Attributes
+    ----------
+    rates : dict
+        The fraction of the records let through, by level number. The records of a level
+        missing from it use the fraction of the closest lower level, or are all let
+        through.
+    suppressed : dict
+        The number of records sampled out by (logger name, level name) since the last
+        summary.
+    dropped : int
+        The number of records sampled out since the filter was created.
+    """
+
+    def __init__(self, rates, seed: int = None) -> None:
+        super().__init__()
+        if not isinstance(rates, dict):
+            rates = {logging.NOTSET: rates}
+        self.rates = dict(sorted(rates.items()))
+        self.suppressed = {}
+        self.dropped = 0
+        self._random = random.Random(seed).random
+        # fraction by level number, computed for each level the first time it is seen
+        self._level_rates = {}
+
+    def _rate(self, levelno):
+        rate = 1.0
+        for level, level_rate in self.rates.items():
+            if level > levelno:
+                break
+            rate = level_rate
+        self._level_rates[levelno] = rate
+        return rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self._level_rates.get(record.levelno)
+        if rate is None:
+            rate = self._rate(record.levelno)
+        if rate >= 1 or self._random() < rate:
+            return True
+        key = (record.name, record.levelname)
+        suppressed = self.suppressed
+        suppressed[key] = suppressed.get(key, 0) + 1
+        self.dropped += 1
+        return False
+
+    def pop_suppressed(self) -> collections.Counter:
+        """Return the records sampled out since the last call, and reset them."""
+        suppressed, self.suppressed = self.suppressed, {}
+        return collections.Counter(suppressed)
+
+    def reset(self) -> None:
+        """Forget the suppressed records, in a child process after a fork."""
+        self.suppressed = {}
+
+
+def summary_record(rate_limited: collections.Counter, sampled: collections.Counter,
+                   interval: float) -> logging.LogRecord:
+    """Return the record logging the number of suppressed records.
+
+    The counts are also set as the `rate_limited` and `sampled` attributes of the record,
+    as dicts keyed by "<logger>:<level>" (or by the value of the rate limit key).
+    """
+    def as_dict(counter):
+        return {":".join(key) if isinstance(key, tuple) else str(key): count
+                for key, count in counter.most_common()}
+
+    rate_limited, sampled = as_dict(rate_limited), as_dict(sampled)
+    record = logging.LogRecord(
+        "rlh.suppressed", logging.WARNING, __file__, 0,
+        "%d records suppressed in the last %.0fs (rate limited: %s, sampled out: %s)",
+        (sum(rate_limited.values()) + sum(sampled.values()), interval, rate_limited, sampled),
+        None)
+    record.rate_limited = rate_limited
+    record.sampled = sampled
+    return record
@@ -3,18 +3,148 @@ This module contains handlers that can be used to forward logs from python loggi
 to a Redis database.
 """
 
+import collections
+import datetime
+import decimal
+import fractions
 import logging
 import pickle
-import json
+import functools
+import itertools
+import queue
+import sys
+import threading
+import os
+import time
+import traceback
+import uuid
+import weakref
+import zlib
 
 import redis
 
+from rlh.aggregator import AggregatorClient
+from rlh.clients import dedicated_client, get_client, ping_once
+from rlh.filters import RateLimitFilter, SamplingFilter, summary_record
+from rlh.compression import CompressionStats, check_codec, pack_batch
+from rlh.dedup import DEDUP_MODES, REPEATED_FIELDS, collapse_records
+from rlh.metrics import HandlerMetrics
+from rlh.records import encode_record
+from rlh.ring import RingBuffer
+from rlh.serializers import get_serializer
+from rlh.spill import ADOPT_INTERVAL, RETRY_ERRORS, CircuitBreaker, SpillBuffer
+
 DEFAULT_FIELDS = [
     "msg",          # the log message
     "levelname",    # the log level
     "created"       # the log timestamp
 ]
 
+# attributes that every log record has, fields taken among them need no presence check
+RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", None, None)))
+
+# attributes of the captured records kept as they were when emitted, besides the fields
+CAPTURED_ATTRIBUTES = ("name", "levelno", "levelname", "created")
+
+OVERFLOW_POLICIES = (
+    "block",        # wait for room in the queue
+    "drop_newest",  # discard the record being emitted
+    "drop_oldest"   # discard the oldest queued record
+)
+
+# sentinel used to stop the writer thread
+_STOP = object()
+
+# handlers whose state is reset in the child processes after a fork
+_HANDLERS = weakref.WeakSet()
+
+# error replied by XADD when the ID is not above the last ID of the stream
+DUPLICATE_ID_ERROR = "equal or smaller than the target stream top item"
+
+# types of the log messages and arguments that can be formatted later, as they cannot
+# be mutated
+IMMUTABLE_TYPES = frozenset((
+    str, bytes, int, float, complex, bool, type(None), decimal.Decimal, fractions.Fraction,
+    datetime.datetime, datetime.date, datetime.time, datetime.timedelta, uuid.UUID,
+))
+
+# appends a whole batch to a stream in a single call, ARGV holds the trimming strategy
+# ("MAXLEN", "MINID" or "" if the stream is not trimmed), its threshold, "1" if the
+# trimming is approximate, the LIMIT ("" if none), "1" to trim once after the batch
+# with XTRIM instead of on each XADD, the highest ID of the logs attempted before (""
+# if the IDs are assigned by Redis), then for each log its number of fields, its ID if
+# given, followed by the fields and values. It returns the number of logs skipped as
+# duplicates and the number of logs added with a new ID
+XADD_BATCH_SCRIPT = """
+local trim = {}
+if ARGV[1] ~= '' then
+    trim[1] = ARGV[1]
+    if ARGV[3] == '1' then
+        trim[#trim + 1] = '~'
+    end
+    trim[#trim + 1] = ARGV[2]
+    if ARGV[4] ~= '' then
+        trim[#trim + 1] = 'LIMIT'
+        trim[#trim + 1] = ARGV[4]
+    end
+end
+local trim_after = ARGV[5] == '1'
+local cmd = {'XADD', KEYS[1]}
+if not trim_after then
+    for _, arg in ipairs(trim) do
+        cmd[#cmd + 1] = arg
+    end
+end
+cmd[#cmd + 1] = '*'
+local prefix = #cmd
+local with_ids = ARGV[6] ~= ''
+local attempted_ms, attempted_seq
+if with_ids then
+    attempted_ms, attempted_seq = string.match(ARGV[6], '(%d+)-(%d+)')
+    attempted_ms, attempted_seq = tonumber(attempted_ms), tonumber(attempted_seq)
+end
+local i = 7
+local duplicates = 0
+local conflicts = 0
+while i <= #ARGV do
+    local nfields = tonumber(ARGV[i])
+    if with_ids then
+        i = i + 1
+        cmd[prefix] = ARGV[i]
+    end
+    for j = 1, 2 * nfields do
+        cmd[prefix + j] = ARGV[i + j]
+    end
+    for j = prefix + 2 * nfields + 1, #cmd do
+        cmd[j] = nil
+    end
+    if with_ids then
+        local reply = redis.pcall(unpack(cmd))
+        if type(reply) == 'table' and reply.err then
+            if not string.find(tostring(reply.err), 'equal or smaller', 1, true) then
+                return reply
+            end
+            local ms, seq = string.match(ARGV[i], '(%d+)-(%d+)')
+            ms, seq = tonumber(ms), tonumber(seq)
+            if ms < attempted_ms or (ms == attempted_ms and seq <= attempted_seq) then
+                duplicates = duplicates + 1
+            else
+                cmd[prefix] = '*'
+                redis.call(unpack(cmd))
+                conflicts = conflicts + 1
+            end
+        end
+    else
+        redis.call(unpack(cmd))
+    end
+    i = i + 1 + 2 * nfields
+end
+if trim_after and #trim > 0 then
+    redis.call('XTRIM', KEYS[1], unpack(trim))
+end
+return {duplicates, conflicts}
+"""
+
 
 class RedisLogHandler(logging.Handler):
     """Default class for Redis log handlers.
@@ -27,15 +157,93 @@ class RedisLogHandler(logging.Handler):
         The batch size, if this value is > 1, logs will be processed by batches.
     log_buffer : list
         The list containing the batched logs.
+    background : bool
+        If true, logs are sent to Redis by a dedicated writer thread.
+    queue_size : int
+        The capacity of the queue feeding the writer thread.
+    overflow : str
+        The policy applied when the queue is full, one of `OVERFLOW_POLICIES`.
+    close_timeout : float
+        The maximum time in seconds spent draining the queue on close.
+    flush_interval : float
+        The maximum time in seconds a log waits in the buffer before being sent.
+    batch_bytes : int
+        The approximate buffer size in bytes above which the buffer is sent.
+    transaction : bool
+        If true, each batch is sent in a MULTI/EXEC transaction.
+    compression : str
+        The codec used to pack each batch into a single compressed log, None if the logs
+        are sent individually.
+    compression_stats : rlh.compression.CompressionStats
+        The compression ratio and CPU cost of the packed batches.
+    max_buffer_bytes : int
+        The approximate size in bytes above which the buffer rejects new logs.
+    max_buffer_entries : int
+        The number of logs above which the buffer rejects new logs.
+    shed_level : int
+        The level below which logs are shed first.
+    shed_threshold : float
+        The fraction of the buffer limits from which logs below `shed_level` are shed.
+    buffer_bytes : int
+        The approximate size in bytes of the buffered logs, tracked if `batch_bytes` or
+        `max_buffer_bytes` is set.
+    dropped : int
+        The number of logs discarded because the queue or the buffer was full, or
+        because the writer thread failed to send them.
+    dropped_by_level : collections.Counter
+        The number of logs discarded because the buffer was full, by level name.
+    spill : rlh.spill.SpillBuffer
+        The buffer on disk of the batches that could not be sent, None if disabled.
+    breaker : rlh.spill.CircuitBreaker
+        The circuit breaker spacing out the delivery attempts while Redis is down.
+    metrics : rlh.metrics.HandlerMetrics
+        The counters and flush latency histogram of the handler, None if disabled.
+    aggregator : str
+        The path of the Unix socket of the aggregator the batches are sent to instead of
+        Redis, None to send them to Redis.
+    ring_slots : int
+        The number of slots of the ring buffer feeding the writer thread, None if the
+        writer is fed by a queue.
+    ring_slot_size : int
+        The size in bytes of a slot of the ring buffer.
+    defer_format : bool
+        If true, the logs are formatted by the writer thread instead of `emit`.
+    rate_limiter : rlh.filters.RateLimitFilter
+        The filter suppressing the records beyond `rate_limit`, None if disabled.
+    sampler : rlh.filters.SamplingFilter
+        The filter sampling the records, None if disabled.
+    summary_interval : float
+        The minimum time in seconds between two logs of the suppressed records.
 
     Methods
     -------
     emit(record: logging.LogRecord)
         This method is intended to be implemented by subclasses and so raises a NotImplementedError.
+    stats()
+        Return a snapshot of the handler metrics.
     """
 
+    # class of the client built from the Redis arguments
+    client_class = redis.Redis
+    # class of the pool of the dedicated connection
+    blocking_pool_class = redis.BlockingConnectionPool
+
     def __init__(self, redis_client: redis.Redis = None, batch_size: int = 1,
-                 check_conn: bool = True,  **redis_args) -> None:
+                 check_conn=True, background: bool = False,
+                 queue_size: int = 10000, overflow: str = "block",
+                 close_timeout: float = 5.0, flush_interval: float = None,
+                 batch_bytes: int = None, transaction: bool = False,
+                 compression: str = None, spill_dir: str = None,
+                 spill_max_bytes: int = 64 * 2 ** 20, retry_backoff: tuple = (0.5, 30.0),
+                 max_buffer_bytes: int = None, max_buffer_entries: int = None,
+                 shed_level: int = logging.WARNING, shed_threshold: float = 0.5,
+                 metrics: bool = True, metrics_hook=None, aggregator: str = None,
+                 ring_slots: int = None, ring_slot_size: int = 512,
+                 defer_format: bool = False, rate_limit: float = None,
+                 rate_burst: float = None, rate_limit_key: str = "name_level",
+                 sample=None, summary_interval: float = 60.0, dedup: str = None,
+                 share_client: bool = True, dedicated_connection: bool = False,
+                 **redis_args) -> None:
         """Init RedisLogHandler
 
         Parameters
@@ -44,59 +252,960 @@ class RedisLogHandler(logging.Handler):
             The Redis client to forward logs to, by default None.
         batch_size : int, optional
             The batch size, if > 1 logs will be processed by batches, by default 1.
-        check_conn : bool, optional
+        check_conn : bool or str, optional
             Wether to check of not if the Redis is available with a ping, by default True.
+            With "background", the ping is sent from a thread so that the creation of
+            the handler does not wait for Redis, a failure is reported on stderr. With
+            "lazy", Redis is pinged from a thread until it answers, spacing out the
+            attempts with `retry_backoff`, and the logs are kept in the buffer until
+            then, bounded by `max_buffer_bytes` and `max_buffer_entries` (10000 logs
+            by default) or by the writer queue, whose "block" overflow policy drops the
+            logs instead until then (see `ready`). A shared client that already
+            answered a ping is not checked again.
+        background : bool, optional
+            Wether to deliver the logs from a dedicated writer thread, in which case `emit`
+            only enqueues the log and never waits for Redis, by default False.
+        queue_size : int, optional
+            The capacity of the writer queue, if 0 the queue is unbounded, by default 10000.
+        overflow : str, optional
+            What to do when the writer queue is full: "block" until there is room,
+            "drop_newest" or "drop_oldest", by default "block".
+        close_timeout : float, optional
+            The maximum time in seconds spent draining the writer queue when the
+            handler is closed, the writer then stops after the batch it is sending and
+            the logs left are dropped, by default 5.0.
+        flush_interval : float, optional
+            The maximum time in seconds a log can wait in the buffer, the buffer is sent as
+            soon as the oldest log reaches this age, by default None (no limit).
+        batch_bytes : int, optional
+            The approximate size in bytes from which the buffer is sent, by default None
+            (no limit).
+
+        transaction : bool, optional
+            Wether to wrap each batch in a MULTI/EXEC transaction, by default False.
+        compression : str, optional
+            If set, each batch is packed into a single log compressed with this codec:
+            "zlib", "lz4" or "zstd" (see `rlh.compression`), by default None.
+        spill_dir : str, optional
+            If set, the batches that cannot be sent because Redis is unreachable are
+            written to segment files in this directory, and replayed in order by a
+            background thread once Redis answers again, by default None.
+        spill_max_bytes : int, optional
+            The maximum size of the spilled batches, the batches are dropped beyond it,
+            by default 64 MiB.
+        retry_backoff : tuple(float, float), optional
+            The minimum and maximum delays in seconds between two delivery attempts
+            while Redis is unreachable, by default (0.5, 30.0).
+        max_buffer_bytes : int, optional
+            The approximate size in bytes from which the buffer rejects new logs, when
+            they pile up because Redis fails, by default None (no limit).
+        max_buffer_entries : int, optional
+            The number of logs from which the buffer rejects new logs, by default None
+            (no limit).
+        shed_level : int, optional
+            The logs below this level are shed first: they are rejected as soon as the
+            buffer reaches `shed_threshold` of its limits, while the other logs evict the
+            oldest buffered logs below it once the limits are reached, and are only
+            rejected when there is none left, by default logging.WARNING.
+        shed_threshold : float, optional
+            The fraction of the buffer limits from which the logs below `shed_level` are
+            rejected, by default 0.5.
+        metrics : bool, optional
+            Wether to keep the counters and the flush latency histogram returned by
+            `stats`, by default True.
+        metrics_hook : callable, optional
+            A function called after each batch with the number of logs, their
+            approximate size in bytes, the time taken to send them and wether it failed,
+            to export the metrics (see `rlh.metrics`). Its errors are reported on
+            stderr, they never fail the delivery, by default None.
+        aggregator : str, optional
+            The path of the Unix socket of a `rlh.aggregator.LogAggregator`. If set, the
+            batches are sent to the aggregator, which forwards the logs of all the
+            processes of the host to Redis, and Redis is not checked, by default None.
+        ring_slots : int, optional
+            If set with `background`, the logs are handed to the writer thread through a
+            preallocated ring buffer of this many slots (see `rlh.ring`) instead of a
+            queue. The logs must be serialized as bytes, by default None.
+        ring_slot_size : int, optional
+            The size in bytes of a slot of the ring buffer, larger logs are kept aside,
+            by default 512.
+        defer_format : bool, optional
+            Wether to let the writer thread format the logs (message interpolation and
+            serialization), `emit` then only captures the record with its message and
+            arguments. Arguments that could be mutated after `emit` are formatted right
+            away. It only applies to background and asyncio handlers, by default False.
+        rate_limit : float, optional
+            If set, the records beyond this number per second are suppressed, for each
+            logger and level (see `rlh.filters.RateLimitFilter`), by default None.
+        rate_burst : float, optional
+            The number of records let through at once after a quiet period, by default
+            `rate_limit`.
+        rate_limit_key : str, optional
+            The record attribute the rate is limited by, e.g. "name" for a limit per
+            logger, by default "name_level" (per logger and level).
+        sample : float or dict, optional
+            The fraction of the records kept, or a dict of the fraction by level, a
+            level missing from it using the fraction of the closest lower level (e.g.
+            `{logging.DEBUG: 0.01, logging.INFO: 0.1, logging.WARNING: 1}`), by default
+            None (all kept).
+        summary_interval : float, optional
+            The minimum time in seconds between two logs of the number of records
+            suppressed by `rate_limit` and `sample`, the "rlh.suppressed" logger then
+            logs them as a warning, by default 60.0.
+        dedup : str, optional
+            If set, the repeated records of each batch are sent as a single log with
+            their count and the creation times of the first and last ones (see
+            `rlh.dedup`): "exact" collapses the records with the same logger, level and
+            message, "template" the ones with the same message template whatever its
+            arguments. The records are formatted when the batch is sent, which requires
+            `batch_size` > 1 or `flush_interval` to be useful, by default None.
+        share_client : bool, optional
+            Wether to share the client created from the Redis arguments with the other
+            handlers created with the same arguments, and so its connection pool (see
+            `rlh.clients`), by default True.
+        dedicated_connection : bool, optional
+            Wether to send the commands of the handler over a single connection of its
+            own, opened with the connection parameters of the client, instead of taking
+            a connection from the pool of the client for each batch, by default False.
+
+        The buffer is reset in the child processes after a fork, so that the logs of the
+        parent are not sent twice, and its threads and connections are recreated.
+
+        The buffer is sent as soon as one of `batch_size`, `batch_bytes` or `flush_interval`
+        is reached.
 
         Raises
         ------
         TypeError
             Raised if one of the aditional argument passed to Redis is invalid.
+        ValueError
+            Raised if the overflow policy, the compression codec or the dedup mode is
+            unknown, or if the ring buffer is used without `background`, with the
+            "drop_oldest" policy, with `defer_format` or with `dedup`.
         ConnectionError
             Raised if the Redis DB is unavailable.
         """
         super().__init__()
 
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}, got {overflow!r}")
+        if dedup is not None and dedup not in DEDUP_MODES:
+            raise ValueError(f"dedup must be one of {DEDUP_MODES}, got {dedup!r}")
+        if ring_slots is not None and (not background or overflow == "drop_oldest"
+                                       or defer_format or dedup is not None):
+            raise ValueError("The ring buffer requires background=True, the 'block' or "
+                             "'drop_newest' overflow policy and formatted logs")
+        if compression is not None:
+            check_codec(compression)
+
         if redis_client is not None:
             self.redis = redis_client
         else:
             try:
-                self.redis = redis.Redis(**redis_args)
+                self.redis = get_client(self.client_class, **redis_args) if share_client \
+                    else self.client_class(**redis_args)
             except TypeError as err:
                 raise TypeError(
                     "One of the argument passed to Redis is not valid") from err
+        if dedicated_connection:
+            self.redis = dedicated_client(self.redis, self.blocking_pool_class)
 
-        if check_conn:
+        self.aggregator = aggregator
+        self._aggregator = AggregatorClient(aggregator) if aggregator is not None else None
+
+        # set once Redis answered, the logs are only sent from then on
+        self._ready = threading.Event()
+        self._lazy = check_conn == "lazy" and aggregator is None
+        if not self._lazy:
+            self._ready.set()
+        if check_conn == "background" and aggregator is None:
+            threading.Thread(target=self._check_conn, name=f"{type(self).__name__}-ping",
+                             daemon=True).start()
+        elif check_conn and not self._lazy and aggregator is None:
             # trying to ping Redis DB
             try:
-                self.redis.ping()
+                ping_once(self.redis)
             except redis.exceptions.ConnectionError as err:
                 raise ConnectionError("Unable to ping Redis DB") from err
 
         self.batch_size = batch_size
         self.log_buffer = []
+        self.flush_interval = flush_interval
+        self.batch_bytes = batch_bytes
+        if self._lazy and max_buffer_bytes is None and max_buffer_entries is None:
+            # the logs pile up in the buffer until Redis answers
+            max_buffer_entries = 10000
+        self.transaction = transaction
+        self.compression = compression
+        self.compression_stats = CompressionStats()
+        self.max_buffer_bytes = max_buffer_bytes
+        self.max_buffer_entries = max_buffer_entries
+        self.shed_level = shed_level
+        self.shed_threshold = shed_threshold
+
+        # size of the buffered logs and time at which the oldest one was buffered
+        self._buffer_bytes = 0
+        self._buffer_since = None
+        # levels of the buffered logs, to evict the lower ones when the buffer is full
+        self._buffer_levels = []
+        self._track_bytes = batch_bytes is not None or max_buffer_bytes is not None
+        self._bounded = max_buffer_bytes is not None or max_buffer_entries is not None
+
+        self.background = background
+        self.queue_size = queue_size
+        self.overflow = overflow
+        self.close_timeout = close_timeout
+        self.dropped = 0
+        self.dropped_by_level = collections.Counter()
+        self.metrics = HandlerMetrics(metrics_hook) if metrics or metrics_hook else None
+
+        # the flush lock is distinct from the handler lock, as `emit` may block on a
+        # full queue while holding the latter
+        self._flush_lock = threading.RLock()
+        self._queue = None
+        self.ring_slots = ring_slots
+        self.ring_slot_size = ring_slot_size
+        self._ring = None
+        self.defer_format = defer_format
+        self.dedup = dedup
+        self.collapsed = 0
+        # the logs are formatted in `emit` when it sends them itself, unless the repeated
+        # ones are collapsed when the batch is sent
+        self._defer = (defer_format and background) or dedup is not None
+        self._writer = None
+        self._flusher = None
+        self._closing = threading.Event()
+        # set when `close_timeout` expired, the writer stops after the batch it sends
+        self._abort = threading.Event()
+        # the number of logs of the ring sent by the writer, and wether it was stopped
+        self._sending = 0
+        self._stop_queued = False
+
+        # the filters are applied by `handle`, before the records are formatted
+        self.sampler = SamplingFilter(sample) if sample is not None else None
+        self.rate_limiter = RateLimitFilter(rate_limit, rate_burst, rate_limit_key) \
+            if rate_limit is not None else None
+        self._suppressors = [flt for flt in (self.sampler, self.rate_limiter)
+                             if flt is not None]
+        for flt in self._suppressors:
+            self.addFilter(flt)
+        self.summary_interval = summary_interval
+        self._summary_since = time.monotonic()
+
+        self.breaker = CircuitBreaker(min_backoff=retry_backoff[0],
+                                      max_backoff=retry_backoff[1])
+        self.spill = None
+        self._replayer = None
+        self._replay_wakeup = threading.Event()
+        if spill_dir is not None:
+            self.spill = SpillBuffer(spill_dir, spill_max_bytes)
+        self._start_threads()
+        _HANDLERS.add(self)
+
+    def _check_conn(self):
+        """Ping Redis, reporting a failure as `handleError` would."""
+        try:
+            ping_once(self.redis)
+        except redis.exceptions.ConnectionError:
+            self._handle_writer_error()
+
+    def _connect_loop(self):
+        """Ping Redis until it answers or the handler is closed, then send the buffered
+        logs."""
+        while not self._closing.is_set():
+            if self.breaker.allow():
+                try:
+                    ping_once(self.redis)
+                except RETRY_ERRORS:
+                    self.breaker.failure()
+                else:
+                    self.breaker.success()
+                    self._ready.set()
+                    break
+            self._closing.wait(self.breaker.delay())
+        if not self._ready.is_set():
+            return
+        with self._flush_lock:
+            if self.log_buffer:
+                try:
+                    self._flush()
+                except Exception:  # pylint: disable=broad-except
+                    # the buffer is kept, it will be sent again on the next attempt
+                    self._buffer_since = time.monotonic()
+                    self._handle_writer_error()
+
+    def _wait_ready(self):
+        """Wait until Redis answered or the handler is closed, in the writer thread."""
+        while not self._ready.wait(0.1) and not self._closing.is_set():
+            pass
+
+    def ready(self, timeout: float = 0) -> bool:
+        """Return wether Redis answered and the logs are sent, with `check_conn="lazy"`,
+        e.g. for a readiness probe. The handlers not created with "lazy" are always ready.
+
+        Parameters
+        ----------
+        timeout : float, optional
+            The maximum time in seconds to wait for Redis to answer, None to wait until it
+            does, by default 0.
+
+        Returns
+        -------
+        bool
+            True if Redis answered.
+        """
+        return self._ready.wait(timeout)
+
+    def _start_threads(self):
+        if not self._ready.is_set():
+            threading.Thread(target=self._connect_loop,
+                             name=f"{type(self).__name__}-connector", daemon=True).start()
+        if self.spill is not None:
+            self._start_replayer()
+        if self.background:
+            self._start_writer()
+        elif self.flush_interval is not None:
+            self._start_flusher()
+
+    def _after_fork(self):
+        """Reset the state inherited from the parent process, in the child process.
+
+        The buffered and queued logs are discarded as the parent sends them, and the
+        threads, which do not survive a fork, are started again. The child spills its
+        batches to the directory of the parent, in segments named after its pid which
+        the parent takes over once the child exited.
+        """
+        self._flush_lock = threading.RLock()
+        self.log_buffer = []
+        self._buffer_bytes = 0
+        self._buffer_since = None
+        self._buffer_levels = []
+        self._queue = None
+        self._ring = None
+        self._writer = None
+        self._flusher = None
+        self._replayer = None
+        self._closing = threading.Event()
+        self._abort = threading.Event()
+        self._sending = 0
+        self._stop_queued = False
+        self._replay_wakeup = threading.Event()
+        ready, self._ready = self._ready.is_set(), threading.Event()
+        if ready:
+            self._ready.set()
+        self.dropped = 0
+        self.dropped_by_level = collections.Counter()
+        self.collapsed = 0
+        if self.metrics is not None:
+            self.metrics = HandlerMetrics(self.metrics.hook)
+        for flt in self._suppressors:
+            # the parent logs the records it suppressed
+            flt.reset()
+        self._summary_since = time.monotonic()
+        self.breaker = CircuitBreaker(min_backoff=self.breaker.min_backoff,
+                                      max_backoff=self.breaker.max_backoff)
+        if self.spill is not None:
+            self.spill = SpillBuffer(self.spill.directory, self.spill.max_bytes,
+                                     self.spill.segment_bytes)
+        if self._aggregator is not None:
+            self._aggregator = AggregatorClient(self.aggregator)
+        pool = getattr(self.redis, "connection_pool", None)
+        if pool is not None:
+            # the connections of the parent must not be used by the child
+            pool.reset()
+        self._start_threads()
+
+    @property
+    def buffer_bytes(self):
+        """The approximate size in bytes of the buffered logs."""
+        return self._buffer_bytes
+
+    @property
+    def fields(self):
+        """The list of logs fields to forward, compiled into an extractor when set."""
+        return self._fields
+
+    @fields.setter
+    def fields(self, fields):
+        self._fields = fields
+        if self.dedup is not None:
+            # the fields of the repeated records are only set on the collapsed ones
+            fields = list(fields or DEFAULT_FIELDS) + list(REPEATED_FIELDS)
+        self._extract_fields = _compile_fields(fields)
+        # the message and its arguments are captured apart
+        self._captured_attrs = tuple(dict.fromkeys(
+            CAPTURED_ATTRIBUTES + tuple(field for field in self._fields or DEFAULT_FIELDS
+                                        if field not in ("msg", "args"))))
+
+    def handle(self, record: logging.LogRecord):
+        """Filter the record and emit it, logging the suppressed records first if
+        `summary_interval` elapsed."""
+        if (self._suppressors
+                and time.monotonic() - self._summary_since >= self.summary_interval):
+            self._emit_summary()
+        return super().handle(record)
+
+    def _emit_summary(self):
+        """Emit the number of records suppressed since the last summary, if any."""
+        now = time.monotonic()
+        interval = now - self._summary_since
+        self._summary_since = now
+        rate_limited = self.rate_limiter.pop_suppressed() \
+            if self.rate_limiter is not None else collections.Counter()
+        sampled = self.sampler.pop_suppressed() \
+            if self.sampler is not None else collections.Counter()
+        if not rate_limited and not sampled:
+            return
+        record = summary_record(rate_limited, sampled, interval)
+        self.acquire()
+        try:
+            self.emit(record)
+        finally:
+            self.release()
 
     def emit(self, record: logging.LogRecord) -> None:
+        """Format the log record, or capture it if `defer_format` is set, and send it or
+        hand it to the writer thread."""
+        if self._defer:
+            self._push(CapturedRecord(record, self._captured_attrs), record.levelno)
+        else:
+            self._push(self._format_record(record), record.levelno)
+
+    def _format_record(self, record):
         raise NotImplementedError(
-            "emit must be implemented by RedisLogHandler subclasses")
+            "_format_record must be implemented by RedisLogHandler subclasses")
+
+    def _format_captured(self, captured):
+        """Format a captured record, None if it fails, which is reported as `handleError`
+        would."""
+        try:
+            return self._format_record(captured.restore())
+        except Exception:  # pylint: disable=broad-except
+            self._handle_writer_error()
+            return None
+
+    def _collapse(self, entries):
+        """Format the captured records of a batch, each group of repeated records as a
+        single log. The logs already formatted by a failed flush come first."""
+        logs = [entry for entry in entries if entry.__class__ is not CapturedRecord]
+        if len(logs) == len(entries):
+            return logs
+        captured = [entry for entry in entries if entry.__class__ is CapturedRecord]
+        repeated = collapse_records(captured, self.dedup)
+        self.collapsed += len(captured) - len(repeated)
+        logs.extend(log for log in map(self._format_captured, repeated) if log is not None)
+        return logs
 
     def _buffer_emit(self):
+        """Emits the logs batched in log buffer."""
+        # the size of a collapsed buffer is not the one tracked
+        tracked = self._track_bytes and self.dedup is None
+        self._send(self.log_buffer, self._buffer_bytes if tracked else None)
+        self.log_buffer = []
+
+    def _send(self, logs, nbytes=None):
+        """Send the logs, to Redis or to the aggregator, recording the batch in the
+        metrics."""
+        send_logs = self._send_logs if self._aggregator is None else self._aggregator.send
+        if self.metrics is None:
+            send_logs(logs)
+            return
+        if nbytes is None:
+            nbytes = sum(map(_entry_size, logs))
+        start = time.perf_counter()
+        try:
+            send_logs(logs)
+        except Exception:
+            self._record_metrics(len(logs), nbytes, time.perf_counter() - start, True)
+            raise
+        self._record_metrics(len(logs), nbytes, time.perf_counter() - start)
+
+    def _record_metrics(self, count, nbytes, latency, error=False):
+        """Record a batch in the metrics, an error raised by `metrics_hook` is reported as
+        `handleError` would so that it never fails nor masks the delivery."""
+        try:
+            self.metrics.record_batch(count, nbytes, latency, error)
+        except Exception:  # pylint: disable=broad-except
+            self._handle_writer_error()
+
+    def _send_logs(self, logs):
+        raise NotImplementedError(
+            "_send_logs must be implemented by RedisLogHandler subclasses")
+
+    def _payload_entry(self, payload):
+        """Return the log to send from a serialized log read from the ring buffer."""
+        return payload
+
+    def _batch_entry(self, packed, count):
+        """Return the log holding a packed batch of `count` logs."""
         raise NotImplementedError(
-            "_buffer_emit must be implemented by RedisLogHandler subclasses")
+            "_batch_entry must be implemented by RedisLogHandler subclasses")
+
+    def _pack_logs(self, logs):
+        """Return the logs to send, packed into a single log if compression is enabled."""
+        if self.compression is None or not logs:
+            return logs
+        return [self._batch_entry(pack_batch(logs, self.compression, self.compression_stats),
+                                  len(logs))]
 
     def _check_buff_and_emit(self):
-        if len(self.log_buffer) >= self.batch_size:
+        if (len(self.log_buffer) >= self.batch_size
+                or (self.batch_bytes is not None and self._buffer_bytes >= self.batch_bytes)
+                or self._flush_delay() == 0):
+            self._flush()
+
+    def _append(self, entry):
+        """Add a formatted log to the buffer, keeping track of its size and age."""
+        if not self.log_buffer:
+            self._buffer_since = time.monotonic()
+        self.log_buffer.append(entry)
+        if self._track_bytes:
+            self._buffer_bytes += _entry_size(entry)
+
+    def _buffer_full(self, levelno):
+        """Return True if the buffer has no room left for a log of this level, None if
+        the level is unknown."""
+        shed = levelno is not None and levelno < self.shed_level
+        ratio = self.shed_threshold if shed else 1.0
+        return ((self.max_buffer_entries is not None
+                 and len(self.log_buffer) >= self.max_buffer_entries * ratio)
+                or (self.max_buffer_bytes is not None
+                    and self._buffer_bytes >= self.max_buffer_bytes * ratio))
+
+    def _evict(self, levelno):
+        """Drop the oldest buffered log below `shed_level` to make room for a log of
+        this level, returning False if there is none or if the log is below it too."""
+        if levelno is None or levelno < self.shed_level:
+            return False
+        for index, level in enumerate(self._buffer_levels):
+            if level is not None and level < self.shed_level:
+                break
+        else:
+            return False
+        del self._buffer_levels[index]
+        entry = self.log_buffer.pop(index)
+        if self._track_bytes:
+            self._buffer_bytes -= _entry_size(entry)
+        self.dropped += 1
+        self.dropped_by_level[logging.getLevelName(level)] += 1
+        return True
+
+    def _flush(self):
+        """Send the buffered logs and reset the buffer size and age."""
+        if not self._ready.is_set() and not self._closing.is_set():
+            # the logs are kept until Redis answers, then sent by the connector thread
+            self._buffer_since = time.monotonic()
+            return
+        if self.dedup is not None:
+            self.log_buffer = self._collapse(self.log_buffer)
+            if self._buffer_levels:
+                # the levels of the collapsed logs are not known
+                self._buffer_levels = [None] * len(self.log_buffer)
+        if not self.log_buffer:
+            pass
+        elif not self._ready.is_set():
+            # closed before Redis answered, the close must not fail on a connection error
+            if self.spill is None:
+                self.dropped += len(self.log_buffer)
+                self.log_buffer = []
+            else:
+                self._spill_buffer()
+        elif self.spill is None:
             self._buffer_emit()
+        else:
+            self._emit_or_spill()
+        self._buffer_bytes = 0
+        self._buffer_since = None
+        self._buffer_levels = []
+
+    def _retry_flush(self):
+        """Try to send a buffer that filled up because the flushes failed, spacing out
+        the attempts with the circuit breaker while Redis is unreachable."""
+        if not self.log_buffer or not self._ready.is_set() or not self.breaker.allow():
+            return
+        try:
+            self._flush()
+        except RETRY_ERRORS:
+            self.breaker.failure()
+        else:
+            self.breaker.success()
+
+    def _flush_delay(self):
+        """Return the time left before the buffer must be sent, None if it can wait."""
+        if self.flush_interval is None or self._buffer_since is None:
+            return None
+        return max(self._buffer_since + self.flush_interval - time.monotonic(), 0)
+
+    def _push(self, entry, levelno=logging.NOTSET):
+        """Add a formatted log to the buffer, or hand it to the writer thread.
+
+        The log is dropped if the buffer is still full for its level once a flush was
+        tried, the writer queue being bounded by `queue_size` and `overflow`. A log at or
+        above `shed_level` evicts the oldest buffered logs below it instead, while there
+        are some. The logs whose level is None are not shed before the buffer limits are
+        reached.
+        """
+        if self._ring is not None:
+            # the logs are not waited for until Redis answered, with `check_conn="lazy"`
+            if not self._ring.put(entry, self.overflow == "block" and self._ready.is_set()):
+                self.dropped += 1
+            return
+        if self._queue is None:
+            with self._flush_lock:
+                if self._bounded and self._buffer_full(levelno):
+                    self._retry_flush()
+                    while self._buffer_full(levelno):
+                        if not self._evict(levelno):
+                            self.dropped += 1
+                            if levelno is not None:
+                                self.dropped_by_level[logging.getLevelName(levelno)] += 1
+                            return
+                self._append(entry)
+                if self._bounded:
+                    self._buffer_levels.append(levelno)
+                self._check_buff_and_emit()
+        elif self.overflow == "block" and self._ready.is_set():
+            self._queue.put(entry)
+        elif self.overflow != "drop_oldest":
+            try:
+                self._queue.put_nowait(entry)
+            except queue.Full:
+                self.dropped += 1
+        else:
+            while True:
+                try:
+                    self._queue.put_nowait(entry)
+                    break
+                except queue.Full:
+                    try:
+                        self._queue.get_nowait()
+                        self.dropped += 1
+                    except queue.Empty:
+                        pass
+
+    def _start_writer(self):
+        if self.ring_slots is not None:
+            self._ring = RingBuffer(self.ring_slots, self.ring_slot_size)
+            target = self._ring_writer_loop
+        else:
+            self._queue = queue.Queue(maxsize=self.queue_size)
+            target = self._writer_loop
+        self._writer = threading.Thread(target=target,
+                                        name=f"{type(self).__name__}-writer",
+                                        daemon=True)
+        self._writer.start()
+
+    def _ring_writer_loop(self):
+        """Send the logs of the ring buffer by batches, until the ring is closed.
+
+        A batch is sent once `batch_size` logs are ready, or with the logs that are ready
+        when `flush_interval` expires, on flush and on close. The slots are released
+        once their logs are sent.
+        """
+        batch_size = max(self.batch_size, 1)
+        # the logs wait in the ring until Redis answers
+        self._wait_ready()
+        while not self._abort.is_set():
+            self._ring.wait(batch_size, self.flush_interval)
+            while not self._abort.is_set():
+                payloads = self._ring.peek(batch_size)
+                if not payloads:
+                    break
+                self._sending = len(payloads)
+                with self._flush_lock:
+                    self.log_buffer = [self._payload_entry(payload) for payload in payloads]
+                    try:
+                        self._flush()
+                    except Exception:  # pylint: disable=broad-except
+                        # the writer must survive Redis errors
+                        self.dropped += len(self.log_buffer)
+                        self.log_buffer = []
+                        self._handle_writer_error()
+                self._ring.release(len(payloads))
+                self._sending = 0
+                if len(payloads) < batch_size:
+                    break
+            if self._ring.closed and not self._ring:
+                break
+
+    def _writer_loop(self):
+        """Move the queued logs into the buffer and flush it, until stopped."""
+        # the logs wait in the queue until Redis answers
+        self._wait_ready()
+        running = True
+        while running:
+            try:
+                entries = [self._queue.get(timeout=self._flush_delay())]
+            except queue.Empty:
+                # the oldest buffered log is due
+                entries = []
+            # greedily take what is already queued so that pipelines stay large
+            while len(entries) < max(self.batch_size, 1):
+                try:
+                    entries.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            if self._abort.is_set():
+                # `close_timeout` expired, the logs left are dropped
+                with self._flush_lock:
+                    self.dropped += len(self.log_buffer) + sum(
+                        entry is not _STOP for entry in entries)
+                    self.log_buffer = []
+                break
+            if _STOP in entries:
+                entries = entries[:entries.index(_STOP)]
+                running = False
+            if self._defer and self.dedup is None:
+                entries = [entry for entry in map(self._format_captured, entries)
+                           if entry is not None]
+            with self._flush_lock:
+                try:
+                    for entry in entries:
+                        self._append(entry)
+                        self._check_buff_and_emit()
+                    if self.log_buffer and (not running or self._flush_delay() == 0):
+                        self._flush()
+                except Exception:  # pylint: disable=broad-except
+                    # the writer must survive Redis errors
+                    self.dropped += len(self.log_buffer)
+                    self.log_buffer = []
+                    self._buffer_bytes = 0
+                    self._buffer_since = None
+                    self._handle_writer_error()
+
+    def _emit_or_spill(self):
+        """Send the buffered logs, or spill them to disk if Redis is unreachable.
+
+        The logs are spilled without trying to send them while the breaker is open, and
+        while older batches are waiting to be replayed so that the order is kept.
+        """
+        if self.breaker.closed and not self.spill.pending:
+            try:
+                self._buffer_emit()
+                return
+            except RETRY_ERRORS:
+                self.breaker.failure()
+        self._spill_buffer()
+
+    def _spill_buffer(self):
+        """Spill the buffered logs to disk, to be replayed once Redis answers."""
+        # the logs read from the ring buffer are views on slots that will be reused
+        self.spill.append([_detach(log) for log in self.log_buffer]
+                          if self._ring is not None else self.log_buffer)
+        self.log_buffer = []
+        self._replay_wakeup.set()
+
+    def _start_replayer(self):
+        self._replayer = threading.Thread(target=self._replay_loop,
+                                          name=f"{type(self).__name__}-replayer",
+                                          daemon=True)
+        self._replayer.start()
+
+    def _replay_loop(self):
+        """Replay the spilled batches once Redis answers again, until closed."""
+        adopt_at = time.monotonic() + ADOPT_INTERVAL
+        while not self._closing.is_set():
+            delay = adopt_at - time.monotonic()
+            if self.spill.pending:
+                delay = min(self.breaker.delay(), delay)
+            self._replay_wakeup.wait(max(delay, 0))
+            self._replay_wakeup.clear()
+            if self._closing.is_set():
+                break
+            if time.monotonic() >= adopt_at:
+                # the batches spilled by the forked processes which exited
+                self.spill.adopt()
+                adopt_at = time.monotonic() + ADOPT_INTERVAL
+            if self.spill.pending and self.breaker.allow():
+                self._replay()
+
+    def _replay(self):
+        """Send the spilled batches in order, stopping at the first connection error."""
+        try:
+            self.redis.ping()
+            while not self._closing.is_set():
+                logs = self.spill.peek()
+                if logs is None:
+                    break
+                try:
+                    self._send(logs)
+                except RETRY_ERRORS:
+                    raise
+                except Exception:  # pylint: disable=broad-except
+                    # a batch Redis rejects would block the replay forever, it is skipped
+                    self._handle_writer_error()
+                self.spill.commit()
+        except RETRY_ERRORS:
+            self.breaker.failure()
+            return
+        self.breaker.success()
+
+    def _start_flusher(self):
+        self._flusher = threading.Thread(target=self._flusher_loop,
+                                         name=f"{type(self).__name__}-flusher",
+                                         daemon=True)
+        self._flusher.start()
+
+    def _flusher_loop(self):
+        """Send the buffer once its oldest log is `flush_interval` old, until closed."""
+        while True:
+            delay = self._flush_delay()
+            if self._closing.wait(self.flush_interval if delay is None else delay):
+                break
+            with self._flush_lock:
+                if self.log_buffer and self._flush_delay() == 0:
+                    try:
+                        self._flush()
+                    except Exception:  # pylint: disable=broad-except
+                        # the buffer is kept, it will be sent again on the next attempt
+                        self._buffer_since = time.monotonic()
+                        self._handle_writer_error()
+
+    def _stop_writer(self, timeout):
+        """Stop the writer thread, letting it drain the queue within `timeout` seconds.
+
+        Past the timeout, the writer stops after the batch it is sending and the logs
+        left in the queue or the ring are dropped.
+        """
+        deadline = time.monotonic() + timeout
+        if self._ring is not None:
+            self._ring.close()
+        else:
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+                self._stop_queued = True
+            except queue.Full:
+                pass
+        self._writer.join(max(deadline - time.monotonic(), 0))
+        if not self._writer.is_alive():
+            return
+        self._abort.set()
+        if self._ring is not None:
+            self.dropped += max(len(self._ring) - self._sending, 0)
+            return
+        while True:
+            try:
+                if self._queue.get_nowait() is not _STOP:
+                    self.dropped += 1
+            except queue.Empty:
+                break
+        # wake the writer up if it waits for a log
+        self._stop_queued = False
+        try:
+            self._queue.put_nowait(_STOP)
+            self._stop_queued = True
+        except queue.Full:
+            pass
+
+    def _handle_writer_error(self):
+        """Report an error raised in the writer thread, as `handleError` would."""
+        if logging.raiseExceptions and sys.stderr:
+            sys.stderr.write("--- Logging error ---\n")
+            traceback.print_exc(file=sys.stderr)
+
+    def _queue_depth(self):
+        if self._ring is not None:
+            # the logs left in the ring by a stopped writer are dropped
+            return len(self._ring) if not self._abort.is_set() else 0
+        if self._queue is None:
+            return 0
+        depth = self._queue.qsize()
+        if self._stop_queued and self._writer.is_alive():
+            # the stop sentinel is not a log
+            depth = max(depth - 1, 0)
+        return depth
+
+    def stats(self) -> dict:
+        """Return a snapshot of the handler metrics.
+
+        Returns
+        -------
+        dict
+            The counters of `metrics` (if enabled), the number of logs and the
+            approximate size of the buffer, the number of logs in the writer queue, the
+            dropped logs, the state of the circuit breaker, wether Redis answered
+            (`ready`), the spilled logs, the records suppressed by `rate_limit` and
+            `sample` and the records collapsed by `dedup`.
+            `records` is the number of logs handled so far, sent, dropped, collapsed or
+            waiting.
+        """
+        snapshot = self.metrics.snapshot() if self.metrics is not None else {}
+        # derived from the other counters, so that nothing is counted per log
+        records = (snapshot.get("logs_sent", 0) + self.dropped + self.collapsed
+                   + len(self.log_buffer) + self._queue_depth())
+        snapshot.update({
+            "buffer_depth": len(self.log_buffer),
+            "buffer_bytes": self._buffer_bytes,
+            "queue_depth": self._queue_depth(),
+            "dropped": self.dropped,
+            "dropped_by_level": dict(self.dropped_by_level),
+            "breaker": self.breaker.state,
+            "ready": self._ready.is_set(),
+        })
+        if self._aggregator is not None:
+            snapshot["aggregator_dropped"] = self._aggregator.dropped
+        if self.rate_limiter is not None:
+            snapshot["rate_limited"] = self.rate_limiter.dropped
+        if self.sampler is not None:
+            snapshot["sampled_out"] = self.sampler.dropped
+        if self.dedup is not None:
+            snapshot["collapsed"] = self.collapsed
+        if self.spill is not None:
+            records += self.spill.pending_logs + self.spill.dropped
+            snapshot["spilled_logs"] = self.spill.pending_logs
+            snapshot["spilled_bytes"] = self.spill.pending_bytes
+            snapshot["spill_dropped"] = self.spill.dropped
+        snapshot["records"] = records
+        return snapshot
+
+    def flush(self):
+        """Send the buffered logs to Redis without waiting for the batch to be complete."""
+        if self._ring is not None:
+            # the writer sends the logs of the ring
+            self._ring.kick()
+        with self._flush_lock:
+            if self.log_buffer:
+                self._flush()
 
     def close(self):
-        """Make sure to add all remaining logs in buffer to Redis before object is destroyed."""
-        if self.log_buffer:
-            self._buffer_emit()
-        super().close()
+        """Make sure to add all remaining logs in buffer to Redis before object is destroyed.
+
+        The spilled batches that could not be replayed are kept on disk, they are
+        replayed by the next handler using the same `spill_dir`. With
+        `check_conn="lazy"`, the buffered logs are spilled, or dropped without
+        `spill_dir`, if Redis never answered.
+        """
+        try:
+            if self._suppressors:
+                self._emit_summary()
+            self._closing.set()
+            if self._flusher is not None:
+                self._flusher.join()
+            if self._writer is not None:
+                if self._writer.is_alive():
+                    self._stop_writer(self.close_timeout)
+            else:
+                self.flush()
+            if self._replayer is not None:
+                self._replay_wakeup.set()
+                self._replayer.join(self.close_timeout)
+                self.spill.close()
+            if self._aggregator is not None:
+                self._aggregator.close()
+        finally:
+            _HANDLERS.discard(self)
+            super().close()
 
 
 class RedisStreamLogHandler(RedisLogHandler):
     """Handler used to forward logs to a Redis stream.
 
+    Every time a log is emitted, an entry is inserted in the stream. If `batch_size=n`,
+    the logs are emited by batches of size `n`. If `background` is set to true, the log
+    is only queued and the writer thread sends it. If `shards` > 1 or `route` is set,
+    the buffered logs are grouped by stream and all the streams are sent in the same
+    pipeline.
+
     Attributes
     ----------
     redis : redis.Redis
@@ -107,12 +1216,44 @@ class RedisStreamLogHandler(RedisLogHandler):
         The list containing the batched logs.
     stream_name : str
         The name of the Redis stream.
+    maxlen : int
+        The maximum length of the stream, None if not capped by length.
+    retention : float
+        The age in seconds of the oldest logs kept in the stream, None if not trimmed by
+        age.
+    trim_every : int
+        If set, the streams are trimmed with one XTRIM every `trim_every` batches
+        instead of on each XADD.
+    trim_limit : int
+        The maximum number of entries removed by a trimming, None for no limit.
     fields : list(str)
         The list of logs fields to forward.
     as_pkl : bool
         If true, the logs are written as pickle format in the stream.
+    as_bin : bool
+        If true, the logs are written in the compact binary format of `rlh.records`.
     as_json : bool
         If true, the logs are written as JSON in the stream.
+    serializer : rlh.serializers.Serializer
+        The serializer used to encode the logs when `as_json` is true.
+    use_script : bool
+        If true, each batch is appended to the stream by a single Lua script call.
+    shards : int
+        The number of streams the logs are spread over.
+    stream_names : list(str)
+        The names of the streams, `stream_name` followed by the shard index if
+        `shards` > 1.
+    route : dict or callable
+        How the logs are routed to other streams than `stream_name`, None if they are
+        not.
+    client_ids : bool
+        If true, the stream IDs of the logs are generated by the handler.
+    duplicates : int
+        The number of logs skipped because they were already added by a previous
+        attempt, when `client_ids` is true.
+    id_conflicts : int
+        The number of logs added with an ID assigned by Redis because another writer
+        added a higher ID to the stream, when `client_ids` is true.
 
     Methods
     -------
@@ -125,10 +1266,13 @@ class RedisStreamLogHandler(RedisLogHandler):
     """
 
     def __init__(self, redis_client: redis.Redis = None, batch_size: int = 1,
-                 check_conn: bool = True, stream_name: str = "logs",
+                 check_conn=True, stream_name: str = "logs",
                  maxlen: int = None, approximate: bool = True, 
                  fields: list = None, as_pkl: bool = False, as_json: bool = False,
-                 **redis_args) -> None:
+                 use_script: bool = False, serializer=None, as_bin: bool = False,
+                 shards: int = 1, shard_key="round_robin", client_ids: bool = False,
+                 retention: float = None, trim_every: int = None, trim_limit: int = None,
+                 route=None, **redis_args) -> None:
         """Init RedisStreamLogHandler
 
         Parameters
@@ -137,8 +1281,9 @@ class RedisStreamLogHandler(RedisLogHandler):
             The Redis client to forward logs to, by default None.
         batch_size : int, optional
             The batch size, if > 1 logs will be processed by batches, by default 1.
-        check_conn : bool, optional
-            Wether to check of not if the Redis is available with a ping, by default True.
+        check_conn : bool or str, optional
+            Wether to check of not if the Redis is available with a ping, or
+            "background" to ping it from a thread, by default True.
         stream_name : str, optional
             The name of the Redis stream where the logs are stored, by default "logs".
         maxlen : int, optional
@@ -152,57 +1297,352 @@ class RedisStreamLogHandler(RedisLogHandler):
             Wether to save the log as its pickle format or not, by default False.
         as_json : bool, optional
             Wether to save the log as JSON format or not, by default False.
+        use_script : bool, optional
+            Wether to append each batch with a single call to a server side Lua script
+            (EVALSHA) instead of one XADD per log, by default False.
+        serializer : str, rlh.serializers.Serializer or callable, optional
+            The serializer encoding the logs as bytes: "json", "orjson", "msgpack" or a
+            function returning bytes. Setting it implies `as_json`, by default None ("json").
+        as_bin : bool, optional
+            Wether to save the log in the compact binary format of `rlh.records`, smaller
+            and faster to produce than pickle, by default False.
+        shards : int, optional
+            The number of streams ("<stream_name>:<index>") the logs are spread over, to
+            spread the load over several Redis Cluster nodes, by default 1.
+        shard_key : str or callable, optional
+            How the shard of a log is chosen: "round_robin", the name of a record
+            attribute (e.g. "name" or "levelno") whose value is hashed, or a function
+            returning the shard index (or a value to hash) of a record, by default
+            "round_robin".
+        route : dict or callable, optional
+            The streams the logs are routed to instead of `stream_name`: a dict mapping
+            levels to streams, the logs at or above a level going to its stream (e.g.
+            `{logging.ERROR: "errors"}`), and/or logger names to streams, the logs of a
+            logger and of its children going to its stream (the longest name wins), or
+            a function returning the stream of a record (None for `stream_name`). The
+            level routes take precedence over the logger ones. A stream of the dict can
+            be given with its own trimming options, replacing `maxlen` and `retention`,
+            as a (stream, options) pair (e.g. `{logging.ERROR: ("errors",
+            {"retention": 30 * 86400})}`). The streams of a batch are all sent in the
+            same pipeline, by default None.
+        client_ids : bool, optional
+            Wether to generate the stream IDs of the logs from their creation time and a
+            sequence number, instead of letting Redis assign them, so that the logs
+            already added by a batch retried after an error are skipped. The handler
+            must be the only writer of its streams, by default False.
+        retention : float, optional
+            The age in seconds of the oldest logs kept in the stream, the older logs are
+            trimmed with MINID (e.g. 86400 to keep a day of logs), by default None.
+        trim_every : int, optional
+            If set, the trimming options are not passed to each XADD, the streams are
+            instead trimmed with a single XTRIM every `trim_every` batches, in the same
+            pipeline, by default None.
+        trim_limit : int, optional
+            The maximum number of entries removed by a trimming (LIMIT), to keep each
+            trimming cheap, which requires `approximate`, by default None.
+
+        Raises
+        ------
+        ValueError
+            Raised if the serializer is unknown or not installed, if the ring buffer
+            is used with logs saved as fields, with `shards` > 1 or with `route`, if
+            `route` is used with `shards` > 1, if `client_ids`
+            is used with the ring buffer or an aggregator, if both `maxlen` and
+            `retention` are set (or the trimming options of a route are invalid), if
+            `trim_limit` is set without `approximate`, or if
+            `dedup` is used with `as_bin`, which has no room for the counts.
 
         Notes
         -----
         More info about Redis caped stream: https://redis.io/docs/data-types/streams-tutorial/#capped-streams
+
+        The delivery options of `RedisLogHandler` (`background`, `queue_size`...) can also
+        be passed as keyword arguments, any other keyword argument is passed to Redis.
         """
+        if redis_args.get("ring_slots") is not None and (
+                not (as_pkl or as_bin or as_json or serializer is not None) or shards > 1
+                or route is not None):
+            raise ValueError("The ring buffer requires the logs to be saved with as_pkl, "
+                             "as_bin or as_json, in a single stream")
+        if route is not None and shards > 1:
+            raise ValueError("The logs are either routed or sharded")
+        route_streams, stream_trims = _split_route(route)
+        if client_ids and (redis_args.get("ring_slots") is not None
+                           or redis_args.get("aggregator") is not None):
+            raise ValueError("Client generated IDs cannot be used with the ring buffer "
+                             "or an aggregator")
+        if maxlen is not None and retention is not None:
+            raise ValueError("The stream is trimmed either by maxlen or by retention")
+        if trim_limit is not None and not approximate:
+            raise ValueError("trim_limit requires approximate trimming")
+        if as_bin and redis_args.get("dedup") is not None:
+            raise ValueError("The repeated logs cannot be counted with as_bin")
         super().__init__(redis_client, batch_size, check_conn, **redis_args)
 
         self.stream_name = stream_name
         self.maxlen = maxlen
         self.approximate = approximate
+        self.retention = retention
+        self.trim_every = trim_every
+        self.trim_limit = trim_limit
+        self._batches_since_trim = 0
         self.as_pkl = as_pkl
-        self.as_json = as_json
+        self.as_bin = as_bin
+        self.as_json = as_json or serializer is not None
+        self.serializer = get_serializer(serializer)
+        self.use_script = use_script
+        self.shards = shards
+        self.stream_names = shard_stream_names(stream_name, shards)
 
         self.fields = fields if fields is not None else DEFAULT_FIELDS
 
-    def emit(self, record: logging.LogRecord):
-        """Write the log record in the Redis stream.
+        self._shard_index = _make_shard_index(shard_key, shards) if shards > 1 else None
+        self.route = route
+        self._route = _make_route(route_streams, stream_name) if route is not None else None
+        # (maxlen, retention) of the routed streams with their own trimming options
+        self._stream_trims = stream_trims
+        # the buffered logs are (stream name, entry) pairs
+        self._paired = self._shard_index is not None or self._route is not None
 
-        Every time a log is emitted, an entry is inserted in the stream.
-        This entry is a dict whose format depends on the handler
-        attributes.
-        
-        If `as_pkl` is set to true, the records are saved as
-        their pickle format with the key "pkl". If `as_json` is set to true,
-        the records are saved as their JSON representation with the key "json".
-        Otherwise we use the different fields as keys and their associated value
-        in the record as the value.
+        self._xadd_batch = self.redis.register_script(XADD_BATCH_SCRIPT) if use_script else None
 
-        If `batch_size=n`, the logs are emited by batches of size `n`.
+        self.client_ids = client_ids
+        self.duplicates = 0
+        self.id_conflicts = 0
+        # last generated ID, and highest ID of the logs whose sending was attempted
+        self._id_ms = 0
+        self._id_seq = 0
+        self._attempted = (0, 0)
 
-        Parameters
-        ----------
-        record : logging.LogRecord
-            The log record to emit.
+    def _format_record(self, record):
+        """Return the stream entry of the log record.
+
+        The entry is a dict whose format depends on the handler attributes. If `as_pkl`
+        is set to true, the records are saved as their pickle format with the key "pkl".
+        If `as_bin` is set to true, the records are saved in the compact binary format of
+        `rlh.records` with the key "bin". If `as_json` is set to true, the records are
+        saved as their JSON representation with the key "json" (or the key of the
+        serializer) and their content type with the key "content_type". Otherwise we
+        use the different fields as keys and their associated value in the record as
+        the value.
         """
-        stream_entry = _make_entry(record, self.fields, self.as_pkl, self.as_json)
-        self.log_buffer.append(stream_entry)
-        self._check_buff_and_emit()
+        # the ring buffer holds the serialized log, the entry is built by the writer
+        stream_entry = _make_entry(record, self._extract_fields, self.as_pkl,
+                                   self.serializer if self.as_json else None,
+                                   raw=self._ring is not None, as_bin=self.as_bin)
+        if self.client_ids:
+            stream_entry = (self._next_id(record.created), stream_entry)
+        if self._route is not None:
+            return (self._route(record), stream_entry)
+        if self._shard_index is None:
+            return stream_entry
+        return (self.stream_names[self._shard_index(record)], stream_entry)
 
-    def _buffer_emit(self):
-        """Emits the logs batched in log buffer."""
-        pipe = self.redis.pipeline()
-        for log in self.log_buffer:
-            pipe.xadd(self.stream_name, log, maxlen=self.maxlen, approximate=self.approximate)
-        pipe.execute()
-        self.log_buffer = []
+    def _next_id(self, created):
+        """Return the next stream ID, made of the creation time of the log in ms and of a
+        sequence number, increasing even if the clock goes back."""
+        ms = int(created * 1000)
+        if ms > self._id_ms:
+            self._id_ms = ms
+            self._id_seq = 0
+        else:
+            self._id_seq += 1
+        return f"{self._id_ms}-{self._id_seq}"
+
+    def _begin_attempt(self, logs):
+        """Return the highest ID of the logs attempted before, marking these logs as
+        attempted."""
+        attempted = self._attempted
+        last = logs[-1][1] if self._paired else logs[-1]
+        self._attempted = max(attempted, _parse_id(last[0]))
+        return attempted
+
+    def _send_logs(self, logs):
+        """Add the logs to the stream."""
+        attempted = self._begin_attempt(logs) if self.client_ids else None
+        if self._xadd_batch is not None and not self._paired:
+            self._count_rejected([None], [self._xadd_batch(
+                keys=[self.stream_name], args=self._script_args(logs, attempted))], attempted)
+            return
+        pipe = self.redis.pipeline(transaction=self.transaction)
+        queued = self._pipe_logs(pipe, logs, attempted)
+        if attempted is None:
+            pipe.execute()
+            return
+        conflicts = self._count_rejected(queued, pipe.execute(raise_on_error=False), attempted)
+        if conflicts:
+            pipe = self.redis.pipeline(transaction=self.transaction)
+            self._pipe_conflicts(pipe, conflicts)
+            pipe.execute()
+
+    def _count_rejected(self, queued, results, attempted):
+        """Count the logs Redis rejected because of their ID, and return the ones to add
+        again with an ID assigned by Redis.
+
+        A log whose ID is not above the last ID of the stream was already added if it
+        was attempted before, otherwise another writer added a higher ID. `queued` holds
+        the (stream name, ID, log) of each XADD of the pipeline, None for script calls.
+        """
+        conflicts = []
+        for command, result in zip(queued, results):
+            if command is None:
+                if attempted is not None:
+                    self.duplicates += int(result[0])
+                    self.id_conflicts += int(result[1])
+            elif isinstance(result, redis.exceptions.ResponseError):
+                if DUPLICATE_ID_ERROR not in str(result):
+                    raise result
+                if _parse_id(command[1]) <= attempted:
+                    self.duplicates += 1
+                else:
+                    conflicts.append(command)
+            elif isinstance(result, Exception):
+                raise result
+        # the XTRIM commands follow the logs
+        for result in results[len(queued):]:
+            if isinstance(result, Exception):
+                raise result
+        return conflicts
+
+    def _pipe_conflicts(self, pipe, conflicts):
+        """Queue the XADD commands of the logs to add again with an ID assigned by Redis."""
+        self.id_conflicts += len(conflicts)
+        for stream_name, _, log in conflicts:
+            entry_trim = self._trim_args(stream_name) if self.trim_every is None else {}
+            pipe.xadd(stream_name, log, **entry_trim)
+
+    def _pack_logs(self, logs):
+        """Return the logs to send, packed into a single log with the ID of the last one
+        if compression is enabled."""
+        if not self.client_ids or self.compression is None or not logs:
+            return super()._pack_logs(logs)
+        return [(logs[-1][0], log) for log in super()._pack_logs([log for _, log in logs])]
+
+    def stats(self) -> dict:
+        """Return a snapshot of the handler metrics, with the logs skipped as duplicates
+        and added with a new ID if `client_ids` is set."""
+        snapshot = super().stats()
+        if self.client_ids:
+            snapshot["duplicates"] = self.duplicates
+            snapshot["id_conflicts"] = self.id_conflicts
+        return snapshot
+
+    def _payload_entry(self, payload):
+        """Return the stream entry of a serialized log read from the ring buffer."""
+        if self.as_bin:
+            return {"bin": payload}
+        if self.as_pkl:
+            return {"pkl": payload}
+        return {self.serializer.key: payload, "content_type": self.serializer.content_type}
+
+    def _stream_batches(self, logs):
+        """Return the (stream name, logs) pairs of the buffered logs."""
+        if not self._paired:
+            return [(self.stream_name, logs)]
+        return _group_by_destination(logs)
+
+    def _trim_args(self, stream_name=None):
+        """Return the trimming arguments of XADD and XTRIM for the stream, an empty dict
+        if it is not trimmed."""
+        maxlen, retention = self._stream_trims.get(stream_name,
+                                                   (self.maxlen, self.retention))
+        if retention is not None:
+            return {"minid": int((time.time() - retention) * 1000),
+                    "approximate": self.approximate, "limit": self.trim_limit}
+        if maxlen is not None:
+            return {"maxlen": maxlen, "approximate": self.approximate,
+                    "limit": self.trim_limit}
+        return {}
+
+    def _trim_due(self):
+        """Count a batch, and return wether the streams are trimmed with XTRIM after it."""
+        if self.trim_every is None:
+            return False
+        self._batches_since_trim += 1
+        if self._batches_since_trim < self.trim_every:
+            return False
+        self._batches_since_trim = 0
+        return True
+
+    def _batch_trim(self, stream_name=None, due=None):
+        """Return the trimming arguments of the XADD commands of a batch in the stream,
+        and the ones of the XTRIM command following them, None if the stream is not
+        trimmed after this batch. `due` is the result of `_trim_due` for the batch, which
+        is counted if it is None."""
+        trim = self._trim_args(stream_name)
+        if self.trim_every is None or not trim:
+            return trim, None
+        if due is None:
+            due = self._trim_due()
+        return {}, trim if due else None
+
+    def _pipe_logs(self, pipe, logs, attempted=None):
+        """Queue the XADD commands (or script calls) of the logs in the pipeline, followed
+        by the XTRIM commands if the streams are trimmed after the batch.
+
+        With `client_ids`, return the (stream name, ID, log) of each XADD, None for each
+        script call, in the order of the commands.
+        """
+        queued = []
+        trims = []
+        due = self._trim_due()
+        for stream_name, stream_logs in self._stream_batches(logs):
+            entry_trim, batch_trim = trim = self._batch_trim(stream_name, due)
+            if batch_trim is not None and self._xadd_batch is None:
+                trims.append((stream_name, batch_trim))
+            if self._xadd_batch is not None:
+                self._xadd_batch(keys=[stream_name],
+                                 args=self._script_args(stream_logs, attempted, trim),
+                                 client=pipe)
+                queued.append(None)
+            elif self.client_ids:
+                for entry_id, log in self._pack_logs(stream_logs):
+                    pipe.xadd(stream_name, log, id=entry_id, **entry_trim)
+                    queued.append((stream_name, entry_id, log))
+            else:
+                for log in self._pack_logs(stream_logs):
+                    pipe.xadd(stream_name, log, **entry_trim)
+        for stream_name, batch_trim in trims:
+            pipe.xtrim(stream_name, **batch_trim)
+        return queued
+
+    def _script_args(self, logs, attempted=None, trim=None):
+        """Return the arguments of the Lua batch script for the logs."""
+        entry_trim, batch_trim = self._batch_trim() if trim is None else trim
+        options = batch_trim if batch_trim is not None else entry_trim
+        if "minid" in options:
+            strategy, threshold = "MINID", options["minid"]
+        elif "maxlen" in options:
+            strategy, threshold = "MAXLEN", options["maxlen"]
+        else:
+            strategy, threshold = "", ""
+        args = [strategy, threshold, int(self.approximate),
+                "" if self.trim_limit is None else self.trim_limit,
+                int(batch_trim is not None),
+                "" if attempted is None else "%d-%d" % attempted]
+        if self.client_ids:
+            for entry_id, log in self._pack_logs(logs):
+                args.append(len(log))
+                args.append(entry_id)
+                for item in log.items():
+                    args.extend(item)
+            return args
+        for log in self._pack_logs(logs):
+            args.append(len(log))
+            for item in log.items():
+                args.extend(item)
+        return args
+
+    def _batch_entry(self, packed, count):
+        """Return the stream entry holding a packed batch."""
+        return {"batch": packed, "count": count}
 
 
 class RedisPubSubLogHandler(RedisLogHandler):
     """Handler used to publish logs to a Redis pub/sub channel.
 
+    Every time a log is emitted, an entry is published on the channel.
+
     Attributes
     ----------
     redis : redis.Redis
@@ -217,6 +1657,10 @@ class RedisPubSubLogHandler(RedisLogHandler):
         The list of logs fields to forward.
     as_pkl : bool
         If true, the logs are written as pickle format in the message.
+    as_bin : bool
+        If true, the logs are written in the compact binary format of `rlh.records`.
+    serializer : rlh.serializers.Serializer
+        The serializer used to encode the logs when `as_pkl` is false.
 
     Methods
     -------
@@ -229,8 +1673,9 @@ class RedisPubSubLogHandler(RedisLogHandler):
     """
 
     def __init__(self, redis_client: redis.Redis = None, batch_size: int = 1,
-                 check_conn: bool = True, channel_name: str = "logs",
-                 fields: list = None, as_pkl: bool = False, **redis_args) -> None:
+                 check_conn=True, channel_name: str = "logs",
+                 fields: list = None, as_pkl: bool = False, serializer=None,
+                 as_bin: bool = False, **redis_args) -> None:
         """Init RedisPubSubLogHandler
 
         Parameters
@@ -239,52 +1684,387 @@ class RedisPubSubLogHandler(RedisLogHandler):
             The Redis client to forward logs to, by default None.
         batch_size : int, optional
             The batch size, if > 1 logs will be processed by batches, by default 1.
-        check_conn : bool, optional
-            Wether to check of not if the Redis is available with a ping, by default True.
+        check_conn : bool or str, optional
+            Wether to check of not if the Redis is available with a ping, or
+            "background" to ping it from a thread, by default True.
         channel_name : str, optional
             The name of the Redis pub/sub channel where the logs are pushed, by default "logs".
         fields : list, optional
             The list of logs fields to save, by default None.
         as_pkl : bool, optional
             Wether to save the log as its pickle format or not, by default False.
+        serializer : str, rlh.serializers.Serializer or callable, optional
+            The serializer encoding the logs as bytes: "json", "orjson", "msgpack" or a
+            function returning bytes, by default None ("json").
+        as_bin : bool, optional
+            Wether to publish the log in the compact binary format of `rlh.records`,
+            smaller and faster to produce than pickle, by default False.
+
+        Raises
+        ------
+        ValueError
+            Raised if the serializer is unknown or not installed, or if `dedup` is used
+            with `as_bin`, which has no room for the counts.
+
+        Notes
+        -----
+        The delivery options of `RedisLogHandler` (`background`, `queue_size`...) can also
+        be passed as keyword arguments, any other keyword argument is passed to Redis.
         """
+        if as_bin and redis_args.get("dedup") is not None:
+            raise ValueError("The repeated logs cannot be counted with as_bin")
         super().__init__(redis_client, batch_size, check_conn, **redis_args)
 
         self.channel_name = channel_name
         self.as_pkl = as_pkl
+        self.as_bin = as_bin
+        self.serializer = get_serializer(serializer)
 
         self.fields = fields if fields is not None else DEFAULT_FIELDS
 
-    def emit(self, record: logging.LogRecord):
-        """Publish the log record in the Redis pub/sub channel.
+    def _format_record(self, record):
+        """Return the message of the log record.
+
+        The message is encoded as JSON (or with the handler serializer) whose format
+        depends on the handler attributes. If `as_pkl` is set to true, the records are
+        published as their pickle format, and if `as_bin` is set to true, in the compact
+        binary format of `rlh.records`. Otherwise we use the different fields as keys
+        and their associated value in the record as the value (default fields are used
+        if not specified).
+        """
+        return _make_entry(record, self._extract_fields, self.as_pkl, self.serializer,
+                           raw=True, as_bin=self.as_bin)
+
+    def _send_logs(self, logs):
+        """Publish the logs on the channel."""
+        pipe = self.redis.pipeline(transaction=self.transaction)
+        self._pipe_logs(pipe, logs)
+        pipe.execute()
+
+    def _pipe_logs(self, pipe, logs):
+        """Queue the PUBLISH commands of the logs in the pipeline."""
+        for log in self._pack_logs(logs):
+            pipe.publish(self.channel_name, log)
+
+    def _batch_entry(self, packed, count):
+        """Return the message holding a packed batch."""
+        return packed
+
+
+class RedisListLogHandler(RedisLogHandler):
+    """Handler used to push logs to a Redis list, for the shippers consuming queues.
+
+    Each batch is appended with a single variadic RPUSH, followed by an LTRIM if the
+    list is capped, in the same pipeline. The logs can be consumed with
+    `rlh.reader.RedisListLogReader`. If `batch_size=n`, the logs are pushed by batches
+    of size `n`.
+
+    Attributes
+    ----------
+    redis : redis.Redis
+        The Redis client.
+    batch_size : int
+        The batch size, if this value is > 1, logs will be processed by batches.
+    log_buffer : list
+        The list containing the batched logs.
+    list_name : str
+        The name of the Redis list.
+    maxlen : int
+        The maximum length of the list, the oldest logs are trimmed beyond it, None if
+        not capped.
+    fields : list(str)
+        The list of logs fields to forward.
+    as_pkl : bool
+        If true, the logs are pushed in pickle format.
+    as_bin : bool
+        If true, the logs are pushed in the compact binary format of `rlh.records`.
+    serializer : rlh.serializers.Serializer
+        The serializer used to encode the logs when `as_pkl` and `as_bin` are false.
+
+    Methods
+    -------
+    emit(record: logging.LogRecord)
+        Push log to the Redis list.
+
+    Notes
+    -----
+    Redis lists: https://redis.io/docs/data-types/lists/
+    """
 
-        Every time a log is emitted, an entry is published on the channel.
-        This entry is encoded as JSON whose format depends on the handler
-        attributes. If `as_pkl` is set to true, the records are saved as
-        their pickle format with the key "pkl". Otherwise we use the
-        different fields as keys and their associated value in the record
-        as the value (default fields are used if not specified).
+    def __init__(self, redis_client: redis.Redis = None, batch_size: int = 1,
+                 check_conn=True, list_name: str = "logs", maxlen: int = None,
+                 fields: list = None, as_pkl: bool = False, serializer=None,
+                 as_bin: bool = False, **redis_args) -> None:
+        """Init RedisListLogHandler
 
         Parameters
         ----------
-        record : logging.LogRecord
-            The log record to emit.
+        redis_client : redis.Redis, optional
+            The Redis client to forward logs to, by default None.
+        batch_size : int, optional
+            The batch size, if > 1 logs will be processed by batches, by default 1.
+        check_conn : bool or str, optional
+            Wether to check of not if the Redis is available with a ping, or
+            "background" to ping it from a thread, by default True.
+        list_name : str, optional
+            The name of the Redis list where the logs are pushed, by default "logs".
+        maxlen : int, optional
+            The maximum length of the list, the oldest logs are trimmed with LTRIM after
+            each batch, by default None (no limit).
+        fields : list, optional
+            The list of logs fields to save, by default None.
+        as_pkl : bool, optional
+            Wether to save the log as its pickle format or not, by default False.
+        serializer : str, rlh.serializers.Serializer or callable, optional
+            The serializer encoding the logs as bytes: "json", "orjson", "msgpack" or a
+            function returning bytes, by default None ("json").
+        as_bin : bool, optional
+            Wether to push the log in the compact binary format of `rlh.records`,
+            smaller and faster to produce than pickle, by default False.
+
+        Raises
+        ------
+        ValueError
+            Raised if the serializer is unknown or not installed, or if `dedup` is used
+            with `as_bin`, which has no room for the counts.
+
+        Notes
+        -----
+        The delivery options of `RedisLogHandler` (`background`, `queue_size`...) can also
+        be passed as keyword arguments, any other keyword argument is passed to Redis.
         """
-        log_entry = _make_entry(record, self.fields, self.as_pkl,
-                                raw_pkl=True)
-        if self.as_pkl:
-            self.log_buffer.append(log_entry)
-        else:
-            self.log_buffer.append(json.dumps(log_entry))
-        self._check_buff_and_emit()
+        if as_bin and redis_args.get("dedup") is not None:
+            raise ValueError("The repeated logs cannot be counted with as_bin")
+        super().__init__(redis_client, batch_size, check_conn, **redis_args)
 
-    def _buffer_emit(self):
-        """Emits the logs batched in log buffer."""
-        pipe = self.redis.pipeline()
-        for log in self.log_buffer:
-            pipe.publish(self.channel_name, log)
+        self.list_name = list_name
+        self.maxlen = maxlen
+        self.as_pkl = as_pkl
+        self.as_bin = as_bin
+        self.serializer = get_serializer(serializer)
+
+        self.fields = fields if fields is not None else DEFAULT_FIELDS
+
+    def _format_record(self, record):
+        """Return the list element of the log record.
+
+        The element is encoded as JSON (or with the handler serializer) whose format
+        depends on the handler attributes. If `as_pkl` is set to true, the records are
+        pushed as their pickle format, and if `as_bin` is set to true, in the compact
+        binary format of `rlh.records`. Otherwise we use the different fields as keys
+        and their associated value in the record as the value (default fields are used
+        if not specified).
+        """
+        return _make_entry(record, self._extract_fields, self.as_pkl, self.serializer,
+                           raw=True, as_bin=self.as_bin)
+
+    def _send_logs(self, logs):
+        """Push the logs to the list."""
+        pipe = self.redis.pipeline(transaction=self.transaction)
+        self._pipe_logs(pipe, logs)
         pipe.execute()
-        self.log_buffer = []
+
+    def _pipe_logs(self, pipe, logs):
+        """Queue the RPUSH of the logs in the pipeline, followed by the LTRIM capping the
+        list."""
+        pipe.rpush(self.list_name, *self._pack_logs(logs))
+        if self.maxlen is not None:
+            pipe.ltrim(self.list_name, -self.maxlen, -1)
+
+    def _batch_entry(self, packed, count):
+        """Return the list element holding a packed batch."""
+        return packed
+
+
+class CapturedRecord:
+    """A log record captured by `emit` to be formatted later by the writer.
+
+    The message, the arguments and the attributes read by the handler are kept apart
+    from the record, so that the log is formatted with them even if the record is
+    changed by another handler. A message or arguments whose type is not in
+    `IMMUTABLE_TYPES` could be mutated by the caller after `emit`, the message is then
+    formatted right away.
+    """
+
+    __slots__ = ("record", "msg", "args", "attrs")
+
+    def __init__(self, record: logging.LogRecord,
+                 attrs: tuple = CAPTURED_ATTRIBUTES) -> None:
+        self.record = record
+        record_dict = record.__dict__
+        self.attrs = {attr: record_dict[attr] for attr in attrs if attr in record_dict}
+        args = record.args
+        if record.msg.__class__ not in IMMUTABLE_TYPES:
+            self.msg = record.getMessage()
+            self.args = None
+        elif not args or (args.__class__ is tuple
+                          and all(arg.__class__ in IMMUTABLE_TYPES for arg in args)):
+            self.msg = record.msg
+            self.args = args
+        elif (isinstance(args, dict)
+              and all(arg.__class__ in IMMUTABLE_TYPES for arg in args.values())):
+            self.msg = record.msg
+            self.args = dict(args)
+        else:
+            self.msg = record.getMessage()
+            self.args = None
+
+    def restore(self) -> logging.LogRecord:
+        """Return the record, copied if its message, arguments or attributes changed."""
+        record = self.record
+        record_dict = record.__dict__
+        if (record.msg is self.msg and record.args is self.args
+                and all(attr in record_dict and record_dict[attr] is value
+                        for attr, value in self.attrs.items())):
+            return record
+        record = logging.makeLogRecord(record_dict)
+        record.__dict__.update(self.attrs)
+        record.msg = self.msg
+        record.args = self.args
+        return record
+
+
+def shard_stream_names(stream_name: str, shards: int) -> list:
+    """Return the names of the streams of a sharded stream."""
+    if shards <= 1:
+        return [stream_name]
+    return [f"{stream_name}:{index}" for index in range(shards)]
+
+
+def _make_shard_index(shard_key, shards):
+    """Return a function giving the shard index of a record."""
+    if shard_key == "round_robin":
+        counter = itertools.count()
+        return lambda record: next(counter) % shards
+
+    def hash_index(value):
+        if isinstance(value, int):
+            return value % shards
+        # crc32 is stable across processes, unlike hash()
+        return zlib.crc32(str(value).encode()) % shards
+
+    if callable(shard_key):
+        return lambda record: hash_index(shard_key(record))
+
+    # the index of each attribute value is cached, up to a limit as values may be unbounded
+    cache = {}
+
+    def attribute_index(record):
+        value = getattr(record, shard_key, None)
+        try:
+            return cache[value]
+        except (KeyError, TypeError):
+            index = hash_index(value)
+            if len(cache) < 4096:
+                try:
+                    cache[value] = index
+                except TypeError:
+                    pass
+            return index
+
+    return attribute_index
+
+
+def _make_route(route, default):
+    """Return a function giving the stream of a record.
+
+    With a dict, the stream of each (logger name, level) pair is resolved once and
+    cached, up to a limit as logger names may be unbounded, so that routing a record
+    costs a dict lookup.
+    """
+    if callable(route):
+        return lambda record: route(record) or default
+
+    levels = sorted((level, stream) for level, stream in route.items()
+                    if isinstance(level, int))
+    # the longest logger names first, so that the most specific one wins
+    loggers = sorted(((name, stream) for name, stream in route.items()
+                      if isinstance(name, str)), key=lambda item: -len(item[0]))
+
+    def resolve(name, levelno):
+        stream = None
+        for level, level_stream in levels:
+            if levelno < level:
+                break
+            stream = level_stream
+        if stream is not None:
+            return stream
+        for logger_name, logger_stream in loggers:
+            if not logger_name or name == logger_name or name.startswith(logger_name + "."):
+                return logger_stream
+        return default
+
+    cache = {}
+
+    def route_record(record):
+        key = (record.name, record.levelno)
+        try:
+            return cache[key]
+        except KeyError:
+            stream = resolve(*key)
+            if len(cache) < 4096:
+                cache[key] = stream
+            return stream
+
+    return route_record
+
+
+def _split_route(route):
+    """Return the route with the stream names only, and the (maxlen, retention) of the
+    streams given with their own trimming options."""
+    if not isinstance(route, dict):
+        return route, {}
+    streams = {}
+    stream_trims = {}
+    for key, stream in route.items():
+        if isinstance(stream, tuple):
+            stream, options = stream
+            if not set(options) <= {"maxlen", "retention"} or len(options) > 1:
+                raise ValueError("The stream of a route is trimmed either by maxlen or by "
+                                 f"retention, got {options!r}")
+            stream_trims[stream] = (options.get("maxlen"), options.get("retention"))
+        streams[key] = stream
+    return streams, stream_trims
+
+
+def _group_by_destination(logs):
+    """Group (destination, log) pairs into (destination, logs) pairs, keeping the order
+    of the logs of each destination."""
+    groups = {}
+    for destination, log in logs:
+        groups.setdefault(destination, []).append(log)
+    return list(groups.items())
+
+
+def _parse_id(entry_id):
+    """Return the (ms, sequence number) pair of a stream ID."""
+    ms, _, seq = entry_id.partition("-")
+    return (int(ms), int(seq))
+
+
+def _entry_size(entry):
+    """Return the approximate size in bytes of a formatted log."""
+    if isinstance(entry, tuple):
+        # (destination, log) pair
+        return _entry_size(entry[1])
+    if isinstance(entry, dict):
+        return sum(len(key) + _entry_size(value) for key, value in entry.items())
+    if isinstance(entry, (str, bytes, memoryview)):
+        return len(entry)
+    if isinstance(entry, CapturedRecord):
+        # formatted when the batch is sent, only its message is counted
+        return len(str(entry.msg))
+    return len(str(entry))
+
+
+def _detach(entry):
+    """Return a formatted log read from the ring buffer, with its views copied."""
+    if isinstance(entry, memoryview):
+        return entry.tobytes()
+    if isinstance(entry, dict):
+        return {key: value.tobytes() if isinstance(value, memoryview) else value
+                for key, value in entry.items()}
+    return entry
 
 
 def _make_fields(record, fields):
@@ -305,12 +2085,60 @@ def _make_fields(record, fields):
     return field_dict
 
 
-def _make_entry(record, fields, as_pkl, as_json=False, raw_pkl=False):
-    """Format the log entry."""
+def _compile_fields(fields):
+    """Return a function building the fields dict of a log record.
+
+    When all the fields are attributes of every log record, the function is generated
+    so that it builds the dict in a single expression, without presence checks, and
+    only calls `record.getMessage()` if the message has arguments. Otherwise the
+    fields are looked up on each record with `_make_fields`.
+    """
+    fields = list(fields) or DEFAULT_FIELDS
+    if not RECORD_ATTRIBUTES.issuperset(fields):
+        return functools.partial(_make_fields, fields=fields)
+
+    items = []
+    for field in fields:
+        if field == "msg":
+            items.append("'msg': msg if msg.__class__ is str and not record.args "
+                         "else record.getMessage()")
+        else:
+            items.append(f"{field!r}: record.{field}")
+    source = ("def extract_fields(record):\n"
+              "    msg = record.msg\n"
+              f"    return {{{', '.join(items)}}}\n")
+    namespace = {}
+    exec(source, namespace)  # pylint: disable=exec-used
+    return namespace["extract_fields"]
+
+
+def _make_entry(record, extract_fields, as_pkl, serializer=None, raw=False, as_bin=False):
+    """Format the log entry.
+
+    `extract_fields` is the function built by `_compile_fields`. If `serializer` is set,
+    the fields are serialized. If `raw` is true, the encoded or serialized log is returned
+    as bytes instead of a stream entry.
+    """
+    if as_bin:
+        if raw:
+            return encode_record(record)
+        return {"bin": encode_record(record)}
     if as_pkl:
-        if raw_pkl:
+        if raw:
             return pickle.dumps(record)
         return {"pkl": pickle.dumps(record)}
-    if as_json:
-        return {"json": json.dumps(_make_fields(record, fields))}
-    return _make_fields(record, fields)
+    if serializer is None:
+        return extract_fields(record)
+    data = serializer.dumps(extract_fields(record))
+    if raw:
+        return data
+    return {serializer.key: data, "content_type": serializer.content_type}
+
+
+def _reset_handlers_after_fork():
+    for handler in list(_HANDLERS):
+        handler._after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_handlers_after_fork)
@@ -0,0 +1,143 @@
+"""
+This module contains the metrics kept by the handlers: counters of the logs and batches
+sent, and a histogram of the time taken to send each batch to Redis.
+
+The metrics are plain integer and float attributes updated once per batch, nothing is
+done per log, so that they can be left enabled in production. They are read with `RedisLogHandler.stats`,
+or exported as they are updated with a hook, for example to Prometheus::
+
+    from prometheus_client import Counter, Histogram
+    from rlh.metrics import LATENCY_BUCKETS
+
+    LOGS = Counter("rlh_logs_sent", "Logs sent to Redis")
+    ERRORS = Counter("rlh_batch_errors", "Batches Redis failed to receive")
+    LATENCY = Histogram("rlh_flush_seconds", "Time taken to send a batch",
+                        buckets=LATENCY_BUCKETS)
+
+    def export(count, nbytes, latency, error):
+        if error:
+            ERRORS.inc()
+        else:
+            LOGS.inc(count)
+        LATENCY.observe(latency)
+
+    handler = RedisStreamLogHandler(metrics_hook=export)
+"""
+
+import bisect
+
+# upper bounds in seconds of the flush latency histogram buckets, the last bucket holds
+# the slower flushes
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class LatencyHistogram:
+    """Histogram of durations, with fixed buckets.
+
+    Attributes
+    ----------
+    bounds : tuple(float)
+        The upper bounds of the buckets in seconds, an extra bucket holds the durations
+        above the last bound.
+    counts : list(int)
+        The number of durations in each bucket.
+    count : int
+        The number of durations observed.
+    sum : float
+        The sum of the durations observed.
+    """
+
+    def __init__(self, bounds: tuple = LATENCY_BUCKETS) -> None:
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        """Add a duration to the histogram."""
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Return an upper bound of the `q` quantile (0 < q <= 1) of the durations.
+
+        The result is the upper bound of the bucket holding the quantile, None if no
+        duration was observed, and infinite if the quantile is above the last bound.
+        """
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def snapshot(self) -> dict:
+        """Return the histogram as a dict, with the cumulative count of each bucket."""
+        buckets = {}
+        seen = 0
+        for bound, count in zip(self.bounds + (float("inf"),), self.counts):
+            seen += count
+            buckets[bound] = seen
+        return {"buckets": buckets, "count": self.count, "sum": self.sum,
+                "p50": self.quantile(0.5), "p99": self.quantile(0.99)}
+
+
+class HandlerMetrics:
+    """Counters of a handler.
+
+    Attributes
+    ----------
+    batches : int
+        The number of batches sent to Redis.
+    logs_sent : int
+        The number of logs sent to Redis.
+    bytes_sent : int
+        The size in bytes of the logs sent, as formatted by the handler (the keys and
+        values of the stream entries, the serialized messages).
+    errors : int
+        The number of batches Redis failed to receive.
+    flush_latency : LatencyHistogram
+        The time taken to send each batch to Redis.
+    hook : callable
+        If set, called after each batch with the number of logs, their size in bytes,
+        the time taken to send them and wether it failed.
+    """
+
+    def __init__(self, hook=None) -> None:
+        self.batches = 0
+        self.logs_sent = 0
+        self.bytes_sent = 0
+        self.errors = 0
+        self.flush_latency = LatencyHistogram()
+        self.hook = hook
+
+    def record_batch(self, count: int, nbytes: int, latency: float, error: bool = False) -> None:
+        """Record a batch sent to Redis, or that failed to be sent if `error` is true."""
+        if error:
+            self.errors += 1
+        else:
+            self.batches += 1
+            self.logs_sent += count
+            self.bytes_sent += nbytes
+        self.flush_latency.observe(latency)
+        if self.hook is not None:
+            self.hook(count, nbytes, latency, error)
+
+    def snapshot(self) -> dict:
+        """Return the counters as a dict."""
+        return {
+            "batches": self.batches,
+            "logs_sent": self.logs_sent,
+            "bytes_sent": self.bytes_sent,
+            "errors": self.errors,
+            "flush_latency": self.flush_latency.snapshot(),
+        }
+
+    def __repr__(self) -> str:
+        return (f"HandlerMetrics(batches={self.batches}, logs_sent={self.logs_sent}, "
+                f"errors={self.errors})")
@@ -0,0 +1,422 @@
+"""
+This module contains the readers consuming the logs written to a Redis stream by
+`RedisStreamLogHandler` and to a Redis list by `RedisListLogHandler`, and decoding them
+back into log records.
+"""
+
+import heapq
+import logging
+import operator
+import os
+import pickle
+import socket
+
+import redis
+
+from rlh.compression import unpack_message, unpack_stream_entry
+from rlh.handlers import shard_stream_names
+from rlh.records import MAGIC as RECORD_MAGIC, decode_record
+from rlh.serializers import get_loads, get_serializer
+
+# record attributes stored as numbers, converted back when reading raw fields
+FLOAT_FIELDS = frozenset(("created", "msecs", "relativeCreated"))
+INT_FIELDS = frozenset(("levelno", "lineno", "process", "thread"))
+
+# first byte of the pickles of protocol 2 and above
+PICKLE_PREFIX = b"\x80"
+
+
+class _LogReader:
+    """Iteration over the batches of logs returned by the `read` method of a reader."""
+
+    _running = True
+
+    def read(self) -> list:
+        raise NotImplementedError("read must be implemented by the readers")
+
+    def __iter__(self):
+        while self._running:
+            yield from self.read()
+
+    def handle(self, logger: logging.Logger = None) -> None:
+        """Forward the logs to the local logging handlers until the reader is stopped.
+
+        Parameters
+        ----------
+        logger : logging.Logger, optional
+            The logger handling the logs, by default None (the logger named after each
+            record). Make sure it does not forward the logs to the stream or the list
+            they are read from.
+        """
+        for record in self:
+            (logger or logging.getLogger(record.name)).handle(record)
+
+    def stop(self) -> None:
+        """Stop the iteration once the current batch has been processed."""
+        self._running = False
+
+
+class RedisStreamLogReader(_LogReader):
+    """Reader yielding the logs of a Redis stream as `logging.LogRecord`.
+
+    The entries are decoded whatever the format used by the handler: raw fields, JSON
+    (or any built-in serializer), pickle, binary records or compressed batches.
+
+    With a consumer `group`, the entries are read with XREADGROUP and acknowledged by
+    batches with XACK once they have been processed, that is when the next batch is
+    read or when the reader is closed. Entries left pending by a consumer for more than
+    `claim_min_idle` milliseconds are claimed with XAUTOCLAIM, so that the logs of a
+    crashed worker are not lost. Without group, the entries are read with XREAD.
+
+    The shards of a stream written by a handler with `shards` > 1 are read with a single
+    command, and the logs of each batch are merged by creation time.
+
+    Attributes
+    ----------
+    redis : redis.Redis
+        The Redis client.
+    stream_name : str
+        The name of the Redis stream.
+    stream_names : list(str)
+        The names of the streams read, the shards of `stream_name` if `shards` > 1.
+    group : str
+        The name of the consumer group, None to read without group.
+    consumer : str
+        The name of the consumer in the group.
+    count : int
+        The maximum number of entries read at once.
+    block : int
+        The maximum time in milliseconds to wait for entries, None to not wait.
+    claim_min_idle : int
+        The time in milliseconds after which pending entries are claimed, None to not
+        claim them.
+
+    Methods
+    -------
+    read()
+        Read and decode a batch of logs.
+    handle(logger: logging.Logger)
+        Forward the logs to local handlers until the reader is stopped.
+    """
+
+    def __init__(self, redis_client: redis.Redis = None, stream_name: str = "logs",
+                 group: str = None, consumer: str = None, count: int = 100,
+                 block: int = 1000, claim_min_idle: int = None, start_id: str = "$",
+                 shards: int = 1, **redis_args) -> None:
+        """Init RedisStreamLogReader
+
+        Parameters
+        ----------
+        redis_client : redis.Redis, optional
+            The Redis client to read the logs from, by default None. It must be created
+            with `decode_responses=False` to read binary formats.
+        stream_name : str, optional
+            The name of the Redis stream where the logs are stored, by default "logs".
+        group : str, optional
+            The name of the consumer group, created if it does not exist, by default
+            None (no group).
+        consumer : str, optional
+            The name of the consumer in the group, by default "<hostname>-<pid>".
+        count : int, optional
+            The maximum number of entries read at once, by default 100.
+        block : int, optional
+            The maximum time in milliseconds to wait for entries, by default 1000.
+        claim_min_idle : int, optional
+            The time in milliseconds after which the entries pending in other consumers
+            are claimed, by default None (never).
+        start_id : str, optional
+            The ID from which the logs are read when the group is created or when reading
+            without group, "$" for new logs only and "0" for all logs, by default "$".
+            Without group, "$" stands for the last ID of the stream when the reader is
+            created, so that the logs added between two reads are not missed.
+        shards : int, optional
+            The number of shards the handler writes the logs to, by default 1.
+
+        Raises
+        ------
+        TypeError
+            Raised if one of the aditional argument passed to Redis is invalid.
+        """
+        if redis_client is not None:
+            self.redis = redis_client
+        else:
+            try:
+                self.redis = redis.Redis(**redis_args)
+            except TypeError as err:
+                raise TypeError(
+                    "One of the argument passed to Redis is not valid") from err
+
+        self.stream_name = stream_name
+        self.stream_names = shard_stream_names(stream_name, shards)
+        self.group = group
+        self.consumer = consumer or f"{socket.gethostname()}-{os.getpid()}"
+        self.count = count
+        self.block = block
+        self.claim_min_idle = claim_min_idle
+
+        self._last_ids = dict.fromkeys(self.stream_names, start_id)
+        if group is None and start_id == "$":
+            self._last_ids = {name: self._stream_last_id(name) for name in self.stream_names}
+        self._claim_cursors = dict.fromkeys(self.stream_names, "0-0")
+        self._to_ack = {}
+        self._running = True
+        if group is not None:
+            for name in self.stream_names:
+                self._create_group(name, start_id)
+
+    def _stream_last_id(self, stream_name):
+        """Return the last ID generated in the stream, "0-0" if the stream does not exist."""
+        try:
+            return _str(self.redis.xinfo_stream(stream_name)["last-generated-id"])
+        except redis.exceptions.ResponseError:
+            return "0-0"
+
+    def _create_group(self, stream_name, start_id):
+        try:
+            self.redis.xgroup_create(stream_name, self.group, id=start_id, mkstream=True)
+        except redis.exceptions.ResponseError as err:
+            if "BUSYGROUP" not in str(err):
+                raise
+
+    def read(self) -> list:
+        """Read and decode a batch of logs.
+
+        The logs of the previous batch are acknowledged first, then the stale pending
+        entries are claimed and if there is none, new entries are read.
+
+        Returns
+        -------
+        list(logging.LogRecord)
+            The logs, an empty list if none arrived within `block` milliseconds.
+        """
+        if self.group is None:
+            streams = self._read_stream()
+        else:
+            self.ack()
+            streams = self._claim() or self._read_group()
+            self._to_ack = {name: [entry_id for entry_id, _ in entries]
+                            for name, entries in streams}
+        batches = [[record for _, fields in entries for record in decode_entry(fields)]
+                   for _, entries in streams]
+        if len(batches) == 1:
+            return batches[0]
+        # each shard is ordered, they are merged by creation time
+        return list(heapq.merge(*batches, key=operator.attrgetter("created")))
+
+    def _read_stream(self):
+        res = self.redis.xread(self._last_ids, count=self.count, block=self.block)
+        streams = [(_str(name), entries) for name, entries in res or () if entries]
+        for name, entries in streams:
+            self._last_ids[name] = entries[-1][0]
+        return streams
+
+    def _read_group(self):
+        res = self.redis.xreadgroup(self.group, self.consumer,
+                                    dict.fromkeys(self.stream_names, ">"),
+                                    count=self.count, block=self.block)
+        return [(_str(name), entries) for name, entries in res or () if entries]
+
+    def _claim(self):
+        if self.claim_min_idle is None:
+            return []
+        streams = []
+        for name in self.stream_names:
+            res = self.redis.xautoclaim(name, self.group, self.consumer,
+                                        self.claim_min_idle,
+                                        start_id=self._claim_cursors[name], count=self.count)
+            self._claim_cursors[name] = res[0]
+            # deleted entries are returned as None
+            entries = [(entry_id, fields) for entry_id, fields in res[1] if fields is not None]
+            if entries:
+                streams.append((name, entries))
+        return streams
+
+    def ack(self) -> None:
+        """Acknowledge the logs of the last batch, with a single XACK per stream."""
+        for name, entry_ids in self._to_ack.items():
+            if entry_ids:
+                self.redis.xack(name, self.group, *entry_ids)
+        self._to_ack = {}
+
+    def close(self) -> None:
+        """Acknowledge the processed logs and stop the reader."""
+        self.stop()
+        if self.group is not None:
+            self.ack()
+
+
+class RedisListLogReader(_LogReader):
+    """Reader popping the logs of a Redis list by batches, as `logging.LogRecord`.
+
+    The logs are popped from the head of the list with LMPOP, or BLMPOP to wait for
+    them (Redis >= 7.0), so that each log is read by a single consumer. A log is lost
+    if the consumer fails before handling it.
+
+    Attributes
+    ----------
+    redis : redis.Redis
+        The Redis client.
+    list_name : str
+        The name of the Redis list.
+    count : int
+        The maximum number of logs popped at once.
+    block : int
+        The maximum time in milliseconds to wait for logs, None to not wait.
+
+    Methods
+    -------
+    read()
+        Pop and decode a batch of logs.
+    handle(logger: logging.Logger)
+        Forward the logs to local handlers until the reader is stopped.
+    """
+
+    def __init__(self, redis_client: redis.Redis = None, list_name: str = "logs",
+                 count: int = 100, block: int = 1000, serializer=None,
+                 **redis_args) -> None:
+        """Init RedisListLogReader
+
+        Parameters
+        ----------
+        redis_client : redis.Redis, optional
+            The Redis client to read the logs from, by default None. It must be created
+            with `decode_responses=False`.
+        list_name : str, optional
+            The name of the Redis list where the logs are pushed, by default "logs".
+        count : int, optional
+            The maximum number of logs popped at once, by default 100.
+        block : int, optional
+            The maximum time in milliseconds to wait for logs, 0 to wait forever, by
+            default 1000.
+        serializer : str or rlh.serializers.Serializer, optional
+            The serializer of the handler, used to decode the logs saved as fields, by
+            default None ("json"). The pickled and binary logs are recognized as such.
+
+        Raises
+        ------
+        TypeError
+            Raised if one of the aditional argument passed to Redis is invalid.
+        ValueError
+            Raised if the serializer is unknown or cannot decode the logs.
+        """
+        if redis_client is not None:
+            self.redis = redis_client
+        else:
+            try:
+                self.redis = redis.Redis(**redis_args)
+            except TypeError as err:
+                raise TypeError(
+                    "One of the argument passed to Redis is not valid") from err
+
+        self.list_name = list_name
+        self.count = count
+        self.block = block
+        self._loads = get_serializer(serializer).loads
+        if self._loads is None:
+            raise ValueError("The serializer cannot decode the logs")
+
+    def read(self) -> list:
+        """Pop and decode a batch of logs.
+
+        Returns
+        -------
+        list(logging.LogRecord)
+            The logs, an empty list if none arrived within `block` milliseconds.
+        """
+        if self.block is None:
+            res = self.redis.lmpop(1, self.list_name, direction="LEFT", count=self.count)
+        else:
+            res = self.redis.blmpop(self.block / 1000, 1, self.list_name,
+                                    direction="LEFT", count=self.count)
+        if not res:
+            return []
+        return [record for data in res[1] for record in decode_message(data, self._loads)]
+
+    def close(self) -> None:
+        """Stop the reader."""
+        self.stop()
+
+
+def _str(value):
+    return value.decode("utf-8", "backslashreplace") if isinstance(value, bytes) else value
+
+
+def _fields_record(fields):
+    """Build a log record from the fields saved by the handler."""
+    attrs = {}
+    for key, value in fields.items():
+        if key in FLOAT_FIELDS:
+            value = float(value)
+        elif key in INT_FIELDS:
+            value = int(value)
+        else:
+            value = _str(value)
+        attrs[key] = value
+    if "levelno" not in attrs:
+        level = logging.getLevelName(attrs.get("levelname", "NOTSET"))
+        attrs["levelno"] = level if isinstance(level, int) else logging.NOTSET
+    # the message is already formatted
+    attrs["args"] = None
+    return logging.makeLogRecord(attrs)
+
+
+def decode_entry(fields: dict) -> list:
+    """Decode a stream entry written by `RedisStreamLogHandler`.
+
+    Parameters
+    ----------
+    fields : dict
+        The fields of the entry.
+
+    Returns
+    -------
+    list(logging.LogRecord)
+        The logs of the entry, there are several of them if it is a compressed batch.
+    """
+    records = []
+    for entry in unpack_stream_entry(fields):
+        entry = {_str(key): value for key, value in entry.items()}
+        if "pkl" in entry:
+            records.append(pickle.loads(entry["pkl"]))
+        elif "bin" in entry:
+            records.append(decode_record(entry["bin"]))
+        elif "content_type" in entry:
+            loads = get_loads(_str(entry.pop("content_type")))
+            if loads is None:
+                raise ValueError("Unable to decode the log, unknown content type")
+            (data,) = entry.values()
+            records.append(_fields_record(loads(data)))
+        elif "json" in entry:
+            # written by rlh <= 1.2.0, without content type
+            records.append(_fields_record(get_loads("application/json")(entry["json"])))
+        else:
+            records.append(_fields_record(entry))
+    return records
+
+
+def decode_message(data: bytes, loads=None) -> list:
+    """Decode a pub/sub message or a list element written by `RedisPubSubLogHandler` or
+    `RedisListLogHandler`.
+
+    Parameters
+    ----------
+    data : bytes
+        The message or the list element.
+    loads : callable, optional
+        The function decoding the logs saved as fields, by default None (JSON).
+
+    Returns
+    -------
+    list(logging.LogRecord)
+        The logs, there are several of them if it is a compressed batch.
+    """
+    loads = loads or get_loads("application/json")
+    records = []
+    for message in unpack_message(data):
+        if message[:len(RECORD_MAGIC)] == RECORD_MAGIC:
+            records.append(decode_record(message))
+        elif message[:1] == PICKLE_PREFIX:
+            records.append(pickle.loads(message))
+        else:
+            records.append(_fields_record(loads(message)))
+    return records
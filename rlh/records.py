@@ -0,0 +1,157 @@
+"""
+This module contains a compact binary encoding of log records, used by the handlers
+when `as_bin` is set, and its decoder.
+
+An encoded record starts with a fixed size header::
+
+    magic     2 bytes   b"RL"
+    version   uint8     RECORD_FORMAT_VERSION
+    levelno   uint16
+    nones     uint16    bit i is set if the string field i is None
+    lineno    uint32
+    process   uint32
+    thread    uint64
+    created   float64
+    msecs     float64
+    relativeCreated  float64
+    lengths   uint32 per string field, the length in bytes of the field
+
+followed by the UTF-8 encoded string fields, in the order of `STRING_FIELDS`. The
+message is stored formatted and the exception as the text of its traceback, so the
+record can always be decoded without the code that emitted it.
+"""
+
+import logging
+import struct
+
+MAGIC = b"RL"
+
+RECORD_FORMAT_VERSION = 1
+
+# string fields of the record, in the order they are encoded
+STRING_FIELDS = (
+    "name",
+    "msg",
+    "levelname",
+    "pathname",
+    "filename",
+    "module",
+    "funcName",
+    "threadName",
+    "processName",
+    "exc_text",
+    "stack_info",
+)
+
+HEADER = struct.Struct(f"<2sBHHIIQddd{len(STRING_FIELDS)}I")
+
+# formatter used to render the exceptions
+_formatter = logging.Formatter()
+
+
+def encode_record(record: logging.LogRecord) -> bytes:
+    """Encode a log record in the compact binary format.
+
+    Parameters
+    ----------
+    record : logging.LogRecord
+        The record to encode.
+
+    Returns
+    -------
+    bytes
+        The encoded record.
+    """
+    msg = record.msg
+    if msg.__class__ is not str or record.args:
+        msg = record.getMessage()
+    func_name = record.funcName
+    thread_name = record.threadName
+    process_name = record.processName
+    exc_text = record.exc_text
+    if exc_text is None and record.exc_info:
+        exc_text = _formatter.formatException(record.exc_info)
+    stack_info = record.stack_info
+
+    # only these fields may be None
+    nones = ((func_name is None) << 6 | (thread_name is None) << 7
+             | (process_name is None) << 8 | (exc_text is None) << 9
+             | (stack_info is None) << 10)
+    name = record.name
+    levelname = record.levelname
+    pathname = record.pathname
+    filename = record.filename
+    module = record.module
+    func_name = func_name or ""
+    thread_name = thread_name or ""
+    process_name = process_name or ""
+    exc_text = exc_text or ""
+    stack_info = stack_info or ""
+
+    text = (name + msg + levelname + pathname + filename + module + func_name + thread_name
+            + process_name + exc_text + stack_info)
+    if text.isascii():
+        # the length of each field in bytes is its length in characters, the lengths are
+        # passed explicitly as it is much faster than unpacking a sequence
+        return HEADER.pack(MAGIC, RECORD_FORMAT_VERSION, record.levelno, nones,
+                           record.lineno or 0, record.process or 0, record.thread or 0,
+                           record.created, record.msecs, record.relativeCreated,
+                           len(name), len(msg), len(levelname), len(pathname), len(filename),
+                           len(module), len(func_name), len(thread_name), len(process_name),
+                           len(exc_text), len(stack_info)) + text.encode("ascii")
+
+    encoded = [string.encode("utf-8", "surrogatepass") for string in (
+        name, msg, levelname, pathname, filename, module, func_name, thread_name,
+        process_name, exc_text, stack_info)]
+    return HEADER.pack(MAGIC, RECORD_FORMAT_VERSION, record.levelno, nones,
+                       record.lineno or 0, record.process or 0, record.thread or 0,
+                       record.created, record.msecs, record.relativeCreated,
+                       *map(len, encoded)) + b"".join(encoded)
+
+
+def decode_record(data: bytes) -> logging.LogRecord:
+    """Decode a log record encoded by `encode_record`.
+
+    Parameters
+    ----------
+    data : bytes
+        The encoded record.
+
+    Returns
+    -------
+    logging.LogRecord
+        The record, built with `logging.makeLogRecord`. Its message is already formatted
+        so its `args` are None.
+
+    Raises
+    ------
+    ValueError
+        Raised if the data is not an encoded record or if its version is not supported.
+    """
+    if len(data) < HEADER.size or data[:2] != MAGIC:
+        raise ValueError("The data is not an encoded log record")
+    (_, version, levelno, nones, lineno, process, thread, created, msecs, relative_created,
+     *lengths) = HEADER.unpack_from(data)
+    if version != RECORD_FORMAT_VERSION:
+        raise ValueError(f"Unsupported record format version {version}")
+
+    attrs = {
+        "levelno": levelno,
+        "lineno": lineno,
+        "process": process,
+        "thread": thread,
+        "created": created,
+        "msecs": msecs,
+        "relativeCreated": relative_created,
+        "args": None,
+        "exc_info": None,
+    }
+    text = data[HEADER.size:]
+    offset = 0
+    for i, (field, length) in enumerate(zip(STRING_FIELDS, lengths)):
+        if nones & (1 << i):
+            attrs[field] = None
+        else:
+            attrs[field] = text[offset:offset + length].decode("utf-8", "surrogatepass")
+            offset += length
+    return logging.makeLogRecord(attrs)
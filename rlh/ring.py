@@ -0,0 +1,160 @@
+"""
+This module contains the ring buffer used between the logging threads and the writer
+thread when a handler is created with `ring_slots`.
+
+The ring is a single preallocated `bytearray` divided into fixed size slots, each holding
+a serialized log. A producer only takes a lock to reserve its slot, then copies the log
+into it without lock. The writer reads the ready slots as `memoryview` slices, which are
+passed to the Redis client without being copied, and releases them once the batch is
+sent. Logs larger than a slot are kept aside as they are.
+"""
+
+import array
+import threading
+
+
+class RingBuffer:
+    """Fixed size ring of serialized logs.
+
+    Attributes
+    ----------
+    slots : int
+        The number of slots.
+    slot_size : int
+        The size in bytes of a slot.
+    dropped : int
+        The number of logs dropped because the ring was full.
+    closed : bool
+        Wether the ring was closed, the writer then sends the remaining logs and stops.
+
+    Methods
+    -------
+    put(data: bytes, block: bool)
+        Copy a log into the next slot.
+    wait(count: int, timeout: float)
+        Wait for logs to be ready.
+    peek(max_count: int)
+        Return the ready logs, without releasing their slots.
+    release(count: int)
+        Release the slots of the oldest logs.
+    """
+
+    def __init__(self, slots: int = 4096, slot_size: int = 512) -> None:
+        self.slots = slots
+        self.slot_size = slot_size
+        self.dropped = 0
+        self._data = bytearray(slots * slot_size)
+        self._view = memoryview(self._data)
+        # length of the log in each slot, -1 if it is too large and kept aside
+        self._lengths = array.array("i", [0]) * slots
+        self._ready = bytearray(slots)
+        self._large = {}
+
+        # counters of reserved and released slots, the slot index is the counter
+        # modulo the number of slots
+        self._head = 0
+        self._tail = 0
+        self._lock = threading.Lock()
+        self._not_full = threading.Condition(self._lock)
+        self._wakeup = threading.Event()
+        self._wanted = 1
+        self.closed = False
+
+    def __len__(self) -> int:
+        return self._head - self._tail
+
+    def put(self, data: bytes, block: bool = True) -> bool:
+        """Copy a log into the next slot.
+
+        Parameters
+        ----------
+        data : bytes
+            The serialized log.
+        block : bool, optional
+            Wether to wait for a free slot if the ring is full, by default True.
+
+        Returns
+        -------
+        bool
+            False if the log was dropped because the ring is full.
+        """
+        with self._lock:
+            while self._head - self._tail >= self.slots:
+                if not block or self.closed:
+                    self.dropped += 1
+                    return False
+                self._not_full.wait()
+            index = self._head % self.slots
+            self._head += 1
+            pending = self._head - self._tail
+
+        size = len(data)
+        if size <= self.slot_size:
+            start = index * self.slot_size
+            self._view[start:start + size] = data
+            self._lengths[index] = size
+        else:
+            self._large[index] = data
+            self._lengths[index] = -1
+        self._ready[index] = 1
+
+        if pending >= self._wanted and not self._wakeup.is_set():
+            self._wakeup.set()
+        return True
+
+    def wait(self, count: int, timeout: float = None) -> None:
+        """Wait until `count` logs are in the ring, the ring is closed or the timeout
+        expires."""
+        self._wanted = count
+        if len(self) < count and not self.closed:
+            self._wakeup.wait(timeout)
+        self._wakeup.clear()
+
+    def kick(self) -> None:
+        """Wake the writer up, whatever the number of logs."""
+        self._wakeup.set()
+
+    def peek(self, max_count: int) -> list:
+        """Return at most `max_count` ready logs, oldest first, without releasing them.
+
+        The logs are `memoryview` slices of the ring, valid until they are released, or
+        the objects that were too large for a slot.
+        """
+        logs = []
+        position = self._tail
+        head = self._head
+        while position < head and len(logs) < max_count:
+            index = position % self.slots
+            if not self._ready[index]:
+                # the producer is still copying the log
+                break
+            size = self._lengths[index]
+            if size < 0:
+                logs.append(self._large[index])
+            else:
+                start = index * self.slot_size
+                logs.append(self._view[start:start + size])
+            position += 1
+        return logs
+
+    def release(self, count: int) -> None:
+        """Release the slots of the `count` oldest logs."""
+        for position in range(self._tail, self._tail + count):
+            index = position % self.slots
+            self._ready[index] = 0
+            if self._lengths[index] < 0:
+                del self._large[index]
+        with self._lock:
+            self._tail += count
+            self._not_full.notify_all()
+
+    def close(self) -> None:
+        """Wake the writer and the blocked producers up, new logs are dropped once the
+        ring is full."""
+        with self._lock:
+            self.closed = True
+            self._not_full.notify_all()
+        self._wakeup.set()
+
+    def __repr__(self) -> str:
+        return f"RingBuffer(slots={self.slots}, slot_size={self.slot_size}, pending={len(self)})"
@@ -0,0 +1,117 @@
+"""
+This module contains the serializers used to encode the log fields as bytes before
+they are sent to Redis.
+
+The stdlib `json` serializer is always available, `orjson` and `msgpack` are used when
+they are installed.
+"""
+
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+
+class Serializer:
+    """Encode the log fields as bytes.
+
+    Attributes
+    ----------
+    key : str
+        The key under which the serialized log is stored in a stream entry.
+    content_type : str
+        The content type stored alongside the serialized log, so that consumers know how
+        to decode it.
+    dumps : callable
+        The function encoding the log fields dict as bytes.
+    loads : callable
+        The function decoding the bytes, None if unknown.
+    """
+
+    def __init__(self, key: str, content_type: str, dumps, loads=None) -> None:
+        self.key = key
+        self.content_type = content_type
+        self.dumps = dumps
+        self.loads = loads
+
+    def __repr__(self) -> str:
+        return f"Serializer(key={self.key!r}, content_type={self.content_type!r})"
+
+
+def _json_dumps(obj):
+    return json.dumps(obj, default=str).encode()
+
+
+def _orjson_dumps(obj):
+    return orjson.dumps(obj, default=str)
+
+
+def _msgpack_dumps(obj):
+    return msgpack.packb(obj, default=str, use_bin_type=True)
+
+
+def _msgpack_loads(data):
+    return msgpack.unpackb(data, raw=False)
+
+
+SERIALIZERS = {
+    "json": Serializer("json", "application/json", _json_dumps, json.loads),
+}
+if orjson is not None:
+    SERIALIZERS["orjson"] = Serializer("json", "application/json", _orjson_dumps, orjson.loads)
+if msgpack is not None:
+    SERIALIZERS["msgpack"] = Serializer("msgpack", "application/msgpack", _msgpack_dumps,
+                                        _msgpack_loads)
+
+# serializers depending on a package that may not be installed
+OPTIONAL_SERIALIZERS = ("orjson", "msgpack")
+
+
+def get_serializer(serializer=None) -> Serializer:
+    """Return the serializer matching `serializer`.
+
+    Parameters
+    ----------
+    serializer : str, Serializer or callable, optional
+        The name of a built-in serializer ("json", "orjson" or "msgpack"), a `Serializer`
+        or a function returning the log fields dict as bytes, by default None ("json").
+
+    Returns
+    -------
+    Serializer
+        The serializer.
+
+    Raises
+    ------
+    ValueError
+        Raised if the serializer is unknown or if its package is not installed.
+    """
+    if serializer is None:
+        return SERIALIZERS["json"]
+    if isinstance(serializer, Serializer):
+        return serializer
+    if isinstance(serializer, str):
+        if serializer in SERIALIZERS:
+            return SERIALIZERS[serializer]
+        if serializer in OPTIONAL_SERIALIZERS:
+            raise ValueError(f"The {serializer!r} serializer requires the {serializer} package")
+        raise ValueError(f"Unknown serializer {serializer!r}, expected one of "
+                         f"{sorted(SERIALIZERS)} or a callable")
+    if callable(serializer):
+        return Serializer("data", "application/octet-stream", serializer)
+    raise ValueError(f"Invalid serializer {serializer!r}")
+
+
+def get_loads(content_type: str):
+    """Return the function decoding logs of the given content type, None if unknown."""
+    for serializer in SERIALIZERS.values():
+        if serializer.content_type == content_type:
+            return serializer.loads
+    return None
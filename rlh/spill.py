@@ -0,0 +1,339 @@
+"""
+This module contains the local spill buffer used by the handlers when `spill_dir` is
+set: the batches that could not be sent to Redis are appended to segment files on
+disk, and replayed in order once Redis is reachable again. The circuit breaker deciding
+when the delivery is attempted again is also defined here.
+
+A segment file is a sequence of frames, each being the length of the batch (uint32)
+followed by the pickled list of logs. Segments are named after their sequence number so
+that they are replayed in order, and after the pid of the process writing them so that
+the processes forked from a handler share its directory. They are deleted once all their
+batches are sent. The segments left by a process which exited, a previous one or a
+forked worker, are taken over by renaming them after the process replaying them.
+"""
+
+import os
+import pickle
+import struct
+import threading
+import time
+
+import redis
+
+# errors after which the delivery is retried later, other errors are not transient
+RETRY_ERRORS = (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError)
+
+SEGMENT_SUFFIX = ".seg"
+
+# the interval in seconds between two looks for the segments of the processes which exited
+ADOPT_INTERVAL = 10.0
+
+_LENGTH = struct.Struct("<I")
+
+
+class CircuitBreaker:
+    """Circuit breaker spacing out the delivery attempts while Redis is unreachable.
+
+    The breaker opens after `failure_threshold` consecutive failures, then lets a single
+    attempt through (half-open) once the backoff delay has elapsed. The delay doubles
+    after each failed attempt, up to `max_backoff`, and the breaker closes again after
+    a successful attempt.
+
+    Attributes
+    ----------
+    failure_threshold : int
+        The number of consecutive failures opening the breaker.
+    min_backoff : float
+        The delay in seconds before the first attempt once the breaker is open.
+    max_backoff : float
+        The maximum delay in seconds between two attempts.
+    state : str
+        "closed", "open" or "half_open".
+    failures : int
+        The number of consecutive failures.
+    """
+
+    def __init__(self, failure_threshold: int = 1, min_backoff: float = 0.5,
+                 max_backoff: float = 30.0) -> None:
+        self.failure_threshold = failure_threshold
+        self.min_backoff = min_backoff
+        self.max_backoff = max_backoff
+        self.state = "closed"
+        self.failures = 0
+        self._backoff = min_backoff
+        self._retry_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def closed(self) -> bool:
+        """Wether the logs can be sent right away."""
+        return self.state == "closed"
+
+    def delay(self) -> float:
+        """Return the time in seconds before the next attempt is allowed, 0 if it is."""
+        if self.state != "open":
+            return 0
+        return max(self._retry_at - time.monotonic(), 0)
+
+    def allow(self) -> bool:
+        """Return True if an attempt can be made, switching an open breaker whose delay
+        has elapsed to half-open."""
+        with self._lock:
+            if self.state == "open" and time.monotonic() >= self._retry_at:
+                self.state = "half_open"
+            return self.state != "open"
+
+    def success(self) -> None:
+        """Record a successful attempt, closing the breaker."""
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._backoff = self.min_backoff
+
+    def failure(self) -> None:
+        """Record a failed attempt, opening the breaker if needed."""
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self._retry_at = time.monotonic() + self._backoff
+                self._backoff = min(self._backoff * 2, self.max_backoff)
+
+    def __repr__(self) -> str:
+        return f"CircuitBreaker(state={self.state!r}, failures={self.failures})"
+
+
+class SpillBuffer:
+    """Append-only buffer of log batches stored in segment files.
+
+    Attributes
+    ----------
+    directory : str
+        The directory holding the segment files, it must not be shared with another
+        handler, but is shared with the processes forked from it.
+    max_bytes : int
+        The maximum total size of the segments, batches are dropped beyond it.
+    segment_bytes : int
+        The size from which a new segment is started.
+    pending_bytes : int
+        The size of the batches not replayed yet.
+    pending_logs : int
+        The number of logs not replayed yet, since the buffer was created.
+    dropped : int
+        The number of logs dropped because the buffer was full.
+
+    Methods
+    -------
+    append(logs: list)
+        Append a batch to the last segment.
+    peek()
+        Return the oldest batch not replayed yet.
+    commit()
+        Mark the batch returned by `peek` as replayed.
+    adopt()
+        Take over the segments of the processes which exited.
+    """
+
+    def __init__(self, directory: str, max_bytes: int = 64 * 2 ** 20,
+                 segment_bytes: int = 4 * 2 ** 20) -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes
+        self.dropped = 0
+        self.pending_bytes = 0
+        # the logs left by a previous process are not counted, it would require reading them
+        self.pending_logs = 0
+        self._pid = os.getpid()
+        self._segments = []
+        # the names of the adopted segments must not clash with the ones left on disk
+        self._next_seq = max((_segment_seq(name) for name in os.listdir(directory)
+                              if name.endswith(SEGMENT_SUFFIX)), default=-1) + 1
+        self._writer = None
+        self._write_name = None
+        self._reader = None
+        self._read_offset = 0
+        self._next_offset = None
+        self._next_count = 0
+        self._lock = threading.Lock()
+        # segments left by a previous process come first, new batches are always
+        # written to a new segment
+        self.adopt()
+
+    @property
+    def pending(self) -> bool:
+        """Wether there are batches waiting to be replayed."""
+        return self.pending_bytes > 0
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def append(self, logs: list) -> bool:
+        """Append a batch of logs.
+
+        Parameters
+        ----------
+        logs : list
+            The formatted logs.
+
+        Returns
+        -------
+        bool
+            False if the batch was dropped because the buffer is full.
+        """
+        data = pickle.dumps(logs, protocol=pickle.HIGHEST_PROTOCOL)
+        frame = _LENGTH.pack(len(data)) + data
+        with self._lock:
+            if self.pending_bytes + len(frame) > self.max_bytes:
+                self.dropped += len(logs)
+                return False
+            if self._writer is None or self._writer.tell() >= self.segment_bytes:
+                self._rotate()
+            self._writer.write(frame)
+            # readers use their own file object, the frame must be visible to them
+            self._writer.flush()
+            self.pending_bytes += len(frame)
+            self.pending_logs += len(logs)
+        return True
+
+    def _segment_name(self):
+        name = f"{self._next_seq:012d}-{self._pid}{SEGMENT_SUFFIX}"
+        self._next_seq += 1
+        return name
+
+    def _rotate(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._write_name = self._segment_name()
+        self._writer = open(self._path(self._write_name), "wb")
+        self._segments.append(self._write_name)
+
+    def peek(self):
+        """Return the oldest batch not replayed yet, None if there is none."""
+        with self._lock:
+            while self._segments:
+                name = self._segments[0]
+                if self._reader is None:
+                    self._reader = open(self._path(name), "rb")
+                    self._read_offset = 0
+                self._reader.seek(self._read_offset)
+                header = self._reader.read(_LENGTH.size)
+                if len(header) == _LENGTH.size:
+                    (length,) = _LENGTH.unpack(header)
+                    data = self._reader.read(length)
+                    if len(data) == length:
+                        self._next_offset = self._read_offset + _LENGTH.size + length
+                        logs = pickle.loads(data)
+                        self._next_count = len(logs)
+                        return logs
+                if name == self._write_name:
+                    return None
+                # the end of an old segment, possibly truncated by a crash
+                self._drop_segment(name)
+            return None
+
+    def _drop_segment(self, name):
+        self._reader.close()
+        self._reader = None
+        path = self._path(name)
+        self.pending_bytes -= max(os.path.getsize(path) - self._read_offset, 0)
+        os.remove(path)
+        self._segments.pop(0)
+
+    def commit(self) -> None:
+        """Mark the batch returned by the last call to `peek` as replayed."""
+        with self._lock:
+            if self._next_offset is None:
+                return
+            self.pending_bytes -= self._next_offset - self._read_offset
+            self.pending_logs = max(self.pending_logs - self._next_count, 0)
+            self._read_offset = self._next_offset
+            self._next_offset = None
+            if (self._segments[0] != self._write_name
+                    and self._read_offset >= os.path.getsize(self._path(self._segments[0]))):
+                self._drop_segment(self._segments[0])
+            elif not self.pending and self._writer is not None:
+                # everything was replayed, the segment can be started over
+                self._reader.close()
+                self._reader = None
+                self._writer.seek(0)
+                self._writer.truncate()
+                self._read_offset = 0
+
+    def adopt(self) -> int:
+        """Take over the segments of the processes which exited, to replay them after the
+        pending ones.
+
+        A segment is renamed after this process before being replayed, so that a single
+        process takes it over when several try to.
+
+        Returns
+        -------
+        int
+            The number of segments adopted.
+        """
+        with self._lock:
+            adopted = []
+            names = sorted((name for name in os.listdir(self.directory)
+                            if name.endswith(SEGMENT_SUFFIX)), key=_segment_seq)
+            for name in names:
+                if name in self._segments:
+                    continue
+                pid = _segment_pid(name)
+                if pid is not None and pid != self._pid and _pid_alive(pid):
+                    continue
+                new_name = self._segment_name()
+                try:
+                    os.rename(self._path(name), self._path(new_name))
+                except FileNotFoundError:
+                    # adopted by another process
+                    continue
+                adopted.append(new_name)
+                self.pending_bytes += os.path.getsize(self._path(new_name))
+            if adopted and self._writer is not None:
+                # the segment written so far is replayed before the adopted ones
+                self._writer.close()
+                self._writer = None
+                self._write_name = None
+            self._segments.extend(adopted)
+            return len(adopted)
+
+    def close(self) -> None:
+        """Close the segment files, the batches not replayed are kept on disk."""
+        with self._lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+            if self._reader is not None:
+                self._reader.close()
+                self._reader = None
+            if not self.pending and self._write_name is not None:
+                os.remove(self._path(self._write_name))
+                self._segments.remove(self._write_name)
+            self._write_name = None
+
+    def __repr__(self) -> str:
+        return (f"SpillBuffer(directory={self.directory!r}, "
+                f"pending_bytes={self.pending_bytes}, dropped={self.dropped})")
+
+
+def _segment_seq(name):
+    return int(name[:-len(SEGMENT_SUFFIX)].split("-")[0])
+
+
+def _segment_pid(name):
+    """Return the pid of the process which wrote a segment, None for the segments named
+    after their sequence number only."""
+    _, _, pid = name[:-len(SEGMENT_SUFFIX)].partition("-")
+    return int(pid) if pid else None
+
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # the process exists but belongs to another user
+        return True
+    return True
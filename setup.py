@@ -41,5 +41,10 @@ setup(
         "Programming Language :: Python :: 3.10",
         "Programming Language :: Python :: 3.11",
     ],
-    extras_require={},
+    extras_require={
+        "orjson": ["orjson"],
+        "msgpack": ["msgpack"],
+        "lz4": ["lz4"],
+        "zstd": ["zstandard"],
+    },
 )
@@ -0,0 +1,111 @@
+import os
+import time
+
+from redis import Redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
+
+from conftest import REDIS_HOST, REDIS_PORT
+from rlh import RedisStreamLogHandler
+from rlh.aggregator import LogAggregator, start_aggregator_process
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+class TestLogAggregator:
+
+    def test_forward_batches(self, redis_client, logger, tmp_path):
+        socket_path = str(tmp_path / "rlh.sock")
+        aggregator = LogAggregator(
+            RedisStreamLogHandler(redis_client=redis_client, stream_name="test_name",
+                                  batch_size=100, flush_interval=0.05),
+            socket_path)
+        aggregator.start()
+
+        # The worker handler does not need Redis
+        handler = RedisStreamLogHandler(aggregator=socket_path, batch_size=5, port=1)
+        logger.addHandler(handler)
+        for i in range(12):
+            logger.info('Testing my redis logger %s', i)
+        handler.close()
+
+        assert wait_for(lambda: redis_client.xlen("test_name") == 12)
+        aggregator.close()
+        assert not os.path.exists(socket_path)
+
+        res = redis_client.xrange("test_name", "-", "+")
+        assert [elt[1]["msg"] for elt in res] == [f'Testing my redis logger {i}'
+                                                  for i in range(12)]
+        assert handler.stats()["logs_sent"] == 12
+
+    def test_no_shedding(self, logger, tmp_path):
+        socket_path = str(tmp_path / "rlh.sock")
+        # The aggregator handler cannot reach Redis and its buffer fills up
+        aggregator = LogAggregator(
+            RedisStreamLogHandler(redis_client=Redis(port=1, retry=Retry(NoBackoff(), 0)),
+                                  check_conn=False, batch_size=100, max_buffer_entries=10,
+                                  retry_backoff=(10, 10)),
+            socket_path)
+        aggregator.start()
+
+        handler = RedisStreamLogHandler(aggregator=socket_path, batch_size=12)
+        logger.addHandler(handler)
+        for i in range(12):
+            logger.info('Testing my redis logger %s', i)
+
+        # The level of the logs is unknown, they are only dropped at the limit
+        assert wait_for(lambda: aggregator.handler.dropped == 2)
+        assert len(aggregator.handler.log_buffer) == 10
+        assert aggregator.handler.dropped_by_level == {}
+        aggregator.stop()
+        aggregator.handler.log_buffer = []
+        aggregator.close()
+
+    def test_aggregator_process(self, redis_client, logger, tmp_path):
+        socket_path = str(tmp_path / "rlh.sock")
+        process = start_aggregator_process(socket_path, RedisStreamLogHandler,
+                                           stream_name="test_name", batch_size=100,
+                                           flush_interval=0.05, host=REDIS_HOST,
+                                           port=REDIS_PORT)
+        handler = RedisStreamLogHandler(aggregator=socket_path, batch_size=5)
+        logger.addHandler(handler)
+        for i in range(10):
+            logger.info('Testing my redis logger %s', i)
+        handler.close()
+
+        assert wait_for(lambda: redis_client.xlen("test_name") == 10)
+        process.terminate()
+        process.join(5)
+        assert process.exitcode == 0
+        assert not os.path.exists(socket_path)
+
+
+class TestFork:
+
+    def test_buffer_reset_in_child(self, redis_client, logger):
+        handler = RedisStreamLogHandler(redis_client=redis_client, stream_name="test_name",
+                                        batch_size=10)
+        logger.addHandler(handler)
+        for i in range(3):
+            logger.info('Testing my redis logger %s', i)
+
+        pid = os.fork()
+        if pid == 0:
+            # The buffer of the parent is not inherited
+            ok = handler.log_buffer == [] and handler.stats()["records"] == 0
+            logger.info('Testing my redis logger from child')
+            handler.close()
+            os._exit(0 if ok else 1)
+        _, status = os.waitpid(pid, 0)
+        assert os.waitstatus_to_exitcode(status) == 0
+        handler.close()
+
+        res = redis_client.xrange("test_name", "-", "+")
+        assert sorted(elt[1]["msg"] for elt in res) == [
+            'Testing my redis logger 0', 'Testing my redis logger 1',
+            'Testing my redis logger 2', 'Testing my redis logger from child']
@@ -0,0 +1,188 @@
+import asyncio
+import json
+import logging
+
+import pytest
+from redis.asyncio import Redis
+
+from rlh import (AsyncRedisLogHandler, AsyncRedisStreamLogHandler, AsyncRedisPubSubLogHandler,
+                 AsyncRedisListLogHandler)
+
+from conftest import REDIS_HOST, REDIS_PORT
+
+
+def async_client():
+    return Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True)
+
+
+class TestAsyncRedisLogHandler:
+
+    def test_init_client_class(self):
+        # Create an AsyncRedisLogHandler instance without client
+        handler = AsyncRedisLogHandler(host="redis", port=6969)
+        # Assert that an asyncio client has been created
+        assert isinstance(handler.redis, Redis)
+
+    def test_init_block_overflow(self):
+        with pytest.raises(ValueError):
+            AsyncRedisLogHandler(overflow="block")
+
+    def test_queue_overflow(self):
+        # Without running loop, the logs stay in the queue
+        handler = AsyncRedisLogHandler(queue_size=2, overflow="drop_newest")
+        for i in range(4):
+            handler._push(f"log {i}")
+
+        assert handler.dropped == 2
+        assert list(handler._queue) == ["log 0", "log 1"]
+
+
+class TestAsyncRedisStreamLogHandler:
+
+    def test_emit_batch(self, redis_client, logger):
+        async def main():
+            handler = AsyncRedisStreamLogHandler(redis_client=async_client(),
+                                                 stream_name="test_name", batch_size=10)
+            logger.addHandler(handler)
+            for i in range(25):
+                logger.info('Testing my redis logger %s', i)
+                await asyncio.sleep(0)
+            # Only complete batches have been sent
+            await asyncio.sleep(0.1)
+            assert redis_client.xlen("test_name") == 20
+            await handler.aclose()
+
+        asyncio.run(main())
+
+        res = redis_client.xrange("test_name", "-", "+")
+        assert [elt[1]["msg"] for elt in res] == [f'Testing my redis logger {i}'
+                                                  for i in range(25)]
+
+    def test_emit_flush_interval(self, redis_client, logger):
+        async def main():
+            handler = AsyncRedisStreamLogHandler(redis_client=async_client(),
+                                                 stream_name="test_name", batch_size=10,
+                                                 flush_interval=0.1)
+            logger.addHandler(handler)
+            logger.info('Testing my redis logger')
+            await asyncio.sleep(0.3)
+            assert redis_client.xlen("test_name") == 1
+            await handler.aclose()
+
+        asyncio.run(main())
+
+    def test_emit_as_json(self, redis_client, logger):
+        async def main():
+            handler = AsyncRedisStreamLogHandler(redis_client=async_client(), as_json=True,
+                                                 stream_name="test_name")
+            logger.addHandler(handler)
+            logger.info('Testing my redis logger with JSON')
+            await handler.aclose()
+
+        asyncio.run(main())
+
+        log = json.loads(redis_client.xrange("test_name", "-", "+")[-1][1]["json"])
+        assert log["msg"] == 'Testing my redis logger with JSON'
+        assert log["levelname"] == 'INFO'
+
+    def test_emit_defer_format(self, redis_client, logger):
+        async def main():
+            handler = AsyncRedisStreamLogHandler(redis_client=async_client(), batch_size=10,
+                                                 stream_name="test_name", defer_format=True)
+            logger.addHandler(handler)
+            items = []
+            for i in range(3):
+                items.append(i)
+                logger.info('Testing my redis logger %s %s', i, items)
+            await handler.aclose()
+
+        asyncio.run(main())
+
+        res = redis_client.xrange("test_name", "-", "+")
+        assert [elt[1]["msg"] for elt in res] == [
+            f'Testing my redis logger {i} {list(range(i + 1))}' for i in range(3)]
+
+    def test_emit_client_ids_retry(self, redis_client):
+        async def main():
+            handler = AsyncRedisStreamLogHandler(redis_client=async_client(),
+                                                 stream_name="test_name", client_ids=True)
+            logs = [handler._format_record(logging.makeLogRecord({"msg": f"log {i}"}))
+                    for i in range(5)]
+            await handler._abuffer_emit(logs[:3])
+            await handler._abuffer_emit(logs)
+            await handler.aclose()
+            return handler
+
+        handler = asyncio.run(main())
+
+        res = redis_client.xrange("test_name", "-", "+")
+        assert [elt[1]["msg"] for elt in res] == [f"log {i}" for i in range(5)]
+        assert handler.duplicates == 3
+
+    @pytest.mark.parametrize("handler_args", [
+        {"shards": 2},
+        {"route": {logging.ERROR: "test_errors"}},
+    ])
+    def test_emit_script_streams(self, redis_client, logger, handler_args):
+        async def main():
+            handler = AsyncRedisStreamLogHandler(redis_client=async_client(), batch_size=4,
+                                                 stream_name="test_name", use_script=True,
+                                                 **handler_args)
+            logger.addHandler(handler)
+            for i in range(4):
+                logger.log(logging.ERROR if i % 2 else logging.INFO,
+                           'Testing my redis logger %s', i)
+            await handler.aclose()
+
+        asyncio.run(main())
+
+        # The logs are split between two streams, a script call each
+        streams = ["test_name:0", "test_name:1"] if "shards" in handler_args \
+            else ["test_name", "test_errors"]
+        res = [redis_client.xrange(name, "-", "+") for name in streams]
+        assert [[elt[1]["msg"] for elt in stream] for stream in res] == [
+            ['Testing my redis logger 0', 'Testing my redis logger 2'],
+            ['Testing my redis logger 1', 'Testing my redis logger 3']]
+
+
+class TestAsyncRedisPubSubLogHandler:
+
+    def test_emit(self, redis_client, logger):
+        p = redis_client.pubsub()
+        p.subscribe("test_name")
+        assert p.get_message(timeout=10)["type"] == "subscribe"
+
+        async def main():
+            handler = AsyncRedisPubSubLogHandler(redis_client=async_client(),
+                                                 channel_name="test_name", batch_size=5)
+            logger.addHandler(handler)
+            for i in range(3):
+                logger.info('Testing my redis logger %s', i)
+            await handler.aclose()
+
+        asyncio.run(main())
+
+        for i in range(3):
+            mess = p.get_message(ignore_subscribe_messages=True, timeout=10)
+            log = json.loads(mess["data"])
+            assert log["msg"] == f'Testing my redis logger {i}'
+
+
+class TestAsyncRedisListLogHandler:
+
+    def test_emit_batch(self, redis_client, logger):
+        async def main():
+            handler = AsyncRedisListLogHandler(redis_client=async_client(),
+                                               list_name="test_logs", batch_size=10,
+                                               maxlen=20)
+            logger.addHandler(handler)
+            for i in range(25):
+                logger.info('Testing my redis logger %s', i)
+                await asyncio.sleep(0)
+            await handler.aclose()
+
+        asyncio.run(main())
+
+        logs = [json.loads(log) for log in redis_client.lrange("test_logs", 0, -1)]
+        assert [log["msg"] for log in logs] == [f'Testing my redis logger {i}'
+                                                for i in range(5, 25)]
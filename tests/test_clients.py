@@ -0,0 +1,76 @@
+import time
+
+import pytest
+from redis import Redis
+
+from rlh import RedisListLogHandler, RedisPubSubLogHandler, RedisStreamLogHandler
+from rlh import clients
+from rlh.clients import get_client, ping_once
+
+from conftest import REDIS_HOST, REDIS_PORT
+
+
+@pytest.fixture(autouse=True)
+def clear_clients():
+    yield
+    clients.clear()
+
+
+class TestGetClient:
+
+    def test_shared(self):
+        client = get_client(Redis, host=REDIS_HOST, port=REDIS_PORT)
+        assert get_client(Redis, port=REDIS_PORT, host=REDIS_HOST) is client
+        assert get_client(Redis, host=REDIS_HOST, port=REDIS_PORT, db=1) is not client
+
+    def test_unhashable_not_shared(self):
+        args = {"host": REDIS_HOST, "port": REDIS_PORT, "retry_on_error": []}
+        assert get_client(Redis, **args) is not get_client(Redis, **args)
+
+    def test_ping_once(self):
+        client = get_client(Redis, host=REDIS_HOST, port=REDIS_PORT)
+        ping_once(client)
+        # The client is not pinged again
+        client.ping = None
+        ping_once(client)
+
+
+class TestHandlerClients:
+
+    def test_share_client(self):
+        handlers = [RedisStreamLogHandler(host=REDIS_HOST, port=REDIS_PORT),
+                    RedisPubSubLogHandler(host=REDIS_HOST, port=REDIS_PORT),
+                    RedisListLogHandler(host=REDIS_HOST, port=REDIS_PORT)]
+        assert len({id(handler.redis.connection_pool) for handler in handlers}) == 1
+
+    def test_no_share_client(self):
+        handlers = [RedisStreamLogHandler(host=REDIS_HOST, port=REDIS_PORT, share_client=False)
+                    for _ in range(2)]
+        assert handlers[0].redis is not handlers[1].redis
+
+    def test_dedicated_connection(self, redis_client, logger):
+        handler = RedisStreamLogHandler(host=REDIS_HOST, port=REDIS_PORT,
+                                        decode_responses=True, stream_name="test_name",
+                                        dedicated_connection=True)
+        shared = RedisStreamLogHandler(host=REDIS_HOST, port=REDIS_PORT,
+                                       decode_responses=True)
+        pool = handler.redis.connection_pool
+        assert pool is not shared.redis.connection_pool
+        assert pool.max_connections == 1
+        assert pool.connection_kwargs["decode_responses"]
+
+        logger.addHandler(handler)
+        logger.info('Testing my redis logger')
+        res = redis_client.xrange("test_name", "-", "+")
+        assert res[0][1]["msg"] == 'Testing my redis logger'
+
+    def test_check_conn_background(self, capsys):
+        # The creation of the handler does not raise
+        handler = RedisStreamLogHandler(port=1, check_conn="background")
+        for _ in range(50):
+            if "Logging error" in capsys.readouterr().err:
+                break
+            time.sleep(0.1)
+        else:
+            pytest.fail("The failed ping was not reported")
+        handler.close()
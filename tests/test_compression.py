@@ -0,0 +1,51 @@
+import pytest
+
+from rlh.compression import (CompressionStats, check_codec, pack_batch, unpack_batch,
+                             unpack_message, unpack_stream_entry)
+
+
+@pytest.fixture(params=["zlib", "lz4", "zstd"])
+def codec(request):
+    if request.param == "lz4":
+        pytest.importorskip("lz4")
+    if request.param == "zstd":
+        pytest.importorskip("zstandard")
+    return request.param
+
+
+class TestBatchCompression:
+
+    def test_stream_entries(self, codec):
+        logs = [{"msg": f"Testing my redis logger {i}", "levelno": 20, "created": 1.5}
+                for i in range(100)]
+        packed = pack_batch(logs, codec)
+
+        unpacked = unpack_stream_entry({b"batch": packed, b"count": b"100"})
+        assert unpacked == [{b"msg": f"Testing my redis logger {i}".encode(),
+                             b"levelno": b"20", b"created": b"1.5"} for i in range(100)]
+
+    def test_messages(self, codec):
+        logs = [b'{"msg": "log"}', '{"msg": "log"}']
+        assert unpack_message(pack_batch(logs, codec)) == [b'{"msg": "log"}'] * 2
+
+    def test_not_packed(self):
+        assert unpack_stream_entry({b"msg": b"log"}) == [{b"msg": b"log"}]
+        assert unpack_message(b'{"msg": "log"}') == [b'{"msg": "log"}']
+
+    def test_stats(self):
+        stats = CompressionStats()
+        assert stats.ratio == 1.0
+        pack_batch([{"msg": "Testing my redis logger"}] * 1000, "zlib", stats)
+
+        assert stats.batches == 1
+        assert stats.compressed_bytes < stats.raw_bytes
+        assert stats.ratio > 10
+        assert stats.cpu_time >= 0
+
+    def test_unknown_codec(self):
+        with pytest.raises(ValueError):
+            check_codec("unknown")
+
+    def test_invalid_batch(self):
+        with pytest.raises(ValueError):
+            unpack_batch(b"invalid data")
@@ -0,0 +1,138 @@
+import asyncio
+import json
+import logging
+import pickle
+
+import pytest
+from redis.asyncio import Redis
+
+from rlh import AsyncRedisStreamLogHandler, RedisPubSubLogHandler, RedisStreamLogHandler
+from rlh.dedup import collapse_records
+from rlh.handlers import CapturedRecord
+
+from conftest import REDIS_HOST, REDIS_PORT
+
+
+def capture(msg, args=None, name="app", level=logging.INFO, created=None):
+    record = logging.LogRecord(name, level, __file__, 0, msg, args, None)
+    if created is not None:
+        record.created = created
+    return CapturedRecord(record)
+
+
+class TestCollapseRecords:
+
+    @pytest.mark.parametrize("mode, counts", [
+        ("exact", [2, 1, 1, 1]),
+        ("template", [3, 1, 1]),
+    ])
+    def test_collapse(self, mode, counts):
+        records = [capture("user %s logged in", ("alice",), created=1),
+                   capture("user %s logged in", ("bob",), created=2),
+                   capture("user %s logged in", ("alice",), created=3),
+                   capture("user %s logged in", ("alice",), level=logging.ERROR),
+                   capture("user %s logged in", ("alice",), name="other")]
+        repeated = collapse_records(records, mode)
+
+        assert [elt.count for elt in repeated] == counts
+        assert repeated[0].captured is records[0]
+        assert (repeated[0].first_created, repeated[0].last_created) == (1, 3)
+
+    def test_restore(self):
+        repeated = collapse_records([capture("log", created=1), capture("log", created=2),
+                                     capture("other")], "exact")
+        record = repeated[0].restore()
+        assert (record.count, record.first_created, record.last_created) == (2, 1, 2)
+        # The captured record is left unchanged
+        assert not hasattr(repeated[0].captured.record, "count")
+        # A record that is not repeated is restored as it is
+        assert not hasattr(repeated[1].restore(), "count")
+
+    def test_exception_not_collapsed(self):
+        records = [capture("failure"), capture("failure")]
+        records[0].record.exc_info = (ValueError, ValueError(), None)
+        assert [elt.count for elt in collapse_records(records, "exact")] == [1, 1]
+
+
+class TestHandlerDedup:
+
+    def test_init_invalid_dedup(self):
+        with pytest.raises(ValueError):
+            RedisStreamLogHandler(check_conn=False, dedup="fuzzy")
+        with pytest.raises(ValueError):
+            RedisStreamLogHandler(check_conn=False, dedup="exact", as_bin=True)
+
+    def test_emit_fields(self, redis_client, logger):
+        handler = RedisStreamLogHandler(redis_client=redis_client, stream_name="test_name",
+                                        batch_size=10, dedup="exact")
+        logger.addHandler(handler)
+        for i in range(12):
+            logger.info('Testing my redis logger %s', i % 2)
+        handler.close()
+
+        # A log per message and per batch
+        res = redis_client.xrange("test_name", "-", "+")
+        assert [(elt[1]["msg"], elt[1]["count"]) for elt in res[:2]] == [
+            ('Testing my redis logger 0', '5'), ('Testing my redis logger 1', '5')]
+        assert float(res[0][1]["first_created"]) <= float(res[0][1]["last_created"])
+        assert [elt[1]["msg"] for elt in res[2:]] == ['Testing my redis logger 0',
+                                                      'Testing my redis logger 1']
+        assert "count" not in res[2][1]
+        assert handler.stats()["collapsed"] == 8
+
+    def test_emit_template_as_pkl(self, redis_client_no_decode, logger):
+        handler = RedisStreamLogHandler(redis_client=redis_client_no_decode,
+                                        stream_name="test_name", batch_size=3,
+                                        as_pkl=True, dedup="template")
+        logger.addHandler(handler)
+        for i in range(3):
+            logger.info('Testing my redis logger %s', i)
+
+        res = redis_client_no_decode.xrange("test_name", "-", "+")
+        assert len(res) == 1
+        record = pickle.loads(res[0][1][b"pkl"])
+        # The message is the one of the first record
+        assert record.getMessage() == 'Testing my redis logger 0'
+        assert record.count == 3
+
+    def test_publish_json(self, redis_client, logger):
+        handler = RedisPubSubLogHandler(redis_client=redis_client, channel_name="test_name",
+                                        batch_size=3, dedup="exact")
+        logger.addHandler(handler)
+        pubsub = redis_client.pubsub()
+        pubsub.subscribe("test_name")
+        pubsub.get_message(timeout=1)
+        for _ in range(3):
+            logger.info('Testing my redis logger')
+
+        message = json.loads(pubsub.get_message(timeout=1)["data"])
+        assert (message["msg"], message["count"]) == ('Testing my redis logger', 3)
+        assert pubsub.get_message(timeout=0.1) is None
+
+    def test_emit_background(self, redis_client, logger):
+        handler = RedisStreamLogHandler(redis_client=redis_client, stream_name="test_name",
+                                        batch_size=100, background=True, dedup="exact")
+        logger.addHandler(handler)
+        for _ in range(50):
+            logger.info('Testing my redis logger')
+        handler.close()
+
+        res = redis_client.xrange("test_name", "-", "+")
+        assert sum(int(elt[1].get("count", 1)) for elt in res) == 50
+        assert len(res) < 50
+
+    def test_emit_async(self, redis_client, logger):
+        async def main():
+            handler = AsyncRedisStreamLogHandler(
+                redis_client=Redis(host=REDIS_HOST, port=REDIS_PORT, decode_responses=True),
+                stream_name="test_name", batch_size=10, dedup="exact")
+            logger.addHandler(handler)
+            for _ in range(10):
+                logger.info('Testing my redis logger')
+            await handler.aclose()
+
+        asyncio.run(main())
+
+        res = redis_client.xrange("test_name", "-", "+")
+        assert [(elt[1]["msg"], elt[1]["count"]) for elt in res] == [
+            ('Testing my redis logger', '10')]
@@ -0,0 +1,126 @@
+import collections
+import logging
+
+import pytest
+
+from rlh import RedisStreamLogHandler
+from rlh.filters import RateLimitFilter, SamplingFilter, TokenBucket, summary_record
+
+
+def make_record(name="app", level=logging.INFO, msg="log"):
+    return logging.LogRecord(name, level, __file__, 0, msg, None, None)
+
+
+class TestTokenBucket:
+
+    def test_take(self):
+        bucket = TokenBucket(rate=2, burst=3)
+        now = bucket.updated
+        assert [bucket.take(now) for _ in range(4)] == [True, True, True, False]
+        # Half a second adds a token
+        assert bucket.take(now + 0.5)
+        assert not bucket.take(now + 0.5)
+        # The tokens are capped by the burst
+        assert [bucket.take(now + 100) for _ in range(4)] == [True, True, True, False]
+
+
+class TestRateLimitFilter:
+
+    def test_filter_by_name_and_level(self):
+        rate_filter = RateLimitFilter(rate=1, burst=2)
+        records = [make_record()] * 5 + [make_record(level=logging.ERROR)] * 3 \
+            + [make_record(name="other")] * 2
+        kept = [rate_filter.filter(record) for record in records]
+
+        assert kept == [True, True, False, False, False, True, True, False, True, True]
+        assert rate_filter.pop_suppressed() == {("app", "INFO"): 3, ("app", "ERROR"): 1}
+        assert rate_filter.pop_suppressed() == {}
+        assert rate_filter.dropped == 4
+
+    def test_filter_by_attribute(self):
+        rate_filter = RateLimitFilter(rate=1, burst=1, key="name")
+        records = [make_record(), make_record(level=logging.ERROR), make_record(name="other")]
+        assert [rate_filter.filter(record) for record in records] == [True, False, True]
+        assert rate_filter.pop_suppressed() == {"app": 1}
+
+
+class TestSamplingFilter:
+
+    def test_filter_by_level(self):
+        sampling_filter = SamplingFilter({logging.DEBUG: 0, logging.INFO: 0.5,
+                                          logging.WARNING: 1}, seed=42)
+        debug = [sampling_filter.filter(make_record(level=logging.DEBUG))
+                 for _ in range(100)]
+        info = [sampling_filter.filter(make_record()) for _ in range(1000)]
+        error = [sampling_filter.filter(make_record(level=logging.ERROR))
+                 for _ in range(100)]
+
+        assert not any(debug)
+        assert 400 < sum(info) < 600
+        assert all(error)
+        assert sampling_filter.pop_suppressed() == {("app", "DEBUG"): 100,
+                                                    ("app", "INFO"): 1000 - sum(info)}
+
+    def test_filter_fraction(self):
+        sampling_filter = SamplingFilter(0.1, seed=1)
+        kept = sum(sampling_filter.filter(make_record(level=logging.ERROR))
+                   for _ in range(1000))
+        assert 50 < kept < 150
+        assert sampling_filter.dropped == 1000 - kept
+
+
+def test_summary_record():
+    record = summary_record(collections.Counter({("app", "INFO"): 3}),
+                            collections.Counter({("app", "DEBUG"): 2}), 60)
+    assert record.name == "rlh.suppressed"
+    assert record.levelno == logging.WARNING
+    assert record.getMessage() == ("5 records suppressed in the last 60s (rate limited: "
+                                   "{'app:INFO': 3}, sampled out: {'app:DEBUG': 2})")
+    assert record.rate_limited == {"app:INFO": 3}
+
+
+class TestHandlerFilters:
+
+    def test_rate_limit_summary(self, redis_client, logger):
+        handler = RedisStreamLogHandler(redis_client=redis_client, stream_name="test_name",
+                                        fields=["msg", "name"], rate_limit=1, rate_burst=5)
+        logger.addHandler(handler)
+        for i in range(20):
+            logger.info('Testing my redis logger %s', i)
+        assert handler.stats()["rate_limited"] == 15
+
+        # The suppressed records are logged when the handler is closed
+        handler.close()
+        res = redis_client.xrange("test_name", "-", "+")
+        assert [elt[1]["msg"] for elt in res[:5]] == [f'Testing my redis logger {i}'
+                                                      for i in range(5)]
+        assert res[5][1]["name"] == "rlh.suppressed"
+        assert res[5][1]["msg"].startswith("15 records suppressed")
+
+    def test_summary_interval(self, redis_client, logger):
+        handler = RedisStreamLogHandler(redis_client=redis_client, stream_name="test_name",
+                                        sample={logging.INFO: 0, logging.WARNING: 1},
+                                        summary_interval=0)
+        logger.addHandler(handler)
+        logger.info('Testing my redis logger')
+        logger.warning('Testing my redis logger')
+
+        # The sampled out record is logged before the next one
+        res = redis_client.xrange("test_name", "-", "+")
+        assert [elt[1]["msg"] for elt in res] == [
+            "1 records suppressed in the last 0s (rate limited: {}, sampled out: "
+            "{'test_rlh:INFO': 1})",
+            'Testing my redis logger']
+        assert handler.stats()["sampled_out"] == 1
+
+    @pytest.mark.parametrize("handler_args", [{}, {"summary_interval": 0}])
+    def test_no_summary(self, redis_client, logger, handler_args):
+        handler = RedisStreamLogHandler(redis_client=redis_client, stream_name="test_name",
+                                        rate_limit=100, **handler_args)
+        logger.addHandler(handler)
+        logger.info('Testing my redis logger')
+        logger.info('Testing my redis logger')
+        handler.close()
+
+        # Nothing was suppressed
+        assert redis_client.xlen("test_name") == 2
@@ -1,10 +1,25 @@
 import json
+import logging
+import os
 import pickle
+import threading
+import time
 
 import pytest
+from redis import Redis
+from redis.backoff import NoBackoff
+from redis.retry import Retry
 
-from rlh import RedisLogHandler, RedisStreamLogHandler, RedisPubSubLogHandler
-from rlh.handlers import DEFAULT_FIELDS
+from rlh import (RedisLogHandler, RedisStreamLogHandler, RedisPubSubLogHandler,
+                 RedisListLogHandler, RedisStreamLogReader)
+from rlh.handlers import DEFAULT_FIELDS, CapturedRecord, _compile_fields, _make_fields
+from rlh.compression import unpack_message, unpack_stream_entry
+from rlh.records import decode_record
+
+
+def unreachable_client():
+    # a client failing right away, without retrying
+    return Redis(port=1, retry=Retry(NoBackoff(), 0))
 
 
 class TestRedisLogHandler:
@@ -53,6 +68,262 @@ class TestRedisLogHandler:
         with pytest.raises(NotImplementedError):
             handler._buffer_emit()
 
+    def test_init_invalid_compression(self, redis_client):
+        with pytest.raises(ValueError):
+            RedisLogHandler(redis_client=redis_client, compression="invalid")
+
+    def test_max_buffer_entries_shedding(self, logger):
+        # Create a handler whose buffer holds at most 10 logs, INFO logs being shed at 5,
+        # and whose Redis is unreachable
+        handler = RedisStreamLogHandler(redis_client=unreachable_client(),
+                                        check_conn=False, stream_name="test_name",
+                                        batch_size=100, max_buffer_entries=10,
+                                        retry_backoff=(10, 10))
+        logger.addHandler(handler)
+        for i in range(8):
+            logger.info('Testing my redis logger %s', i)
+        for i in range(12):
+            logger.warning('Testing my redis warning %s', i)
+
+        # The WARNING logs evict the oldest INFO ones, then are dropped once none is left
+        assert [log["msg"] for log in handler.log_buffer] == [
+            f'Testing my redis warning {i}' for i in range(10)]
+        assert handler.dropped == 10
+        assert handler.dropped_by_level == {"INFO": 8, "WARNING": 2}
+        # A single flush was tried, the breaker spacing out the next ones
+        assert handler.breaker.state == "open"
+
+    def test_max_buffer_entries_outage_ends(self, redis_client, logger):
+        handler = RedisStreamLogHandler(redis_client=unreachable_client(),
+                                        check_conn=False, stream_name="test_name",
+                                        batch_size=100, max_buffer_entries=20,
+                                        retry_backoff=(0.01, 0.01))
+        logger.addHandler(handler)
+        for i in range(25):
+            logger.warning('Testing my redis logger %s', i)
+        assert handler.dropped == 5
+
+        # The full buffer is sent once Redis is back, instead of dropping the next logs
+        handler.redis = redis_client
+        time.sleep(0.02)
+        for i in range(100):
+            logger.warning('Testing my redis logger %s', i)
+        handler.close()
+
+        assert redis_client.xlen("test_name") == 120
+        assert handler.dropped == 5
+
+    def test_max_buffer_bytes(self, logger):
+        handler = RedisStreamLogHandler(redis_client=unreachable_client(), check_conn=False,
+                                        stream_name="test_name", batch_size=1000,
+                                        max_buffer_bytes=1000, fields=["msg"],
+                                        retry_backoff=(10, 10))
+        logger.addHandler(handler)
+        for i in range(100):
+            logger.error('Testing my redis logger %s', i)
+
+        # The buffer size is tracked, and bounded (up to one log)
+        assert 1000 <= handler.buffer_bytes < 1100
+        assert handler.dropped == 100 - len(handler.log_buffer)
+        assert handler.dropped_by_level == {"ERROR": handler.dropped}
+
+    def test_stats(self, redis_client, logger):
+        batches = []
+        handler = RedisStreamLogHandler(redis_client=redis_client, stream_name="test_name",
+                                        batch_size=10,
+                                        metrics_hook=lambda *args: batches.append(args))
+        logger.addHandler(handler)
+        for i in range(25):
+            logger.info('Testing my redis logger %s', i)
+
+        stats = handler.stats()
+        assert stats["records"] == 25
+        assert stats["batches"] == 2
+        assert stats["logs_sent"] == 20
+        assert stats["bytes_sent"] > 0
+        assert stats["errors"] == 0
+        assert stats["buffer_depth"] == 5
+        assert stats["flush_latency"]["count"] == 2
+        assert [count for count, _, _, error in batches] == [10, 10]
+
+    def test_stats_bytes_sent(self, redis_client, logger):
+        batches = []
+        handler = RedisStreamLogHandler(redis_client=redis_client, stream_name="test_name",
+                                        batch_size=3,
+                                        metrics_hook=lambda *args: batches.append(args))
+        logger.addHandler(handler)
+        logger.info('short')
+        logger.info('a much longer log message %s', 'x' * 500)
+        logger.info('short again')
+
+        entries = redis_client.xrange("test_name")
+        size = sum(len(key) + len(value) for _, fields in entries for key, value in fields.items())
+        assert handler.stats()["bytes_sent"] == batches[0][1] == size
+
+    def test_metrics_hook_error(self, redis_client, logger, capsys):
+        failures = [ValueError("export failed")]
+
+        def hook(*args):
+            if failures:
+                raise failures.pop()
+
+        handler = RedisStreamLogHandler(redis_client=redis_client, stream_name="test_name",
+                                        batch_size=2, metrics_hook=hook)
+        logger.addHandler(handler)
+        for i in range(4):
+            logger.info('Testing my redis logger %s', i)
+
+        # The error of the hook is reported, the batch is not sent again
+        assert "export failed" in capsys.readouterr().err
+        res = redis_client.xrange("test_name", "-", "+")
+        assert [elt[1]["msg"] for elt in res] == [f'Testing my redis logger {i}'
+                                                  for i in range(4)]
+        assert handler.stats()["logs_sent"] == 4
+
+    def test_metrics_hook_error_spill(self, logger, tmp_path):
+        def hook(*args):
+            raise ValueError("export failed")
+
+        handler = RedisStreamLogHandler(redis_client=unreachable_client(), check_conn=False,
+                                        stream_name="test_name", metrics_hook=hook,
+                                        spill_dir=str(tmp_path), retry_backoff=(10, 10))
+        logger.addHandler(handler)
+        logger.info('Testing my redis logger')
+
+        # The connection error is not masked by the error of the hook
+        assert handler.spill.pending_logs == 1
+        handler.close()
+
+    def test_stats_disabled(self, redis_client, logger):
+        handler = RedisStreamLogHandler(redis_client=redis_client, stream_name="test_name",
+                                        metrics=False)
+        logger.addHandler(handler)
+        logger.info('Testing my redis logger')
+
+        assert handler.metrics is None
+        assert "batches" not in handler.stats()
+        assert handler.stats()["buffer_depth"] == 0
+
+    def test_init_invalid_overflow(self, redis_client):
+        with pytest.raises(ValueError):
+            RedisLogHandler(redis_client=redis_client, overflow="invalid")
+
+    @pytest.mark.parametrize("overflow,expected", [
+        ("drop_newest", ["log 0", "log 1"]),
+        ("drop_oldest", ["log 2", "log 3"]),
+    ])
+    def test_background_overflow(self, redis_client, overflow, expected):
+        handler = RedisLogHandler(redis_client=redis_client, background=True,
+                                  queue_size=2, overflow=overflow)
+        # Stopping the writer so that the queue fills up
+        handler._stop_writer(1)
+        for i in range(4):
+            handler._push(f"log {i}")
+
+        assert handler.dropped == 2
+        assert list(handler._queue.queue) == expected
+
+    @pytest.mark.parametrize("defer_format, background, expected", [
+        (False, True, False),
+        (True, False, False),
+        (True, True, True),
+    ])
+    def test_init_defer_format(self, redis_client, defer_format, background, expected):
+        handler = RedisLogHandler(redis_client=redis_client, defer_format=defer_format,
+                                  background=background)
+        # Logs are only captured when a writer thread formats them
+        assert handler._defer is expected
+        handler.close()
+
+
+class TestCapturedRecord:
+
+    @pytest.mark.parametrize("args", [
+        (),
+        ("text", 1, 2.5, None),
+    ])
+    def test_immutable_args(self, args):
+        record = logging.makeLogRecord({"msg": "msg" + " %s" * len(args), "args": args})
+        captured = CapturedRecord(record)
+        # Immutable arguments are kept as they are, the record is not copied
+        assert captured.args is record.args
+        assert captured.restore() is record
+
+    def test_mutated_args(self):
+        items = [1, 2]
+        record = logging.makeLogRecord({"msg": "items %s", "args": (items,)})
+        captured = CapturedRecord(record)
+        # The caller mutates its list after emitting the log
+        items.append(3)
+        assert captured.restore().getMessage() == "items [1, 2]"
+
+    def test_mutated_dict_args(self):
+        record = logging.LogRecord("test", logging.INFO, __file__, 1, "%(user)s",
+                                   ({"user": "alice"},), None)
+        captured = CapturedRecord(record)
+        record.args["user"] = "bob"
+        assert captured.restore().getMessage() == "alice"
+
+    def test_mutated_msg(self):
+        state = {"state": "before"}
+        record = logging.makeLogRecord({"msg": state})
+        captured = CapturedRecord(record)
+        # The caller mutates the object it logged after emitting the log
+        state["state"] = "after"
+        assert captured.restore().getMessage() == "{'state': 'before'}"
+
+    def test_mutated_record(self):
+        record = logging.makeLogRecord({"msg": "msg %s", "args": (1,)})
+        captured = CapturedRecord(record)
+        # Another handler changes the record before the writer formats it
+        record.msg = "changed"
+        record.args = None
+        restored = captured.restore()
+        assert restored is not record
+        assert restored.getMessage() == "msg 1"
+        assert restored.created == record.created
+
+    def test_mutated_attributes(self):
+        record = logging.makeLogRecord({"msg": "msg", "levelname": "INFO", "user": "alice"})
+        captured = CapturedRecord(record, ("levelname", "created", "user"))
+        created = record.created
+        # Another handler colors the level and rewrites the fields before the writer
+        record.levelname = "\x1b[32mINFO\x1b[0m"
+        record.created = created + 1
+        record.user = "bob"
+        restored = captured.restore()
+        assert restored is not record
+        assert (restored.levelname, restored.created, restored.user) == (
+            "INFO", created, "alice")
+
+
+class TestCompileFields:
+
+    @pytest.mark.parametrize("fields", [
+        DEFAULT_FIELDS,
+        ["levelno", "name", "lineno", "module", "funcName", "thread", "process"],
+        ["msg", "custom"],
+        ["custom"],
+        ["invalid_field"],
+    ])
+    @pytest.mark.parametrize("msg,args", [
+        ("Testing my redis logger", None),
+        ("Testing my redis logger %s", (42,)),
+        (ValueError("error"), None),
+    ])
+    def test_same_as_make_fields(self, fields, msg, args):
+        record = logging.makeLogRecord({"msg": msg, "args": args, "custom": "value"})
+        assert _compile_fields(fields)(record) == _make_fields(record, fields)
+
+    def test_empty_fields(self, log_record):
+        assert list(_compile_fields([])(log_record).keys()) == DEFAULT_FIELDS
+
+    def test_fields_setter(self):
+        handler = RedisStreamLogHandler(check_conn=False)
+        handler.fields = ["levelno"]
+        record = logging.makeLogRecord({"levelno": logging.INFO})
+        assert handler._extract_fields(record) == {"levelno": logging.INFO}
+
 
 class TestRedisStreamLogHandler:
 
@@ -65,6 +336,8 @@ class TestRedisStreamLogHandler:
         assert handler.approximate
         assert handler.fields == DEFAULT_FIELDS
         assert not handler.as_pkl
+        assert not handler.transaction
+        assert not handler.use_script
 
     def test_init_custom_params(self):
         # Create a RedisStreamLogHandler instance with custom fields
@@ -128,6 +401,22 @@ class TestRedisStreamLogHandler:
         assert log.msg == 'Testing my redis logger'
         assert log.levelname == 'INFO'
 
+    def test_emit_as_bin(self, redis_client_no_decode, logger):
+        # Create a RedisStreamLogHandler instance with as_bin argument
+        handler = RedisStreamLogHandler(redis_client=redis_client_no_decode,
+                                        as_bin=True, stream_name="test_logs")
+
+        # Add the handler to the logger
+        logger.addHandler(handler)
+        logger.info('Testing my redis logger %s', 'in binary')
+
+        data = redis_client_no_decode.xrange("test_logs", "-", "+")[-1][1]
+        log = decode_record(data[b"bin"])
+
+        assert log.getMessage() == 'Testing my redis logger in binary'
+        assert log.levelname == 'INFO'
+        assert log.name == 'test_rlh'
+
     def test_emit_as_json(self, redis_client, logger):
         # Create a RedisStreamLogHandler instance with as_pkl argument
         handler = RedisStreamLogHandler(redis_client=redis_client,
@@ -151,6 +440,37 @@ class TestRedisStreamLogHandler:
         assert log["msg"] == 'Testing my redis logger with JSON'
         assert log["levelname"] == 'INFO'
 
+    def test_emit_serializer(self, redis_client_no_decode, logger):
+        orjson = pytest.importorskip("orjson")
+        # Create a RedisStreamLogHandler instance with the orjson serializer
+        handler = RedisStreamLogHandler(redis_client=redis_client_no_decode,
+                                        serializer="orjson", stream_name="test_logs")
+        assert handler.as_json
+
+        # Add the handler to the logger
+        logger.addHandler(handler)
+        logger.info('Testing my redis logger with orjson')
+
+        data = redis_client_no_decode.xrange("test_logs", "-", "+")[-1][1]
+        # The entry carries its content type
+        assert data[b"content_type"] == b"application/json"
+        log = orjson.loads(data[b"json"])
+        assert log["msg"] == 'Testing my redis logger with orjson'
+
+    def test_emit_custom_serializer(self, redis_client_no_decode, logger):
+        # Create a RedisStreamLogHandler instance with a custom serializer
+        handler = RedisStreamLogHandler(redis_client=redis_client_no_decode,
+                                        serializer=lambda fields: fields["msg"].encode(),
+                                        stream_name="test_logs")
+
+        # Add the handler to the logger
+        logger.addHandler(handler)
+        logger.info('Testing my redis logger')
+
+        data = redis_client_no_decode.xrange("test_logs", "-", "+")[-1][1]
+        assert data == {b"data": b'Testing my redis logger',
+                        b"content_type": b"application/octet-stream"}
+
     def test_emit_custom_stream_name(self, redis_client, logger):
         # Create a RedisStreamLogHandler instance with custom stream_name
         handler = RedisStreamLogHandler(redis_client=redis_client,
@@ -257,6 +577,561 @@ class TestRedisStreamLogHandler:
         # Checking that the Redis stream contains at least 5 element
         assert redis_client.xlen("test_name") >= 5
 
+    @pytest.mark.parametrize("use_script", [False, True])
+    @pytest.mark.parametrize("trim_every", [None, 1])
+    def test_emit_stream_retention(self, redis_client, logger, use_script, trim_every):
+        # Logs older than a day are already in the stream
+        old_ms = int((time.time() - 2 * 86400) * 1000)
+        for i in range(3):
+            redis_client.xadd("test_name", {"msg": "old"}, id=f"{old_ms}-{i}")
+        handler = RedisStreamLogHandler(redis_client=redis_client, stream_name="test_name",
+                                        retention=86400, approximate=False,
+                                        use_script=use_script, trim_every=trim_every)
+
+        logger.addHandler(handler)
+        logger.info('Testing my redis logger')
+
+        # The old logs were trimmed by MINID
+        res = redis_client.xrange("test_name", "-", "+")
+        assert [elt[1]["msg"] for elt in res] == ['Testing my redis logger']
+
+    @pytest.mark.parametrize("use_script", [False, True])
+    def test_emit_trim_every(self, redis_client, logger, use_script):
+        # Create a RedisStreamLogHandler instance trimming the stream every 2 batches
+        handler = RedisStreamLogHandler(redis_client=redis_client, stream_name="test_name",
+                                        batch_size=5, maxlen=3, approximate=False,
+                                        trim_every=2, use_script=use_script)
+
+        logger.addHandler(handler)
+        for i in range(5):
+            logger.info('Testing my redis logger %s', i)
+        # The first batch is not trimmed
+        assert redis_client.xlen("test_name") == 5
+
+        for i in range(5, 10):
+            logger.info('Testing my redis logger %s', i)
+        res = redis_client.xrange("test_name", "-", "+")
+        assert [elt[1]["msg"] for elt in res] == [f'Testing my redis logger {i}'
+                                                  for i in range(7, 10)]
+
+    def test_trim_args(self, redis_client):
+        handler = RedisStreamLogHandler(redis_client=redis_client, retention=60,
+                                        trim_limit=100)
+        args = handler._trim_args()
+        assert args["minid"] == pytest.approx((time.time() - 60) * 1000, abs=1000)
+        assert args["limit"] == 100
+        # No trimming options without maxlen or retention
+        assert RedisStreamLogHandler(redis_client=redis_client)._trim_args() == {}
+
+    @pytest.mark.parametrize("handler_args", [
+        {"maxlen": 10, "retention": 60},
+        {"maxlen": 10, "approximate": False, "trim_limit": 100},
+    ])
+    def test_init_invalid_trim(self, redis_client, handler_args):
+        with pytest.raises(ValueError):
+            RedisStreamLogHandler(redis_client=redis_client, **handler_args)
+
+    @pytest.mark.parametrize("background", [False, True])
+    def test_emit_flush_interval(self, redis_client, logger, background):
+        # Create a RedisStreamLogHandler instance with a large batch and a flush interval
+        handler = RedisStreamLogHandler(redis_client=redis_client, stream_name="test_name",
+                                        batch_size=500, flush_interval=0.1,
+                                        background=background)
+
+        # Add the handler to the logger
+        logger.addHandler(handler)
+        logger.info('Testing my redis logger')
+
+        # Checking that the log is sent once the flush interval is elapsed
+        assert redis_client.xlen("test_name") == 0
+        time.sleep(0.5)
+        assert redis_client.xlen("test_name") == 1
+        handler.close()
+
+    def test_emit_batch_bytes(self, redis_client, logger):
+        # Create a RedisStreamLogHandler instance with a large batch and a bytes limit
+        handler = RedisStreamLogHandler(redis_client=redis_client, stream_name="test_name",
+                                        batch_size=500, batch_bytes=100)
+
+        # Add the handler to the logger
+        logger.addHandler(handler)
+        # Each entry is around 60 bytes, the buffer is sent on the second log
+        logger.info('Testing my redis logger 0')
+        assert redis_client.xlen("test_name") == 0
+        logger.info('Testing my redis logger 1')
+        assert redis_client.xlen("test_name") == 2
+        assert handler.log_buffer == []
+
+    @pytest.mark.parametrize("maxlen", [None, 5])
+    def test_emit_use_script(self, redis_client, logger, maxlen):
+        # Create a RedisStreamLogHandler instance appending batches with a Lua script
+        handler = RedisStreamLogHandler(redis_client=redis_client, stream_name="test_name",
+                                        batch_size=10, maxlen=maxlen, approximate=False,
+                                        fields=["msg", "levelname", "lineno"],
+                                        use_script=True)
+
+        # Add the handler to the logger
+        logger.addHandler(handler)
+        for i in range(10):
+            logger.info('Testing my redis logger %s', i)
+
+        res = redis_client.xrange("test_name", "-", "+")
+        expected = range(10) if maxlen is None else range(10 - maxlen, 10)
+        assert [elt[1]["msg"] for elt in res] == [f'Testing my redis logger {i}'
+                                                  for i in expected]
+        assert list(res[0][1].keys()) == ["msg", "levelname", "lineno"]
+
+    @pytest.mark.parametrize("use_script", [False, True])
+    def test_emit_compression(self, redis_client_no_decode, logger, use_script):
+        # Create a RedisStreamLogHandler instance packing its batches
+        handler = RedisStreamLogHandler(redis_client=redis_client_no_decode,
+                                        stream_name="test_name", batch_size=10,
+                                        compression="zlib", use_script=use_script)
+
+        # Add the handler to the logger
+        logger.addHandler(handler)
+        for i in range(10):
+            logger.info('Testing my redis logger %s', i)
+
+        # The batch is stored as a single entry
+        res = redis_client_no_decode.xrange("test_name", "-", "+")
+        assert len(res) == 1
+        assert res[0][1][b"count"] == b"10"
+        logs = unpack_stream_entry(res[0][1])
+        assert [log[b"msg"] for log in logs] == [f'Testing my redis logger {i}'.encode()
+                                                 for i in range(10)]
+        assert handler.compression_stats.batches == 1
+        assert handler.compression_stats.ratio > 1
+
+    def test_emit_background(self, redis_client, logger):
+        # Create a RedisStreamLogHandler instance delivering logs from a writer thread
+        handler = RedisStreamLogHandler(redis_client=redis_client, stream_name="test_name",
+                                        batch_size=10, background=True)
+
+        # Add the handler to the logger
+        logger.addHandler(handler)
+        for i in range(25):
+            logger.info('Testing my redis logger %s', i)
+
+        # Closing the handler drains the queue
+        handler.close()
+        assert not handler._writer.is_alive()
+
+        res = redis_client.xrange("test_name", "-", "+")
+        assert [elt[1]["msg"] for elt in res] == [f'Testing my redis logger {i}'
+                                                  for i in range(25)]
+
+    @pytest.mark.parametrize("ring_slots", [None, 2048])
+    def test_close_timeout(self, redis_client, logger, ring_slots):
+        handler = RedisStreamLogHandler(redis_client=redis_client, stream_name="test_name",
+                                        batch_size=10, background=True, close_timeout=0.2,
+                                        ring_slots=ring_slots, as_bin=ring_slots is not None)
+        # Slow down the delivery of the batches
+        send_logs = handler._send_logs
+
+        def slow_send_logs(logs):
+            time.sleep(0.05)
+            send_logs(logs)
+
+        handler._send_logs = slow_send_logs
+        logger.addHandler(handler)
+        for i in range(1000):
+            logger.info('Testing my redis logger %s', i)
+        handler.close()
+
+        # The writer stops at the timeout, the logs left are dropped
+        time.sleep(0.2)
+        sent = redis_client.xlen("test_name")
+        assert 0 < sent < 1000
+        assert not handler._writer.is_alive()
+        assert redis_client.xlen("test_name") == sent
+        assert handler.dropped == 1000 - sent
+        assert handler.stats()["records"] == 1000
+
+    @pytest.mark.parametrize("use_script", [False, True])
+    def test_emit_shards_round_robin(self, redis_client, logger, use_script):
+        # Create a RedisStreamLogHandler instance spreading its logs over 3 streams
+        handler = RedisStreamLogHandler(redis_client=redis_client, stream_name="test_name",
+                                        batch_size=6, shards=3, use_script=use_script)
+        assert handler.stream_names == ["test_name:0", "test_name:1", "test_name:2"]
+
+        # Add the handler to the logger
+        logger.addHandler(handler)
+        for i in range(6):
+            logger.info('Testing my redis logger %s', i)
+
+        for shard in range(3):
+            res = redis_client.xrange(f"test_name:{shard}", "-", "+")
+            assert [elt[1]["msg"] for elt in res] == [f'Testing my redis logger {i}'
+                                                      for i in (shard, shard + 3)]
+        assert handler.log_buffer == []
+
+    @pytest.mark.parametrize("shard_key", ["name", lambda record: record.name])
+    def test_emit_shards_key(self, redis_client, shard_key):
+        # Create a RedisStreamLogHandler instance sharding its logs by logger name
+        handler = RedisStreamLogHandler(redis_client=redis_client, stream_name="test_name",
+                                        fields=["msg", "name"], shards=4,
+                                        shard_key=shard_key)
+        loggers = [logging.getLogger(f"test_rlh_shard_{i}") for i in range(4)]
+        for shard_logger in loggers:
+            shard_logger.addHandler(handler)
+            for i in range(3):
+                shard_logger.warning('Testing my redis logger %s', i)
+            shard_logger.removeHandler(handler)
+
+        # The logs of a logger are always in the same shard
+        shards = {}
+        for shard in range(4):
+            for elt in redis_client.xrange(f"test_name:{shard}"):
+                shards.setdefault(elt[1]["name"], set()).add(shard)
+        assert all(len(logger_shards) == 1 for logger_shards in shards.values())
+        assert sum(redis_client.xlen(f"test_name:{i}") for i in range(4)) == 12
+
+    @pytest.mark.parametrize("use_script", [False, True])
+    def test_emit_route(self, redis_client, use_script):
+        # Create a RedisStreamLogHandler instance routing the errors and the db logs
+        handler = RedisStreamLogHandler(redis_client=redis_client, stream_name="test_name",
+                                        fields=["msg", "name"], batch_size=5,
+                                        use_script=use_script,
+                                        route={logging.ERROR: "test_errors",
+                                               "test_rlh.db": "test_db"})
+        db_logger = logging.getLogger("test_rlh.db.pool")
+        other_logger = logging.getLogger("test_rlh.dbx")
+        for route_logger in (db_logger, other_logger):
+            route_logger.addHandler(handler)
+            route_logger.setLevel(logging.INFO)
+            route_logger.propagate = False
+
+        pipelines = []
+        execute = redis_client.pipeline
+
+        def pipeline(*args, **kwargs):
+            pipelines.append(execute(*args, **kwargs))
+            return pipelines[-1]
+
+        redis_client.pipeline = pipeline
+        db_logger.info('Testing my redis logger 0')
+        other_logger.info('Testing my redis logger 1')
+        db_logger.error('Testing my redis logger 2')
+        other_logger.critical('Testing my redis logger 3')
+        db_logger.info('Testing my redis logger 4')
+        for route_logger in (db_logger, other_logger):
+            route_logger.removeHandler(handler)
+
+        # The batch is sent to the three streams in a single pipeline
+        assert len(pipelines) == 1
+        assert [elt[1]["msg"] for elt in redis_client.xrange("test_db")] == [
+            'Testing my redis logger 0', 'Testing my redis logger 4']
+        assert [elt[1]["msg"] for elt in redis_client.xrange("test_errors")] == [
+            'Testing my redis logger 2', 'Testing my redis logger 3']
+        assert [elt[1]["msg"] for elt in redis_client.xrange("test_name")] == [
+            'Testing my redis logger 1']
+
+    def test_emit_route_function(self, redis_client, logger):
+        handler = RedisStreamLogHandler(
+            redis_client=redis_client, stream_name="test_name", client_ids=True,
+            route=lambda record: "test_audit" if record.msg.startswith("audit") else None)
+        logger.addHandler(handler)
+        logger.info('audit: user logged in')
+        logger.info('Testing my redis logger')
+
+        assert redis_client.xlen("test_audit") == 1
+        assert redis_client.xlen("test_name") == 1
+
+    @pytest.mark.parametrize("handler_args", [{}, {"use_script": True}, {"trim_every": 1},
+                                              {"client_ids": True}])
+    def test_emit_route_trim(self, redis_client, logger, handler_args):
+        # The errors are kept a day, while the main stream is capped to 2 logs
+        handler = RedisStreamLogHandler(
+            redis_client=redis_client, stream_name="test_name", maxlen=2, approximate=False,
+            route={logging.ERROR: ("test_errors", {"retention": 86400})}, **handler_args)
+        logger.addHandler(handler)
+        for i in range(5):
+            logger.info('Testing my redis logger %s', i)
+            logger.error('Testing my redis logger %s', i)
+
+        assert redis_client.xlen("test_name") == 2
+        assert redis_client.xlen("test_errors") == 5
+
+    def test_init_route_shards(self):
+        with pytest.raises(ValueError):
+            RedisStreamLogHandler(check_conn=False, shards=2, route={logging.ERROR: "errors"})
+        with pytest.raises(ValueError):
+            RedisStreamLogHandler(check_conn=False, route={
+                logging.ERROR: ("errors", {"maxlen": 10, "retention": 60})})
+
+
+    def test_emit_spill(self, redis_client, logger, tmp_path):
+        # Create a RedisStreamLogHandler instance whose Redis is unreachable
+        handler = RedisStreamLogHandler(redis_client=Redis(port=1), stream_name="test_name",
+                                        check_conn=False, batch_size=2,
+                                        spill_dir=str(tmp_path), retry_backoff=(0.01, 0.05))
+
+        # Add the handler to the logger
+        logger.addHandler(handler)
+        for i in range(10):
+            logger.info('Testing my redis logger %s', i)
+
+        # The batches are spilled to disk, without retrying while the breaker is open
+        assert handler.breaker.state == "open"
+        assert handler.spill.pending
+        assert handler.log_buffer == []
+
+        # The batches are replayed in order once Redis is back
+        handler.redis = redis_client
+        deadline = time.monotonic() + 5
+        while handler.spill.pending and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert handler.breaker.closed
+        logger.info('Testing my redis logger 10')
+        logger.info('Testing my redis logger 11')
+        handler.close()
+
+        res = redis_client.xrange("test_name", "-", "+")
+        assert [elt[1]["msg"] for elt in res] == [f'Testing my redis logger {i}'
+                                                  for i in range(12)]
+        assert os.listdir(tmp_path) == []
+
+    @pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+    def test_spill_after_fork(self, logger, tmp_path):
+        handler = RedisStreamLogHandler(redis_client=unreachable_client(), check_conn=False,
+                                        stream_name="test_name", spill_dir=str(tmp_path),
+                                        retry_backoff=(10, 10))
+        logger.addHandler(handler)
+        pid = os.fork()
+        if pid == 0:
+            try:
+                logger.info('Testing my redis logger from the child')
+                ok = handler.spill.pending_logs == 1
+            finally:
+                os._exit(0 if ok else 1)
+        _, status = os.waitpid(pid, 0)
+        assert os.waitstatus_to_exitcode(status) == 0
+
+        # The child spilled to the directory of the parent, which takes its batches over
+        assert os.listdir(tmp_path) != []
+        assert not handler.spill.pending
+        assert handler.spill.adopt() == 1
+        assert [log["msg"] for log in handler.spill.peek()] == [
+            'Testing my redis logger from the child']
+        handler.close()
+
+    @pytest.mark.parametrize("background", [False, True])
+    def test_emit_lazy(self, redis_client, logger, background):
+        # Create a RedisStreamLogHandler instance whose Redis is not reachable yet
+        handler = RedisStreamLogHandler(redis_client=Redis(port=1), stream_name="test_name",
+                                        check_conn="lazy", background=background,
+                                        retry_backoff=(0.01, 0.05))
+
+        # Add the handler to the logger
+        logger.addHandler(handler)
+        for i in range(5):
+            logger.info('Testing my redis logger %s', i)
+
+        # The logs wait until Redis answers
+        assert not handler.ready(timeout=0.1)
+        assert not handler.stats()["ready"]
+        assert redis_client.xlen("test_name") == 0
+
+        # The logs are sent once Redis answers
+        handler.redis = redis_client
+        assert handler.ready(timeout=5)
+        logger.info('Testing my redis logger 5')
+        handler.close()
+
+        res = redis_client.xrange("test_name", "-", "+")
+        assert [elt[1]["msg"] for elt in res] == [f'Testing my redis logger {i}'
+                                                  for i in range(6)]
+
+    @pytest.mark.parametrize("with_spill", [False, True])
+    def test_close_lazy_never_ready(self, logger, tmp_path, with_spill):
+        spill_dir = str(tmp_path) if with_spill else None
+        handler = RedisStreamLogHandler(redis_client=unreachable_client(), check_conn="lazy",
+                                        stream_name="test_name", spill_dir=spill_dir)
+        logger.addHandler(handler)
+        for i in range(3):
+            logger.info('Testing my redis logger %s', i)
+
+        # The close does not fail, the logs are spilled or dropped
+        handler.close()
+        assert handler._closed
+        if with_spill:
+            assert handler.dropped == 0
+            assert os.listdir(tmp_path)
+        else:
+            assert handler.dropped == 3
+
+    def test_emit_lazy_background_no_block(self, logger):
+        handler = RedisStreamLogHandler(redis_client=unreachable_client(), check_conn="lazy",
+                                        background=True, queue_size=2)
+        logger.addHandler(handler)
+        # The full queue does not block until Redis answers
+        for i in range(5):
+            logger.info('Testing my redis logger %s', i)
+
+        assert handler.dropped == 3
+        handler.close()
+
+    def test_emit_lazy_bounded(self, logger):
+        handler = RedisStreamLogHandler(redis_client=Redis(port=1), check_conn="lazy",
+                                        max_buffer_entries=3, retry_backoff=(0.01, 0.05))
+        logger.addHandler(handler)
+        for i in range(5):
+            logger.warning('Testing my redis logger %s', i)
+
+        assert len(handler.log_buffer) == 3
+        assert handler.dropped == 2
+        handler.log_buffer = []
+        handler.close()
+
+
+    @pytest.mark.parametrize("handler_args", [{"as_bin": True},
+                                              {"as_json": True, "use_script": True},
+                                              {"as_pkl": True, "compression": "zlib"}])
+    def test_emit_ring(self, redis_client_no_decode, logger, handler_args):
+        # Create a RedisStreamLogHandler instance feeding its writer with a ring buffer
+        handler = RedisStreamLogHandler(redis_client=redis_client_no_decode,
+                                        stream_name="test_name", batch_size=10,
+                                        background=True, ring_slots=16, ring_slot_size=64,
+                                        **handler_args)
+
+        # Add the handler to the logger
+        logger.addHandler(handler)
+        for i in range(50):
+            logger.info('Testing my redis logger %s', i)
+        handler.close()
+        assert not handler._writer.is_alive()
+
+        reader = RedisStreamLogReader(redis_client=redis_client_no_decode,
+                                      stream_name="test_name", start_id="0", block=None,
+                                      count=1000)
+        assert [record.getMessage() for record in reader.read()] == [
+            f'Testing my redis logger {i}' for i in range(50)]
+
+    def test_ring_requires_serialized_logs(self, redis_client):
+        with pytest.raises(ValueError):
+            RedisStreamLogHandler(redis_client=redis_client, background=True, ring_slots=16)
+        with pytest.raises(ValueError):
+            RedisStreamLogHandler(redis_client=redis_client, as_bin=True, ring_slots=16)
+        with pytest.raises(ValueError):
+            RedisStreamLogHandler(redis_client=redis_client, as_pkl=True, background=True,
+                                  ring_slots=16, defer_format=True)
+
+    @pytest.mark.parametrize("shards", [1, 2])
+    def test_emit_defer_format(self, redis_client, logger, shards):
+        # Create a RedisStreamLogHandler instance formatting the logs in its writer thread
+        handler = RedisStreamLogHandler(redis_client=redis_client, stream_name="test_name",
+                                        batch_size=10, background=True, defer_format=True,
+                                        shards=shards)
+        # Stopping the writer so that the logs wait in the queue
+        handler._stop_writer(1)
+
+        logger.addHandler(handler)
+        items = []
+        for i in range(5):
+            items.append(i)
+            logger.info('Testing my redis logger %s %s', i, items)
+        # The logs are only captured by emit
+        assert all(isinstance(entry, CapturedRecord) for entry in handler._queue.queue)
+
+        handler._writer = threading.Thread(target=handler._writer_loop, daemon=True)
+        handler._writer.start()
+        handler.close()
+
+        messages = [elt[1]["msg"] for name in handler.stream_names
+                    for elt in redis_client.xrange(name, "-", "+")]
+        assert sorted(messages) == [f'Testing my redis logger {i} {list(range(i + 1))}'
+                                    for i in range(5)]
+
+    def test_emit_defer_format_mutated_record(self, redis_client, logger):
+        handler = RedisStreamLogHandler(redis_client=redis_client, stream_name="test_name",
+                                        batch_size=10, background=True, defer_format=True,
+                                        fields=["msg", "levelname", "user"])
+        handler._stop_writer(1)
+
+        class ColorHandler(logging.Handler):
+            def emit(self, record):
+                record.levelname = f"\x1b[32m{record.levelname}\x1b[0m"
+                record.user = "anonymous"
+
+        logger.addHandler(handler)
+        logger.addHandler(ColorHandler())
+        logger.info('Testing my redis logger', extra={"user": "alice"})
+
+        handler._writer = threading.Thread(target=handler._writer_loop, daemon=True)
+        handler._writer.start()
+        handler.close()
+
+        # The log is formatted with the fields of the record when it was emitted
+        res = redis_client.xrange("test_name", "-", "+")
+        assert [(elt[1]["levelname"], elt[1]["user"]) for elt in res] == [("INFO", "alice")]
+
+    def test_next_id(self, redis_client):
+        handler = RedisStreamLogHandler(redis_client=redis_client, client_ids=True)
+        # The IDs keep increasing when the logs share a ms or the clock goes back
+        assert [handler._next_id(created) for created in (1.0, 1.0, 1.0004, 2.5, 2.0)] == [
+            "1000-0", "1000-1", "1000-2", "2500-0", "2500-1"]
+
+    @pytest.mark.parametrize("handler_args", [
+        {},
+        {"use_script": True},
+        {"shards": 2},
+        {"shards": 2, "use_script": True},
+        {"compression": "zlib"},
+    ])
+    def test_emit_client_ids_retry(self, redis_client_no_decode, handler_args):
+        handler = RedisStreamLogHandler(redis_client=redis_client_no_decode,
+                                        stream_name="test_name", client_ids=True,
+                                        **handler_args)
+        logs = [handler._format_record(logging.makeLogRecord({"msg": f"log {i}"}))
+                for i in range(5)]
+        # The first attempt reached Redis but its outcome was unknown, the batch is
+        # retried along with new logs
+        handler._send_logs(logs[:3])
+        handler._send_logs(logs)
+
+        entries = [entry for name in handler.stream_names
+                   for entry in redis_client_no_decode.xrange(name, "-", "+")]
+        if "compression" in handler_args:
+            # The retried batch is packed with the new logs, under a new ID
+            assert len(entries) == 2
+            assert handler.duplicates == 0
+        else:
+            assert sorted(entry[1][b"msg"] for entry in entries) == [
+                f"log {i}".encode() for i in range(5)]
+            assert handler.duplicates == 3
+        assert handler.stats()["id_conflicts"] == 0
+
+    @pytest.mark.parametrize("use_script", [False, True])
+    def test_emit_client_ids_conflict(self, redis_client, use_script):
+        handler = RedisStreamLogHandler(redis_client=redis_client, stream_name="test_name",
+                                        client_ids=True, use_script=use_script)
+        # Another writer added a log with a higher ID
+        redis_client.xadd("test_name", {"msg": "other writer"},
+                          id=f"{int(time.time() * 1000) + 60000}-0")
+        handler._send_logs([handler._format_record(logging.makeLogRecord({"msg": "log"}))])
+
+        # The log is added with an ID assigned by Redis
+        res = redis_client.xrange("test_name", "-", "+")
+        assert [elt[1]["msg"] for elt in res] == ["other writer", "log"]
+        assert handler.id_conflicts == 1
+        assert handler.duplicates == 0
+
+    def test_client_ids_single_writer(self, redis_client):
+        with pytest.raises(ValueError):
+            RedisStreamLogHandler(redis_client=redis_client, as_bin=True, background=True,
+                                  ring_slots=16, client_ids=True)
+        with pytest.raises(ValueError):
+            RedisStreamLogHandler(aggregator="/tmp/rlh.sock", client_ids=True)
+
+    def test_format_captured_error(self, redis_client, capsys):
+        handler = RedisStreamLogHandler(redis_client=redis_client)
+        record = logging.makeLogRecord({"msg": "%d", "args": ("not a number",)})
+        # The log is dropped and the error reported
+        assert handler._format_captured(CapturedRecord(record)) is None
+        assert "TypeError" in capsys.readouterr().err
+
+
 class TestRedisPubSubLogHandler:
 
     def test_init_default_params(self):
@@ -347,6 +1222,49 @@ class TestRedisPubSubLogHandler:
         assert log.msg == 'Testing my redis logger'
         assert log.levelname == 'INFO'
 
+    def test_emit_serializer(self, redis_client_no_decode, logger):
+        msgpack = pytest.importorskip("msgpack")
+        # Create a RedisPubSubLogHandler instance with the msgpack serializer
+        handler = RedisPubSubLogHandler(redis_client=redis_client_no_decode,
+                                        serializer="msgpack", channel_name="test_logs")
+
+        # Add the handler to the logger
+        logger.addHandler(handler)
+
+        p = redis_client_no_decode.pubsub()
+        p.subscribe("test_logs")
+        assert p.get_message(timeout=10)["type"] == "subscribe"
+
+        logger.info('Testing my redis logger')
+        logger.handlers.clear()
+
+        mess = p.get_message(ignore_subscribe_messages=True, timeout=10)
+        log = msgpack.unpackb(mess["data"])
+        assert log["msg"] == 'Testing my redis logger'
+
+    def test_emit_compression(self, redis_client_no_decode, logger):
+        # Create a RedisPubSubLogHandler instance packing its batches
+        handler = RedisPubSubLogHandler(redis_client=redis_client_no_decode,
+                                        channel_name="test_name", batch_size=10,
+                                        compression="zlib")
+
+        # Add the handler to the logger
+        logger.addHandler(handler)
+
+        p = redis_client_no_decode.pubsub()
+        p.subscribe("test_name")
+        assert p.get_message(timeout=10)["type"] == "subscribe"
+
+        for i in range(10):
+            logger.info('Testing my redis logger %s', i)
+
+        # The batch is published as a single message
+        mess = p.get_message(ignore_subscribe_messages=True, timeout=10)
+        logs = [json.loads(log) for log in unpack_message(mess["data"])]
+        assert [log["msg"] for log in logs] == [f'Testing my redis logger {i}'
+                                                for i in range(10)]
+        assert p.get_message(ignore_subscribe_messages=True, timeout=0.1) is None
+
     def test_emit_bath(self, redis_client, logger):
         # Create a RedisPubSub instance with batch size
         handler = RedisPubSubLogHandler(redis_client=redis_client, channel_name="test_name",
@@ -410,4 +1328,62 @@ class TestRedisPubSubLogHandler:
         mess = p.get_message(ignore_subscribe_messages=True, timeout=10)
         log = json.loads(mess["data"])
         assert log["msg"] == 'Testing my redis logger'
-        assert log["levelname"] == "INFO"
\ No newline at end of file
+        assert log["levelname"] == "INFO"
+
+
+class TestRedisListLogHandler:
+
+    def test_init_default_params(self):
+        handler = RedisListLogHandler()
+        assert handler.list_name == "logs"
+        assert handler.fields == DEFAULT_FIELDS
+        assert handler.maxlen is None
+
+    @pytest.mark.parametrize("batch_size", [1, 10])
+    def test_emit(self, redis_client, logger, batch_size):
+        handler = RedisListLogHandler(redis_client=redis_client, list_name="test_logs",
+                                      batch_size=batch_size)
+        logger.addHandler(handler)
+        for i in range(15):
+            logger.info('Testing my redis logger %s', i)
+        handler.close()
+
+        logs = [json.loads(log) for log in redis_client.lrange("test_logs", 0, -1)]
+        assert [log["msg"] for log in logs] == [f'Testing my redis logger {i}'
+                                                for i in range(15)]
+        assert logs[0]["levelname"] == "INFO"
+
+    def test_emit_single_rpush(self, redis_client, logger):
+        handler = RedisListLogHandler(redis_client=redis_client, list_name="test_logs",
+                                      batch_size=10, maxlen=4)
+        pipe = redis_client.pipeline(transaction=False)
+        handler._pipe_logs(pipe, [b"log 1", b"log 2", b"log 3"])
+
+        # A single variadic RPUSH, followed by the trimming
+        assert [command[0] for command in pipe.command_stack] == [
+            ("RPUSH", "test_logs", b"log 1", b"log 2", b"log 3"),
+            ("LTRIM", "test_logs", -4, -1)]
+
+    def test_emit_maxlen(self, redis_client, logger):
+        handler = RedisListLogHandler(redis_client=redis_client, list_name="test_logs",
+                                      batch_size=5, maxlen=8)
+        logger.addHandler(handler)
+        for i in range(20):
+            logger.info('Testing my redis logger %s', i)
+
+        # The oldest logs are trimmed
+        logs = [json.loads(log) for log in redis_client.lrange("test_logs", 0, -1)]
+        assert [log["msg"] for log in logs] == [f'Testing my redis logger {i}'
+                                                for i in range(12, 20)]
+
+    def test_emit_compression(self, redis_client_no_decode, logger):
+        handler = RedisListLogHandler(redis_client=redis_client_no_decode,
+                                      list_name="test_logs", batch_size=5,
+                                      compression="zlib")
+        logger.addHandler(handler)
+        for i in range(5):
+            logger.info('Testing my redis logger %s', i)
+
+        (data,) = redis_client_no_decode.lrange("test_logs", 0, -1)
+        assert [json.loads(log)["msg"] for log in unpack_message(data)] == [
+            f'Testing my redis logger {i}' for i in range(5)]
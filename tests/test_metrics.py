@@ -0,0 +1,44 @@
+import pytest
+
+from rlh.metrics import HandlerMetrics, LatencyHistogram
+
+
+class TestLatencyHistogram:
+
+    def test_observe(self):
+        histogram = LatencyHistogram(bounds=(0.001, 0.01, 0.1))
+        for value in (0.0005, 0.005, 0.005, 0.05, 1.0):
+            histogram.observe(value)
+
+        assert histogram.counts == [1, 2, 1, 1]
+        assert histogram.count == 5
+        assert histogram.sum == pytest.approx(1.0605)
+        snapshot = histogram.snapshot()
+        assert snapshot["buckets"] == {0.001: 1, 0.01: 3, 0.1: 4, float("inf"): 5}
+
+    @pytest.mark.parametrize("q, expected", [(0.2, 0.001), (0.5, 0.01), (0.8, 0.1),
+                                             (1.0, float("inf"))])
+    def test_quantile(self, q, expected):
+        histogram = LatencyHistogram(bounds=(0.001, 0.01, 0.1))
+        for value in (0.0005, 0.005, 0.005, 0.05, 1.0):
+            histogram.observe(value)
+        assert histogram.quantile(q) == expected
+
+    def test_empty(self):
+        assert LatencyHistogram().quantile(0.5) is None
+
+
+class TestHandlerMetrics:
+
+    def test_record_batch(self):
+        calls = []
+        metrics = HandlerMetrics(hook=lambda *args: calls.append(args))
+        metrics.record_batch(10, 1000, 0.002)
+        metrics.record_batch(5, 500, 0.5, error=True)
+
+        assert metrics.batches == 1
+        assert metrics.logs_sent == 10
+        assert metrics.bytes_sent == 1000
+        assert metrics.errors == 1
+        assert metrics.flush_latency.count == 2
+        assert calls == [(10, 1000, 0.002, False), (5, 500, 0.5, True)]
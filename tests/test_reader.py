@@ -0,0 +1,165 @@
+import logging
+
+import pytest
+
+from rlh import (RedisListLogHandler, RedisListLogReader, RedisStreamLogHandler,
+                 RedisStreamLogReader)
+
+
+class ListHandler(logging.Handler):
+
+    def __init__(self):
+        super().__init__()
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+def write_logs(client, logger, n=5, **handler_args):
+    handler = RedisStreamLogHandler(redis_client=client, stream_name="test_logs",
+                                    **handler_args)
+    logger.addHandler(handler)
+    for i in range(n):
+        logger.warning('Testing my redis logger %s', i)
+    handler.close()
+    logger.removeHandler(handler)
+
+
+class TestRedisStreamLogReader:
+
+    @pytest.mark.parametrize("handler_args", [
+        {},
+        {"fields": ["msg", "levelno", "name", "lineno"]},
+        {"as_json": True},
+        {"serializer": "msgpack"},
+        {"as_pkl": True},
+        {"as_bin": True},
+        {"batch_size": 5, "compression": "zlib"},
+    ])
+    def test_read_formats(self, redis_client_no_decode, logger, handler_args):
+        if handler_args.get("serializer") == "msgpack":
+            pytest.importorskip("msgpack")
+        reader = RedisStreamLogReader(redis_client=redis_client_no_decode,
+                                      stream_name="test_logs", start_id="0", block=None)
+        write_logs(redis_client_no_decode, logger, **handler_args)
+
+        records = reader.read()
+
+        assert [record.getMessage() for record in records] == [
+            f'Testing my redis logger {i}' for i in range(5)]
+        assert all(record.levelno == logging.WARNING for record in records)
+        # The next read only returns new logs
+        assert reader.read() == []
+
+    @pytest.mark.parametrize("shards", [1, 3])
+    def test_read_new_logs(self, redis_client_no_decode, logger, shards):
+        write_logs(redis_client_no_decode, logger, shards=shards)
+        reader = RedisStreamLogReader(redis_client=redis_client_no_decode,
+                                      stream_name="test_logs", block=None, shards=shards)
+        assert reader.read() == []
+
+        # The logs added between two reads are read, the older ones are not
+        write_logs(redis_client_no_decode, logger, n=6, shards=shards, batch_size=6)
+        records = reader.read()
+        assert [record.getMessage() for record in records] == [
+            f'Testing my redis logger {i}' for i in range(6)]
+
+    def test_read_group(self, redis_client_no_decode, logger):
+        reader = RedisStreamLogReader(redis_client=redis_client_no_decode,
+                                      stream_name="test_logs", group="test_group",
+                                      consumer="c1", count=3, block=None)
+        write_logs(redis_client_no_decode, logger)
+
+        assert len(reader.read()) == 3
+        # Nothing is acknowledged before the next read
+        assert redis_client_no_decode.xpending("test_logs", "test_group")["pending"] == 3
+        assert len(reader.read()) == 2
+        assert redis_client_no_decode.xpending("test_logs", "test_group")["pending"] == 2
+        reader.close()
+        assert redis_client_no_decode.xpending("test_logs", "test_group")["pending"] == 0
+
+    def test_claim_stale_entries(self, redis_client_no_decode, logger):
+        crashed = RedisStreamLogReader(redis_client=redis_client_no_decode,
+                                       stream_name="test_logs", group="test_group",
+                                       consumer="crashed", block=None)
+        reader = RedisStreamLogReader(redis_client=redis_client_no_decode,
+                                      stream_name="test_logs", group="test_group",
+                                      consumer="c1", claim_min_idle=0, block=None)
+        write_logs(redis_client_no_decode, logger)
+        # The first consumer reads the logs but never acknowledges them
+        assert len(crashed.read()) == 5
+
+        # The logs are claimed by the other consumer
+        records = reader.read()
+        assert [record.getMessage() for record in records] == [
+            f'Testing my redis logger {i}' for i in range(5)]
+        reader.close()
+        assert redis_client_no_decode.xpending("test_logs", "test_group")["pending"] == 0
+
+    @pytest.mark.parametrize("group", [None, "test_group"])
+    def test_read_shards(self, redis_client_no_decode, logger, group):
+        reader = RedisStreamLogReader(redis_client=redis_client_no_decode,
+                                      stream_name="test_logs", group=group, consumer="c1",
+                                      start_id="0", block=None, shards=3)
+        write_logs(redis_client_no_decode, logger, n=9, shards=3, batch_size=9)
+
+        # The shards are read at once and merged by creation time
+        records = reader.read()
+        assert [record.getMessage() for record in records] == [
+            f'Testing my redis logger {i}' for i in range(9)]
+        assert reader.read() == []
+        reader.close()
+        if group is not None:
+            assert all(
+                redis_client_no_decode.xpending(f"test_logs:{i}", group)["pending"] == 0
+                for i in range(3))
+
+    def test_handle(self, redis_client_no_decode, logger):
+        reader = RedisStreamLogReader(redis_client=redis_client_no_decode,
+                                      stream_name="test_logs", start_id="0", block=None)
+        write_logs(redis_client_no_decode, logger, fields=["msg", "levelname", "name"])
+
+        target = logging.getLogger("test_rlh_target")
+        target.propagate = False
+        list_handler = ListHandler()
+        target.addHandler(list_handler)
+
+        # Stopping the reader once a batch has been handled
+        list_handler.emit = lambda record: (ListHandler.emit(list_handler, record),
+                                            reader.stop())
+        reader.handle(target)
+
+        assert [record.getMessage() for record in list_handler.records] == [
+            f'Testing my redis logger {i}' for i in range(5)]
+        assert list_handler.records[0].name == "test_rlh"
+
+
+class TestRedisListLogReader:
+
+    @pytest.mark.parametrize("handler_args", [
+        {},
+        {"fields": ["msg", "levelno", "name", "lineno"]},
+        {"as_pkl": True},
+        {"as_bin": True},
+        {"batch_size": 5, "compression": "zlib"},
+    ])
+    @pytest.mark.parametrize("block", [None, 100])
+    def test_read_formats(self, redis_client_no_decode, logger, handler_args, block):
+        handler = RedisListLogHandler(redis_client=redis_client_no_decode,
+                                      list_name="test_logs", **handler_args)
+        logger.addHandler(handler)
+        for i in range(5):
+            logger.warning('Testing my redis logger %s', i)
+        handler.close()
+        reader = RedisListLogReader(redis_client=redis_client_no_decode,
+                                    list_name="test_logs", count=3, block=block)
+
+        records = reader.read() + reader.read()
+
+        assert [record.getMessage() for record in records] == [
+            f'Testing my redis logger {i}' for i in range(5)]
+        assert all(record.levelno == logging.WARNING for record in records)
+        # The logs were popped
+        assert reader.read() == []
+        assert redis_client_no_decode.llen("test_logs") == 0
@@ -0,0 +1,60 @@
+import logging
+import sys
+
+import pytest
+
+from rlh.records import HEADER, decode_record, encode_record
+
+
+def make_record(**kwargs):
+    attrs = dict(name="test_rlh", level=logging.WARNING, pathname="/app/module.py",
+                 lineno=42, msg="Testing my redis logger %s", args=("é",), exc_info=None,
+                 func="function", sinfo=None)
+    attrs.update(kwargs)
+    return logging.LogRecord(**attrs)
+
+
+class TestRecordFormat:
+
+    def test_round_trip(self):
+        record = make_record()
+        decoded = decode_record(encode_record(record))
+
+        assert decoded.getMessage() == "Testing my redis logger é"
+        assert decoded.args is None
+        for attr in ("name", "levelno", "levelname", "pathname", "filename", "module",
+                     "funcName", "lineno", "created", "msecs", "relativeCreated",
+                     "thread", "threadName", "process", "processName", "stack_info"):
+            assert getattr(decoded, attr) == getattr(record, attr)
+
+    def test_exception(self):
+        try:
+            raise ValueError("error")
+        except ValueError:
+            record = make_record(exc_info=sys.exc_info(), sinfo="Stack (most recent call last)")
+
+        decoded = decode_record(encode_record(record))
+
+        # The exception is stored as the text of its traceback
+        assert decoded.exc_info is None
+        assert decoded.exc_text.endswith("ValueError: error")
+        assert decoded.stack_info == "Stack (most recent call last)"
+        # It is rendered by formatters as the original exception would be
+        assert logging.Formatter().format(decoded).endswith("ValueError: error\n"
+                                                            "Stack (most recent call last)")
+
+    def test_non_str_message(self):
+        record = make_record(msg=ValueError("error"), args=None)
+        assert decode_record(encode_record(record)).msg == "error"
+
+    def test_smaller_than_header_plus_strings(self):
+        record = make_record()
+        size = HEADER.size + sum(len(str(getattr(record, attr)).encode()) for attr in (
+            "name", "levelname", "pathname", "filename", "module", "funcName",
+            "threadName", "processName")) + len("Testing my redis logger é".encode())
+        assert len(encode_record(record)) == size
+
+    @pytest.mark.parametrize("data", [b"", b"invalid data", b"RL\x02" + bytes(HEADER.size)])
+    def test_invalid(self, data):
+        with pytest.raises(ValueError):
+            decode_record(data)
@@ -0,0 +1,53 @@
+import threading
+
+from rlh.ring import RingBuffer
+
+
+class TestRingBuffer:
+
+    def test_put_peek_release(self):
+        ring = RingBuffer(slots=4, slot_size=8)
+        for data in (b"log 1", b"log 2", b"a log larger than a slot"):
+            assert ring.put(data)
+        assert len(ring) == 3
+
+        logs = ring.peek(10)
+        assert [bytes(log) for log in logs] == [b"log 1", b"log 2",
+                                                b"a log larger than a slot"]
+        # The logs stay in the ring until they are released
+        assert len(ring) == 3
+        ring.release(2)
+        assert len(ring) == 1
+        assert [bytes(log) for log in ring.peek(10)] == [b"a log larger than a slot"]
+
+    def test_full(self):
+        ring = RingBuffer(slots=2, slot_size=8)
+        assert ring.put(b"log 1")
+        assert ring.put(b"log 2")
+        assert not ring.put(b"log 3", block=False)
+        assert ring.dropped == 1
+
+        # A blocked producer resumes once a slot is released
+        producer = threading.Thread(target=ring.put, args=(b"log 4",))
+        producer.start()
+        ring.release(1)
+        producer.join(5)
+        assert not producer.is_alive()
+        assert [bytes(log) for log in ring.peek(10)] == [b"log 2", b"log 4"]
+
+    def test_wraparound(self):
+        ring = RingBuffer(slots=3, slot_size=8)
+        for i in range(10):
+            ring.put(f"log {i}".encode())
+            assert [bytes(log) for log in ring.peek(1)] == [f"log {i}".encode()]
+            ring.release(1)
+        assert len(ring) == 0
+
+    def test_wait(self):
+        ring = RingBuffer(slots=8, slot_size=8)
+        threading.Timer(0.05, ring.put, args=(b"log",)).start()
+        ring.wait(1, timeout=5)
+        assert len(ring) == 1
+        ring.close()
+        # A closed ring never blocks the writer
+        ring.wait(10, timeout=None)
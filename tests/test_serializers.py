@@ -0,0 +1,45 @@
+import json
+
+import pytest
+
+from rlh.serializers import Serializer, SERIALIZERS, get_serializer, get_loads
+
+
+class TestGetSerializer:
+
+    def test_default(self):
+        # The default serializer is the stdlib JSON one
+        serializer = get_serializer()
+        assert serializer is SERIALIZERS["json"]
+        assert serializer.dumps({"msg": "log"}) == b'{"msg": "log"}'
+
+    @pytest.mark.parametrize("name", ["json", "orjson", "msgpack"])
+    def test_builtin(self, name):
+        if name != "json":
+            pytest.importorskip(name)
+        serializer = get_serializer(name)
+        fields = {"msg": "log", "levelno": 20, "created": 1.5, "args": (1, "a")}
+        # The serializers return bytes
+        data = serializer.dumps(fields)
+        assert isinstance(data, bytes)
+        assert serializer.loads(data) == {**fields, "args": [1, "a"]}
+        assert get_loads(serializer.content_type) is not None
+
+    def test_not_serializable(self):
+        # Objects that are not serializable are converted to string
+        assert json.loads(get_serializer().dumps({"msg": ValueError("error")})) == {
+            "msg": "error"}
+
+    def test_callable(self):
+        serializer = get_serializer(lambda fields: repr(fields).encode())
+        assert serializer.key == "data"
+        assert serializer.content_type == "application/octet-stream"
+        assert serializer.dumps({"msg": "log"}) == b"{'msg': 'log'}"
+
+    def test_instance(self):
+        serializer = Serializer("csv", "text/csv", lambda fields: b"")
+        assert get_serializer(serializer) is serializer
+
+    def test_unknown(self):
+        with pytest.raises(ValueError):
+            get_serializer("unknown")
@@ -0,0 +1,114 @@
+import os
+import time
+
+import pytest
+
+from rlh.spill import CircuitBreaker, SpillBuffer
+
+
+class TestSpillBuffer:
+
+    def test_replay_in_order(self, tmp_path):
+        spill = SpillBuffer(str(tmp_path), segment_bytes=100)
+        for i in range(10):
+            assert spill.append([{"msg": f"Testing my redis logger {i}"}])
+        assert spill.pending
+        # Small segments are rotated
+        assert len(os.listdir(tmp_path)) > 1
+
+        batches = []
+        logs = spill.peek()
+        while logs is not None:
+            # The batch is returned until it is committed
+            assert spill.peek() == logs
+            spill.commit()
+            batches.append(logs)
+            logs = spill.peek()
+
+        assert batches == [[{"msg": f"Testing my redis logger {i}"}] for i in range(10)]
+        assert not spill.pending
+        spill.close()
+        assert os.listdir(tmp_path) == []
+
+    def test_max_bytes(self, tmp_path):
+        spill = SpillBuffer(str(tmp_path), max_bytes=200)
+        appended = [spill.append([{"msg": "Testing my redis logger"}] * 2) for _ in range(10)]
+
+        assert not all(appended)
+        assert spill.dropped == 2 * appended.count(False)
+        assert spill.pending_bytes <= 200
+
+    def test_replay_previous_process(self, tmp_path):
+        spill = SpillBuffer(str(tmp_path))
+        spill.append(["log 1"])
+        spill.close()
+        # A truncated frame left by a crash is ignored
+        with open(tmp_path / os.listdir(tmp_path)[0], "ab") as segment:
+            segment.write(b"\x10\x00")
+
+        spill = SpillBuffer(str(tmp_path))
+        spill.append(["log 2"])
+        assert spill.peek() == ["log 1"]
+        spill.commit()
+        assert spill.peek() == ["log 2"]
+        spill.commit()
+        assert spill.peek() is None
+        assert not spill.pending
+
+    @pytest.mark.skipif(not hasattr(os, "fork"), reason="requires os.fork")
+    def test_adopt_exited_process(self, tmp_path):
+        spill = SpillBuffer(str(tmp_path))
+        spill.append(["parent log"])
+        pid = os.fork()
+        if pid == 0:
+            try:
+                child = SpillBuffer(str(tmp_path))
+                # The segments of the parent, still running, are left to it
+                ok = child.adopt() == 0 and not child.pending and child.append(["child log"])
+            finally:
+                os._exit(0 if ok else 1)
+        _, status = os.waitpid(pid, 0)
+        assert os.waitstatus_to_exitcode(status) == 0
+
+        # The child wrote its own segment in the shared directory
+        assert len(os.listdir(tmp_path)) == 2
+        assert spill.adopt() == 1
+        # Adopted segments are renamed, they are not adopted twice
+        assert spill.adopt() == 0
+
+        batches = []
+        logs = spill.peek()
+        while logs is not None:
+            spill.commit()
+            batches.append(logs)
+            logs = spill.peek()
+        assert batches == [["parent log"], ["child log"]]
+        assert not spill.pending
+        spill.close()
+        assert os.listdir(tmp_path) == []
+
+
+class TestCircuitBreaker:
+
+    def test_backoff(self):
+        breaker = CircuitBreaker(failure_threshold=2, min_backoff=0.01, max_backoff=0.02)
+        breaker.failure()
+        assert breaker.closed
+        breaker.failure()
+        assert breaker.state == "open"
+        assert not breaker.allow()
+        assert 0 < breaker.delay() <= 0.01
+
+        time.sleep(0.01)
+        assert breaker.allow()
+        assert breaker.state == "half_open"
+        # A failed attempt opens the breaker again, for longer
+        breaker.failure()
+        assert breaker.state == "open"
+        assert 0.01 < breaker.delay() <= 0.02
+
+        time.sleep(0.02)
+        assert breaker.allow()
+        breaker.success()
+        assert breaker.closed
+        assert breaker.failures == 0